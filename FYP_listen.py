@@ -0,0 +1,41 @@
+import argparse
+import time
+from fyp.publisher import Subscriber, STATUS_NAMES, STATUS_VALID, MCAST_ADDRESS, TCP_ADDRESS
+
+# Print the positions published by FYP_xy.py or FYP_multi.py
+# e.g. python FYP_listen.py --tcp 127.0.0.1:5070
+parser = argparse.ArgumentParser(description="Subscribe to published positions and print them")
+group = parser.add_mutually_exclusive_group(required=True)
+group.add_argument("--multicast", nargs="?", const=MCAST_ADDRESS, metavar="GROUP:PORT", help="join a multicast group (default: " + MCAST_ADDRESS + ")")
+group.add_argument("--tcp", nargs="?", const=TCP_ADDRESS, metavar="HOST:PORT", help="connect over TCP (default: " + TCP_ADDRESS + ")")
+group.add_argument("--unix", metavar="PATH", help="connect to a Unix socket")
+parser.add_argument("--count", type=int, help="exit after this many positions")
+args = parser.parse_args()
+
+subscriber = Subscriber(args.multicast, args.tcp, args.unix)
+
+# Variable initialisation
+received = 0
+lost = 0
+last = {}	# Last sequence number seen
+
+while (args.count is None) or (received < args.count):
+	position = subscriber.recv()
+	if(position is None):
+		print "Publisher closed the connection"
+		break
+	received += 1
+
+	# Sequence numbers are shared by every channel, so a gap means records were dropped
+	if(last and position["sequence"] != last["sequence"] + 1):
+		lost += (position["sequence"] - last["sequence"] - 1) & 0xFFFFFFFF
+	last = position
+
+	latency = (time.time() - position["stamp"]) * 1000
+	if(position["status"] == STATUS_VALID):
+		print position["channel"], "[", position["x"], ", ", position["y"], "]", position["x0"], format(latency, '.2f'), "ms"
+	else:
+		print position["channel"], STATUS_NAMES[position["status"]], format(latency, '.2f'), "ms"
+
+subscriber.close()
+print received, "positions,", lost, "lost"
@@ -0,0 +1,5 @@
+# Track several receivers at once, one per ADC channel
+from fyp.multi import main
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,100 @@
+import argparse
+import time
+import numpy as np
+from fyp.decoder import stream_frames, add_led_args, make_decoder, StreamDecoder
+from fyp.averaging import ChannelEstimator
+from fyp.calibration import evaluate_position, load_calibration
+from fyp.fingerprint import load_fingerprints, FingerprintMap
+from fyp.lambertian import load_model, lambertian_order
+from fyp.display import intensity_text
+from fyp.recording import open_recording, replay_windows
+from fyp.xy import THRESH, OUTLIER_THRESH, AVERAGING_PERIOD # As used for the live run
+
+# Parse the command line
+parser = argparse.ArgumentParser(description="Run a recording made with FYP_xy.py --record through the tracking pipeline")
+parser.add_argument("recording", help="recording file to replay")
+parser.add_argument("--model-file", "--cal-file", dest="model_file", help="calibration, fingerprints or path-loss model to convert intensities to positions, for the model the recording was made with (default: the file the live run used)")
+add_led_args(parser)
+parser.add_argument("--fixed", action="store_true", help="decode with the fixed THRESH and windows of the recorded window size, as FYP_xy.py --fixed does, instead of the decoder and windows of the recording")
+parser.add_argument("--quiet", action="store_true", help="only print the summary")
+args = parser.parse_args()
+
+header, records = open_recording(args.recording)
+settings = header["settings"]
+if(settings["decoder"]["slots"] != args.leds + 1):
+	leds = str(settings["decoder"]["slots"] - 1)
+	parser.error(args.recording + " was recorded with " + leds + " LEDs; use --leds " + leds)
+if(settings["track"]):
+	parser.error(args.recording + " was recorded with --track, whose filter runs on the live clock, so its positions cannot be replayed")
+
+# Load the position model the live run used, from the same file unless told otherwise
+model = settings["model"]
+path = args.model_file or settings["model_file"]
+locate = None
+if(model == "poly"):
+	calibration = load_calibration(path, THRESH, leds=args.leds)
+	if(calibration is not None):
+		locate = lambda x0: evaluate_position(calibration["cal_out_0"], calibration["cal_out_1"], x0)
+elif(model == "lambertian"):
+	stored = load_model(path, THRESH, args.leds, settings["height"], lambertian_order(settings["half_angle"]))
+	if(stored is not None):
+		locate = stored[1].position
+elif(model == "fingerprint"):
+	stored = load_fingerprints(path, THRESH, args.leds)
+	if(stored is not None):
+		timestamp, intensities, x, y = stored
+		locate = FingerprintMap(intensities, x, y, backend=settings["index"]).position
+else:
+	parser.error(args.recording + " was recorded with an unknown model: " + str(model))
+if(locate is None):
+	print "No valid", model, "model in", path, "- printing intensities only"
+
+# Variable initialisation
+x0 = np.zeros([args.leds], dtype=int)
+decoded = 0
+invalid = 0
+unsteady = 0
+fixes = 0
+
+# Replay the windows as fast as the decoder takes them, through the decoder the live run used
+if(args.fixed):
+	frames = stream_frames(replay_windows(args.recording, header["window"]), THRESH, header["window"], decoder=StreamDecoder(args.leds + 1, THRESH))
+else:
+	decoder = settings["decoder"]
+	if(not args.quiet): print "Decoder", ", ".join(key + " " + str(decoder[key]) for key in sorted(decoder)) + "; model", model, "from", path
+	frames = stream_frames(replay_windows(args.recording), THRESH, header["window"], decoder=make_decoder(decoder))
+estimator = ChannelEstimator(args.leds, AVERAGING_PERIOD, OUTLIER_THRESH)
+start = time.time()
+for frame in frames:
+	if(frame is None):
+		invalid += 1
+		if(not args.quiet): print "Invalid lighting conditions!"
+		estimator.reset()
+		continue
+
+	decoded += 1
+	x0[:] = estimator.update(frame[1:])
+	if(not estimator.ready()):
+		continue
+
+	if(np.amin(x0) > 0):
+		fixes += 1
+		if(args.quiet):
+			continue
+		if(locate is not None):
+			x, y = locate(x0)
+			print "[", x, ", ", y, "]", intensity_text(x0)
+		else:
+			print intensity_text(x0)
+	else:
+		unsteady += 1
+		if(not args.quiet): print "Unsteady! Please stabilise."
+elapsed = time.time() - start
+
+# Summary of the replay against the time it took to record
+recorded = 0.0
+if(len(records) > 1):
+	recorded = records["stamp"][-1] - records["stamp"][0]
+print len(records), "samples,", decoded, "frames,", fixes, "fixes,", invalid, "invalid,", unsteady, "unsteady"
+if(elapsed > 0):
+	print "Replayed in", format(elapsed, '.3f'), "s,", int(decoded / elapsed), "frames/sec,", format(recorded / elapsed, '.1f'), "x real time"
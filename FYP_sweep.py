@@ -0,0 +1,55 @@
+import argparse
+import csv
+import time
+from fyp.decoder import add_led_args
+from fyp.sweep import load_manifest, param_grid, run_sweep, SWEEP_PARAMS
+from fyp.xy import THRESH, OUTLIER_THRESH, AVERAGING_PERIOD, COUNT_MAX # As used for the live run
+
+# Results shown and saved, after the parameters
+COLUMNS = ("fixes", "attempts", "fix_rate", "fix_time", "first_fix", "median_error", "p95_error")
+
+# Tune the pipeline on recordings made at known positions, trying every
+# combination of the values given, in parallel
+# e.g. python FYP_sweep.py sweep.json --thresh 25 50 100 --period 5 10 20
+parser = argparse.ArgumentParser(description="Sweep the decoder and averaging settings over recordings with known positions")
+parser.add_argument("manifest", help="JSON file listing the calibration recordings and the traces with their positions")
+parser.add_argument("--thresh", type=int, nargs="+", default=[THRESH], help="fixed transition thresholds to try (default: %(default)s)")
+parser.add_argument("--outlier", type=int, nargs="+", default=[OUTLIER_THRESH], help="outlier thresholds to try (default: %(default)s)")
+parser.add_argument("--period", type=int, nargs="+", default=[AVERAGING_PERIOD], help="averaging periods to try (default: %(default)s)")
+parser.add_argument("--window", type=int, nargs="+", default=[COUNT_MAX], help="capture windows to try (default: %(default)s)")
+add_led_args(parser)
+parser.add_argument("--jobs", type=int, help="worker processes (default: one per CPU)")
+parser.add_argument("--top", type=int, help="only print the best TOP settings")
+parser.add_argument("--csv", metavar="FILE", help="also write every result to FILE")
+args = parser.parse_args()
+
+calibration, traces = load_manifest(args.manifest)
+grid = param_grid(args.thresh, args.outlier, args.period, args.window)
+print "Trying", len(grid), "settings on", len(traces), "traces, calibrated from", len(calibration), "recordings"
+
+# Run the grid, reporting progress as results come back from the workers
+start = time.time()
+results = []
+for result in run_sweep(grid, calibration, traces, args.leds, args.jobs):
+	results.append(result)
+	if(not result["calibrated"]):
+		print "Could not calibrate with", ", ".join(p + " " + str(result[p]) for p in SWEEP_PARAMS)
+print "Swept in", format(time.time() - start, '.1f'), "s"
+
+# Best position error first, settings that never gave a fix last
+results.sort(key=lambda r: (r["fixes"] == 0, r["median_error"], -r["fix_rate"]))
+shown = results if args.top is None else results[:args.top]
+print
+print "thresh\toutlier\tperiod\twindow\tvalid\tfix/s\tus/fix\tfirst ms\terror\tp95"
+for r in shown:
+	valid = float(r["fixes"]) / r["attempts"] if r["attempts"] else 0.0
+	print "\t".join([str(r[p]) for p in SWEEP_PARAMS] + [format(valid, '.2f'), format(r["fix_rate"], '.1f'),
+		format(r["fix_time"] * 1e6, '.0f'), format(r["first_fix"] * 1e3, '.0f'), format(r["median_error"], '.3f'), format(r["p95_error"], '.3f')])
+
+if(args.csv is not None):
+	with open(args.csv, "wb") as f:
+		writer = csv.writer(f)
+		writer.writerow(SWEEP_PARAMS + COLUMNS)
+		for r in results:
+			writer.writerow([r[c] for c in SWEEP_PARAMS + COLUMNS])
+	print "Wrote", len(results), "results to", args.csv
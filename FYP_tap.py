@@ -0,0 +1,68 @@
+import argparse
+import time
+from fyp.samplebus import BusReader, BUS_FILE
+from fyp.decoder import StreamDecoder, add_led_args
+from fyp.xy import THRESH # As used for the live run
+
+# Constants
+REPORT_PERIOD = 1	# Seconds between rate reports
+
+# Read the samples FYP_xy.py --bus or FYP_multi.py --bus publishes, from another process
+# e.g. python FYP_tap.py --decode 0
+parser = argparse.ArgumentParser(description="Attach to the shared memory sample bus and report what arrives")
+parser.add_argument("path", nargs="?", default=BUS_FILE, help="sample bus file (default: %(default)s)")
+parser.add_argument("--decode", type=int, metavar="ROW", help="also decode the frames of this row of each window (0 unless scanning several channels)")
+add_led_args(parser)
+parser.add_argument("--count", type=int, help="exit after this many windows")
+args = parser.parse_args()
+
+reader = BusReader(args.path)
+print "Attached to", args.path + ":", reader.channels, "channels,", reader.capacity, "samples per window,", reader.slots, "slots"
+
+# Variable initialisation
+windows = 0
+samples = 0
+frames = 0
+decoder = None
+last = None	# Sequence number of the last window decoded
+if(args.decode is not None):
+	decoder = StreamDecoder(args.leds + 1, THRESH, adaptive=True)
+report_time = time.time()
+report_samples = 0
+
+for window in reader.windows(timeout=REPORT_PERIOD):
+	if(window is None):
+		print "No windows for", REPORT_PERIOD, "s"
+		continue
+	seq, values, stamps = window # Views into the bus, only valid until the writer laps them
+	windows += 1
+	samples += values.shape[1]
+
+	# A second decoder, independent of the one in the sampling process
+	# The row is copied before it is checked, so a window the writer laps
+	# while it is copied is dropped rather than decoded. After a missed or
+	# dropped window the decoder starts again, instead of joining samples
+	# that do not follow on from each other into a frame.
+	if(decoder is not None):
+		row = values[args.decode].copy()
+		if(not reader.valid(seq)):
+			decoder.restart()
+			last = None
+		else:
+			if((last is not None) and (seq != last + 1)):
+				decoder.restart()
+			last = seq
+			for means in decoder.feed(row):
+				frames += 1
+				print seq, "Zero lvl:", means[0], "intensities:", means[1:] - means[0]
+
+	now = time.time()
+	if(now - report_time >= REPORT_PERIOD):
+		print int((samples - report_samples) / (now - report_time)), "samples/sec, lag", reader.lag(), "windows,", reader.missed, "missed,", reader.torn, "overwritten while in use"
+		report_time = now
+		report_samples = samples
+	if((args.count is not None) and (windows >= args.count)):
+		break
+
+reader.close()
+print windows, "windows,", samples, "samples,", frames, "frames,", reader.missed, "missed,", reader.torn, "overwritten while in use"
@@ -0,0 +1,80 @@
+import sys
+import threading
+import numpy as np
+from fyp.adc import open_adc, benchmark, benchmark_block, benchmark_scan, ADC_BACKENDS, SCAN_ORDERS
+from fyp.realtime import RealTime, JitterMeter
+from fyp.stats import monotonic
+
+# Benchmark constants
+SAMPLES = 10000
+COUNT_MAX = 200
+WINDOWS = 50
+SCAN_CHANNELS = (1, 2, 4, 8)	# Receivers per board to try
+GARBAGE = 1000		# Reference cycles made per pass of the load loop
+
+# Per-sample timing jitter of a sampling thread while the main thread
+# stands in for the decoder by making cyclic garbage
+# With realtime, the sampler is pinned and prioritised and GC is deferred
+def bench_jitter(adc, realtime=None):
+	meter = JitterMeter()
+	out = np.zeros([COUNT_MAX], dtype=np.uint16)
+	stamps = np.zeros([COUNT_MAX])
+
+	def sample():
+		if(realtime is not None):
+			realtime.enter()
+		read = adc.read
+		for w in range(WINDOWS):
+			for i in range(COUNT_MAX):
+				stamps[i] = monotonic()
+				out[i] = read(0)
+			meter.add(stamps)
+
+	if(realtime is not None):
+		realtime.reserve()
+	sampler = threading.Thread(target=sample)
+	sampler.start()
+	while sampler.is_alive():
+		for i in range(GARBAGE):
+			cycle = []
+			cycle.append(cycle)
+	sampler.join()
+	if(realtime is not None):
+		realtime.release()
+	return meter
+
+# Compare the samples/sec of each ADC backend available on this machine
+# Usage: python bench_adc.py [backend ...]
+backends = sys.argv[1:] or ADC_BACKENDS
+trace = np.random.randint(0, 1024, size=1000)
+
+for backend in backends:
+	if(backend == "fake"):
+		kwargs = {"traces": dict((adcnum, trace) for adcnum in range(8))}
+	else:
+		kwargs = {}
+
+	try:
+		adc = open_adc(backend, **kwargs)
+	except (ImportError, IOError, OSError) as e:
+		print backend, "\tunavailable (" + str(e) + ")"
+		continue
+
+	rate = benchmark(adc, 0, SAMPLES)
+	block_rate, window_time, window_spread = benchmark_block(adc, 0, COUNT_MAX, WINDOWS)
+	print backend, "\t", type(adc).__name__, "\t", int(rate), "samples/sec"
+	print "\tread_block:", int(block_rate), "samples/sec, window", format(window_time * 1000, '.3f'), "ms, spread", format(window_spread * 1000, '.3f'), "ms"
+
+	# Aggregate and per-channel rates when scanning several receivers
+	for order in SCAN_ORDERS:
+		for nchannels in SCAN_CHANNELS:
+			total, per_channel = benchmark_scan(adc, range(nchannels), COUNT_MAX, WINDOWS, order)
+			print "\tscan", order, nchannels, "channels:", int(total), "samples/sec,", int(per_channel), "per channel"
+
+	# Sampling jitter under load, with and without the real-time mode
+	print "\tjitter:", bench_jitter(adc).describe()
+	realtime = RealTime()
+	meter = bench_jitter(adc, realtime)
+	print "\tjitter, real-time:", meter.describe()
+	print "\t" + realtime.describe()
+	adc.close()
@@ -0,0 +1,249 @@
+import argparse
+import time
+import numpy as np
+from fyp.decoder import decode_window, decode_frame, StreamDecoder, MatchedDecoder, THRESH
+from fyp.acquisition import WINDOW_MARGIN, MIN_WINDOW
+from fyp.siggen import generate, frame_length, frame_bounds, INTENSITIES, AMBIENT
+from fyp.lambertian import model_intensities, fit_leds, lambertian_order, LambertianModel, HEIGHT
+from fyp.calibration import X_CAL, Y_CAL, X_MIN, X_MAX, Y_MIN, Y_MAX
+
+# Benchmark constants
+COUNT_MAX = 200
+LAYOUTS = ((16, 4), (12, 3))	# (sections, slots) of FYP_xy.py and FYP_ave.py/FYP_rec.py
+NOISE_LEVELS = (0, 5, 10, 20, 40)
+MATCHED_NOISE = (0, 10, 20, 40, 60, 80)	# Noise levels the matched filter is compared at
+THRESHOLDS = (25, 50, 100)
+WINDOW_SIZES = (100, 150, 200, 300)
+GOOD_ERROR = 20	# A frame is correct if every intensity is within this of the truth
+LIGHT_SCALES = (0.1, 0.2, 0.5, 1.0, 1.3)	# Room brightness relative to siggen's defaults
+LED_LAYOUT = ((0, 0), (8, 0), (4, 8), (8, 8), (0, 8), (4, 4))	# LEDs taken in turn for the solver benchmark
+SOLVER_LEDS = (3, 4, 6)
+PEAK_INTENSITY = 400	# Intensity right under an LED
+SOLVER_NOISE = 3.0	# Standard deviation of each averaged intensity
+
+# The pure Python segmentation and slot averaging loop the scripts used
+def decode_window_loop(values, nsections, nslots, thresh):
+	sections = np.zeros([nsections], dtype=int)
+	broken_out = 0
+	count = 0
+	for i in range(len(values)-1):
+		if(abs(int(values[i+1])-int(values[i])) > thresh):
+			sections[count] = i+1
+			count += 1
+		if(count > nsections-1):
+			broken_out = 1
+			break
+	if(not broken_out):
+		return None
+
+	max_diff = 0
+	start_section = 0
+	for i in range(nsections // 2):
+		if(sections[i+1]-sections[i] > max_diff):
+			max_diff = sections[i+1]-sections[i]
+			start_section = i+1
+
+	means = np.zeros([nslots], dtype=int)
+	for i in range(nslots):
+		diff = sections[start_section+1+2*i]-sections[start_section+2*i]
+		sum = 0
+		for j in range(diff):
+			sum += int(values[sections[start_section+2*i]+j])
+		means[i] = sum // diff
+	return means
+
+# Build windows of synthetic frames at random phases, optionally with random
+# intensities and slot lengths. conditions are passed on to generate()
+# Returns the windows and the LED intensities each was generated with
+def make_windows(count, size, nslots=4, noise=0.0, randomise=True, **conditions):
+	windows = np.zeros([count, size], dtype=np.uint16)
+	truth = np.zeros([count, 3], dtype=int)
+	for w in range(count):
+		if(randomise):
+			intensities = tuple(np.random.randint(60, 400, size=3))
+			lengths = {"slot_len": np.random.randint(5, 15), "gap_len": np.random.randint(3, 8), "sync_len": np.random.randint(20, 40)}
+		else:
+			intensities = INTENSITIES
+			lengths = {}
+		windows[w] = generate(size, intensities, zero_slot=(nslots == 4), noise=noise,
+			phase=np.random.randint(1000), **dict(lengths, **conditions))
+		truth[w] = intensities
+	return windows, truth
+
+# Time a decoder over every window
+def time_decoder(decode, windows, *args):
+	start = time.time()
+	results = [decode(w, *args) for w in windows]
+	return time.time() - start, results
+
+# Check the vectorised decoder against the old loop and compare their speed
+def bench_loop(count):
+	print "Loop vs vectorised decoder,", count, "windows"
+	for nsections, nslots in LAYOUTS:
+		windows, truth = make_windows(count, COUNT_MAX, nslots, noise=8.0)
+		loop_time, loop_results = time_decoder(decode_window_loop, windows, nsections, nslots, THRESH)
+		vec_time, vec_results = time_decoder(decode_window, windows, nsections, nslots, THRESH)
+
+		mismatches = 0
+		for a, b in zip(loop_results, vec_results):
+			if((a is None) != (b is None)) or ((a is not None) and np.any(a != b)):
+				mismatches += 1
+
+		print "\t", nsections, "sections,", nslots, "slots:",
+		print int(count / loop_time), "vs", int(count / vec_time), "windows/sec,",
+		print format(loop_time / vec_time, '.1f') + "x,", mismatches, "mismatched windows"
+
+# Fraction of decoded frames that are correct, and the median intensity error
+# measured is (frames x 3), truth is (frames x 3) or a single row
+def score(measured, truth):
+	if(len(measured) == 0):
+		return 0, "-"
+	errors = np.abs(np.asarray(measured) - truth)
+	correct = np.sum(np.amax(errors, axis=1) <= GOOD_ERROR)
+	return correct, format(np.median(errors), '.1f')
+
+# Throughput, valid-frame rate and intensity error of the window decoder
+# against window size, threshold and noise
+def bench_window(count, conditions):
+	print
+	print "Window decoder,", count, "windows per row"
+	print "\tnoise\tthresh\twindow\twin/sec\tdecoded\tcorrect\terror"
+	for noise in NOISE_LEVELS:
+		for thresh in THRESHOLDS:
+			for size in WINDOW_SIZES:
+				windows, truth = make_windows(count, size, noise=noise, randomise=False, **conditions)
+				elapsed, results = time_decoder(decode_frame, windows, 16, thresh)
+				valid = [i for i, r in enumerate(results) if r is not None]
+				correct, error = score([results[i][1] for i in valid], truth[valid])
+				print "\t", noise, "\t", thresh, "\t", size, "\t", int(count / elapsed), "\t",
+				print format(float(len(valid)) / count, '.2f'), "\t", format(float(correct) / count, '.2f'), "\t", error
+
+# Throughput, frame yield and intensity error of the streaming decoder
+# Yield is the fraction of transmitted frames that were decoded correctly
+def bench_stream(frames, conditions):
+	print
+	print "Stream decoder,", frames, "frames per row"
+	print "\tnoise\tthresh\tframe/s\tdecoded\tyield\terror"
+	n = frames * frame_length()
+	for noise in NOISE_LEVELS:
+		samples = generate(n, noise=noise, **conditions)
+		for thresh in THRESHOLDS:
+			decoder = StreamDecoder(4, thresh)
+			decoded = []
+			start = time.time()
+			for i in range(0, n, COUNT_MAX):
+				decoded.extend(decoder.feed(samples[i:i+COUNT_MAX]))
+			elapsed = time.time() - start
+			means = np.array(decoded).reshape(-1, 4)
+			correct, error = score(means[:, 1:] - means[:, :1], INTENSITIES)
+			print "\t", noise, "\t", thresh, "\t", int(len(decoded) / elapsed), "\t",
+			print format(float(len(decoded)) / frames, '.2f'), "\t", format(float(correct) / frames, '.2f'), "\t", error
+
+# Frame yield of the fixed THRESH against the adaptive threshold in dim and
+# bright rooms, and the capture window fitted to the measured frame period
+def bench_adaptive(frames, conditions):
+	print
+	print "Fixed vs adaptive threshold,", frames, "frames per row, window", COUNT_MAX, "when fixed"
+	print "\tlight\tnoise\tfixed\tadapt\tthresh\tperiod\twindow"
+	n = frames * frame_length()
+	for scale in LIGHT_SCALES:
+		intensities = tuple(int(i * scale) for i in INTENSITIES)
+		for noise in NOISE_LEVELS[:3]:
+			samples = generate(n, intensities, int(AMBIENT * scale), noise=noise, **conditions)
+			yields = []
+			for adaptive in (False, True):
+				decoder = StreamDecoder(4, THRESH, adaptive)
+				decoded = []
+				for i in range(0, n, COUNT_MAX):
+					decoded.extend(decoder.feed(samples[i:i+COUNT_MAX]))
+				means = np.array(decoded).reshape(-1, 4)
+				correct, error = score(means[:, 1:] - means[:, :1], intensities)
+				yields.append(format(float(correct) / frames, '.2f'))
+			period = decoder.frame_period()
+			window = "-"
+			if(period is not None):
+				window = max(MIN_WINDOW, int(period * WINDOW_MARGIN) + 1)
+			print "\t", scale, "\t", noise, "\t", yields[0], "\t", yields[1], "\t", int(decoder.thresh), "\t", period, "\t", window
+
+# Decode a whole signal in COUNT_MAX chunks
+# Returns the slot means of every frame and the time taken
+def feed_all(decoder, samples, nslots=4):
+	decoded = []
+	start = time.time()
+	for i in range(0, len(samples), COUNT_MAX):
+		decoded.extend(decoder.feed(samples[i:i+COUNT_MAX]))
+	return np.array(decoded).reshape(-1, nslots), time.time() - start
+
+# Frame yield and throughput of the edge decoder, with its adaptive
+# threshold, against the matched filter as the noise grows
+# The matched filter is given the layout siggen transmits, as it would
+# otherwise learn it from the edge decoder at low noise
+def bench_matched(frames, conditions):
+	print
+	print "Edge vs matched filter decoder,", frames, "frames per row, edge/matched"
+	print "\tnoise\tdecoded\tcorrect\terror\tframe/s\trejected"
+	n = frames * frame_length()
+	for noise in MATCHED_NOISE:
+		samples = generate(n, noise=noise, **conditions)
+		edge, edge_time = feed_all(StreamDecoder(4, THRESH, adaptive=True), samples)
+		decoder = MatchedDecoder(frame_bounds(), frame_length())
+		matched, matched_time = feed_all(decoder, samples)
+		edge_correct, edge_error = score(edge[:, 1:] - edge[:, :1], INTENSITIES)
+		correct, error = score(matched[:, 1:] - matched[:, :1], INTENSITIES)
+		print "\t", noise, "\t", format(float(len(edge)) / frames, '.2f') + "/" + format(float(len(matched)) / frames, '.2f'), "\t",
+		print format(float(edge_correct) / frames, '.2f') + "/" + format(float(correct) / frames, '.2f'), "\t", edge_error + "/" + error, "\t", str(int(len(edge) / edge_time)) + "/" + str(int(len(matched) / matched_time)), "\t", decoder.rejected
+
+	# Noise alone must not give frames
+	decoder = MatchedDecoder(frame_bounds(), frame_length())
+	noise, elapsed = feed_all(decoder, generate(n, (0, 0, 0), noise=20.0, **conditions))
+	print "\tNo signal:", len(noise), "frames from", frames, "periods of noise,", decoder.rejected, "rejected"
+
+# Decode frames of N LED slots and solve their positions with the
+# Lambertian model fitted to noisy calibration points, solving the frames
+# in one batch and one at a time
+def bench_solver(frames, conditions):
+	print
+	print "Lambertian solver,", frames, "frames per row, LED height", HEIGHT
+	print "	LEDs	decoded	correct	error	batch/s	single/s"
+	order = lambertian_order()
+	for leds in SOLVER_LEDS:
+		layout = np.array(LED_LAYOUT[:leds], dtype=float)
+		gain = PEAK_INTENSITY / model_intensities(layout[:1], layout[:1], 1.0, HEIGHT, order)[0, 0]
+
+		# The decoder takes any number of slots
+		intensities = model_intensities([(X_MAX / 3.0, Y_MAX / 3.0)], layout, gain, HEIGHT, order)[0].round()
+		samples = generate(frames * frame_length(leds + 1), intensities, noise=5.0, **conditions)
+		decoded, elapsed = feed_all(StreamDecoder(leds + 1, THRESH, adaptive=True), samples, leds + 1)
+		correct, error = score(decoded[:, 1:] - decoded[:, :1], intensities)
+
+		I_cal = model_intensities(np.column_stack((X_CAL, Y_CAL)), layout, gain, HEIGHT, order)
+		I_cal += np.random.normal(0, SOLVER_NOISE, I_cal.shape)
+		model = LambertianModel(*fit_leds(I_cal, X_CAL, Y_CAL, HEIGHT, order), height=HEIGHT, order=order)
+		truth = np.column_stack((np.random.uniform(X_MIN, X_MAX, frames), np.random.uniform(Y_MIN, Y_MAX, frames)))
+		measured = model_intensities(truth, layout, gain, HEIGHT, order) + np.random.normal(0, SOLVER_NOISE, (frames, leds))
+		start = time.time()
+		positions = model.locate(measured)
+		batch_time = time.time() - start
+		start = time.time()
+		for row in measured:
+			model.locate(row)
+		single_time = time.time() - start
+		print "	", leds, "	", format(float(len(decoded)) / frames, '.2f'), "	", format(float(correct) / frames, '.2f'), "	",
+		print format(np.median(np.sqrt(((positions - truth) ** 2).sum(axis=1))), '.3f'), "	", int(frames / batch_time), "	", int(frames / single_time)
+
+# Run the benchmarks, which need no GPIO or ADC
+parser = argparse.ArgumentParser(description="Benchmark the frame decoders on synthetic signals")
+parser.add_argument("--windows", type=int, default=1000, help="windows per measurement (default: %(default)s)")
+parser.add_argument("--drift", type=float, default=0.0, help="amplitude of the ambient light drift (default: %(default)s)")
+parser.add_argument("--ringing", type=float, default=0.0, help="edge ringing as a fraction of each edge (default: %(default)s)")
+parser.add_argument("--seed", type=int, default=0, help="random seed (default: %(default)s)")
+args = parser.parse_args()
+conditions = {"drift": args.drift, "ringing": args.ringing}
+
+np.random.seed(args.seed)
+bench_loop(args.windows)
+bench_window(args.windows, conditions)
+bench_stream(args.windows, conditions)
+bench_adaptive(args.windows, conditions)
+bench_matched(args.windows, conditions)
+bench_solver(args.windows, conditions)
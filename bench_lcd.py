@@ -0,0 +1,92 @@
+import sys
+import time
+from fyp.lcd import LCD, LCD_CHR, LCD_CMD, LCD_BUSES, FakeGpioBus, open_lcd_bus, LCD_RS, LCD_E, LCD_D4, LCD_D5, LCD_D6, LCD_D7
+
+# Benchmark constants
+FRAMES = 20
+LINE_ADDRESSES = (0x80, 0xC0)	# Commands moving the cursor to the start of each line
+TEXT = ("x: 3.142 y: 2.71", "1:200 2:150 3:25")
+OLD_DELAY = 0.00005		# Sleep before, during and after each E pulse, as the per-pin driver used
+
+# Stands in for wiringPi, counting the calls
+class CountingPins(object):
+	def __init__(self):
+		self.calls = 0
+
+	def digitalWrite(self, pin, level):
+		self.calls += 1
+
+# The per-pin driver the LCD used before: every data line cleared then set
+# one digitalWrite() at a time, and fixed sleeps around E
+def per_pin_byte(wp, bits, mode):
+	wp.digitalWrite(LCD_RS, mode)
+	for shift in (4, 0):
+		for pin in (LCD_D4, LCD_D5, LCD_D6, LCD_D7):
+			wp.digitalWrite(pin, 0)
+		for i, pin in enumerate((LCD_D4, LCD_D5, LCD_D6, LCD_D7)):
+			if(bits & (1 << (shift + i))):
+				wp.digitalWrite(pin, 1)
+		time.sleep(OLD_DELAY)
+		wp.digitalWrite(LCD_E, 1)
+		time.sleep(OLD_DELAY)
+		wp.digitalWrite(LCD_E, 0)
+		time.sleep(OLD_DELAY)
+
+# Bytes of one full frame: each line's address then its characters
+def frame_bytes():
+	data = []
+	for address, line in zip(LINE_ADDRESSES, TEXT):
+		data.append((address, LCD_CMD))
+		data.extend((ord(c), LCD_CHR) for c in line)
+	return data
+
+# Time and GPIO calls per byte of sending frames through send(bits, mode)
+def bench(send, counter):
+	data = frame_bytes()
+	calls = counter()
+	start = time.time()
+	for i in range(FRAMES):
+		for bits, mode in data:
+			send(bits, mode)
+	n = FRAMES * len(data)
+	return (time.time() - start) / n, float(counter() - calls) / n
+
+# Bytes the LCD would read from the recorded pin levels, latching the data
+# lines and RS on every falling edge of E, two nibbles to a byte
+def decode_levels(levels, lcd):
+	nibbles = []
+	last = 0
+	for level in levels:
+		if((last & lcd.e) and not (level & lcd.e)):
+			nibble = sum(1 << i for i, line in enumerate(lcd.data) if level & line)
+			nibbles.append((nibble, 1 if level & lcd.rs else 0))
+		last = level
+	return [((high << 4) | low, mode) for (high, mode), (low, _) in zip(nibbles[0::2], nibbles[1::2])]
+
+# Compare the per-pin driver with the LCD on each GPIO bus available here,
+# and check that what reaches the pins decodes back to the bytes sent
+# Usage: python bench_lcd.py [bus ...]
+pins = CountingPins()
+per_byte, calls = bench(lambda bits, mode: per_pin_byte(pins, bits, mode), lambda: pins.calls)
+print "per-pin\t", format(per_byte * 1e6, '.1f'), "us/byte,", format(calls, '.1f'), "GPIO calls/byte"
+
+for backend in sys.argv[1:] or LCD_BUSES:
+	try:
+		bus = open_lcd_bus(backend)
+	except (ImportError, IOError, OSError) as e:
+		print backend, "\tunavailable (" + str(e) + ")"
+		continue
+	lcd = LCD(bus=bus)
+	per_byte, calls = bench(lcd.byte, lambda: bus.calls)
+	print backend, "\t", type(bus).__name__, "\t", format(per_byte * 1e6, '.1f'), "us/byte,", format(calls, '.1f'), "GPIO calls/byte"
+
+bus = FakeGpioBus(record=True)
+lcd = LCD(bus=bus)
+data = frame_bytes()
+for bits, mode in data:
+	lcd.byte(bits, mode)
+if(decode_levels(bus.levels, lcd) == data):
+	print "Pin levels decode to the", len(data), "bytes sent"
+else:
+	print "Pin levels do NOT decode to the bytes sent"
+	sys.exit(1)
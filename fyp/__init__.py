@@ -0,0 +1,3 @@
+# Visible light positioning: ADC capture, frame decoding, averaging and
+# calibration for the receiver, usable without the Raspberry Pi hardware.
+# Nothing here touches the GPIO until a hardware driver is created.
@@ -0,0 +1,220 @@
+import threading
+import numpy as np
+from .adc import read_scan
+from .stats import NULL_STATS
+
+# Acquisition constants
+RING_SIZE = 4	# Windows held between the sampling thread and the decoder
+WINDOW_MARGIN = 1.1	# Window length as a multiple of the frame period, when fitted
+MIN_WINDOW = 16		# Shortest window fit_window() will choose
+
+# Preallocated windows shared by one producer and one consumer
+# The producer fills the slot at head without holding the lock, then
+# publishes it. If the consumer falls behind, the oldest unread window
+# is dropped and counted as an overrun, so the slot being written is
+# never one the consumer can read.
+# With channels set, each window holds one row of samples per channel.
+# The slots hold capacity samples, but the producer may fill fewer: each
+# window is published with its own length.
+# Windows are numbered as they are published, so the consumer can tell
+# when one it reads does not follow on from the last, after an overrun
+# or a flush.
+class WindowRing(object):
+	def __init__(self, window, size=RING_SIZE, channels=None):
+		if(size < 2):
+			raise ValueError("A window ring needs at least two slots")
+		self.capacity = window
+		self.window = window	# Samples in the windows being written now
+		self.size = size
+		if(channels is None):
+			shape = [size, window]
+		else:
+			shape = [size, channels, window]
+		self.values = np.zeros(shape, dtype=np.uint16)
+		self.stamps = np.zeros(shape)
+		self.lengths = np.zeros([size], dtype=int)
+		self.head = 0		# Windows published
+		self.tail = 0		# Next window to hand to the consumer
+		self.consumed = 0	# Windows handed to the consumer
+		self.overruns = 0	# Windows dropped before being read
+		self.read = None	# Number of the last window handed to the consumer
+		self.gap = False	# Windows were dropped just before the last one handed out
+		self.samples = 0	# Samples published, per channel
+		self.stale = False	# Drop the window being written at the last flush
+		self.cond = threading.Condition()
+
+	# Index of the slot the producer should fill next
+	def write_slot(self):
+		return self.head % self.size
+
+	# Publish the slot just filled with length samples
+	def publish(self, length=None):
+		if(length is None):
+			length = self.window
+		with self.cond:
+			self.lengths[self.head % self.size] = length
+			self.samples += length
+			self.head += 1
+			if(self.stale):
+				self.tail = self.head
+				self.stale = False
+			elif(self.head - self.tail > self.size - 1):
+				self.tail = self.head - (self.size - 1)
+				self.overruns += 1
+			self.cond.notify()
+
+	# Copy the oldest unread window into out (and its timestamps into stamps)
+	# Returns the window's length, or 0 if no window arrived before the timeout
+	def get(self, out, stamps=None, timeout=None):
+		with self.cond:
+			while(self.head == self.tail):
+				self.cond.wait(timeout)
+				if((timeout is not None) and (self.head == self.tail)):
+					return 0
+			slot = self.tail % self.size
+			n = self.lengths[slot]
+			out[..., :n] = self.values[slot][..., :n]
+			if(stamps is not None):
+				stamps[..., :n] = self.stamps[slot][..., :n]
+			self.gap = (self.read is not None) and (self.tail != self.read + 1)
+			self.read = self.tail
+			self.tail += 1
+			self.consumed += 1
+			return n
+
+	# Discard every unread window, and the one currently being written
+	def flush(self):
+		with self.cond:
+			self.tail = self.head
+			self.stale = True
+
+	# Number of windows waiting to be read
+	def pending(self):
+		with self.cond:
+			return self.head - self.tail
+
+# Sample one ADC channel continuously in a background thread
+# Complete windows are handed to the decoder through a WindowRing
+# Pass a realtime.RealTime to pin the thread and raise its priority, and a
+# samplebus.SampleBus to publish every window to other processes as well
+class Acquirer(threading.Thread):
+	def __init__(self, adc, adcnum, window, size=RING_SIZE, timestamps=False, stats=NULL_STATS, realtime=None, bus=None):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.stats = stats
+		self.realtime = realtime
+		self.bus = bus
+		self.adc = adc
+		self.adcnum = adcnum
+		self.timestamps = timestamps
+		self.ring = WindowRing(window, size)
+		self.running = threading.Event()
+		self.running.set()
+
+	def run(self):
+		ring = self.ring
+		read_block = self.adc.read_block
+		adcnum = self.adcnum
+		stats = self.stats
+		self.enter_realtime()
+		while self.running.is_set():
+			slot = ring.write_slot()
+			window = ring.window
+			start = stats.now()
+			if(self.timestamps):
+				read_block(adcnum, window, ring.values[slot], ring.stamps[slot])
+			else:
+				read_block(adcnum, window, ring.values[slot])
+			stats.record("read", start)
+			self.share(slot, window)
+			ring.publish(window)
+
+	# Called by the sampling thread before it starts sampling
+	def enter_realtime(self):
+		if(self.realtime is not None):
+			self.realtime.enter()
+
+	# Copy a window just captured onto the sample bus
+	def share(self, slot, window):
+		if(self.bus is not None):
+			stamps = None
+			if(self.timestamps):
+				stamps = self.ring.stamps[slot][..., :window]
+			self.bus.write(self.ring.values[slot][..., :window], stamps)
+
+	# Ask the sampling thread to finish its current window and exit
+	def stop(self):
+		self.running.clear()
+
+	# Wait for the next complete window and copy it into out
+	def get_window(self, out, stamps=None, timeout=None):
+		return self.ring.get(out, stamps, timeout)
+
+	# Yield the part of out each window is copied into, for streaming decoders
+	# None is yielded before a window that does not follow on from the last
+	# one, so decoders can drop their partial frames instead of joining
+	# samples that do not belong together
+	# The time spent waiting for each window is recorded as "wait"
+	def windows(self, out, stamps=None):
+		stats = self.stats
+		ring = self.ring
+		while True:
+			start = stats.now()
+			n = self.get_window(out, stamps)
+			stats.record("wait", start)
+			if(ring.gap):
+				yield None
+			yield out[..., :n]
+
+	# Capture windows of n samples from now on, up to the ring's capacity
+	def set_window(self, n):
+		self.ring.window = max(1, min(n, self.ring.capacity))
+		return self.ring.window
+
+	# Size the windows to just over one frame of period samples, so each
+	# window completes a frame with as little waiting as possible
+	def fit_window(self, period):
+		return self.set_window(max(MIN_WINDOW, int(period * WINDOW_MARGIN) + 1))
+
+	# Drop windows started before now, e.g. while the receiver was moving
+	def flush(self):
+		self.ring.flush()
+
+	# Snapshot of the producer/consumer counters
+	def counters(self):
+		ring = self.ring
+		with ring.cond:
+			return {"captured": ring.head, "consumed": ring.consumed, "overruns": ring.overruns, "samples": ring.samples}
+
+# Sample several ADC channels in a background thread
+# Each window holds the same number of samples of every channel, one row per channel,
+# read in the given scan order (see adc.read_scan)
+class ScanAcquirer(Acquirer):
+	def __init__(self, adc, adcnums, window, size=RING_SIZE, order="roundrobin", timestamps=False, stats=NULL_STATS, realtime=None, bus=None):
+		Acquirer.__init__(self, adc, None, window, size, timestamps, stats, realtime, bus)
+		self.adcnums = list(adcnums)
+		self.order = order
+		self.ring = WindowRing(window, size, len(self.adcnums))
+
+	def run(self):
+		ring = self.ring
+		adc = self.adc
+		adcnums = self.adcnums
+		order = self.order
+		stats = self.stats
+		self.enter_realtime()
+		while self.running.is_set():
+			slot = ring.write_slot()
+			window = ring.window
+			start = stats.now()
+			if(self.timestamps):
+				read_scan(adc, adcnums, window, ring.values[slot], ring.stamps[slot], order)
+			else:
+				read_scan(adc, adcnums, window, ring.values[slot], order=order)
+			stats.record("read", start)
+			self.share(slot, window)
+			ring.publish(window)
+
+	# Samples captured over all channels
+	def samples(self):
+		return self.counters()["samples"] * len(self.adcnums)
@@ -0,0 +1,306 @@
+import time
+import numpy as np
+from .gpio import wiringpi
+
+# Define the ADC pins (bit-bang wiring)
+SPICLK = 11
+SPIMISO = 10
+SPIMOSI = 6
+SPICS = 5
+
+# Hardware SPI settings
+# The kernel driver owns SCLK/MOSI/MISO/CE0, which overlap the LCD data
+# pins D4-D6 (wiringPi 12-14), so the LCD must be rewired to use this backend
+SPI_BUS = 0
+SPI_DEVICE = 0
+SPI_SPEED = 1350000	# Highest MCP3008 clock rate at 3.3V
+
+# ADC constants
+ADC_CHANNELS = 8
+ADC_BACKENDS = ("spi", "bitbang", "fake")
+SCAN_ORDERS = ("roundrobin", "burst")
+FAKE_RATE = 10000.0	# Nominal samples/sec used for fake timestamps
+
+# Check the channel and prepare the buffers for a block read
+def block_buffers(adcnum, n, out, stamps):
+	if((adcnum > 7) or (adcnum < 0)):
+		raise ValueError("Invalid ADC channel: " + str(adcnum))
+	if(out is None):
+		out = np.zeros([n], dtype=np.uint16)
+	elif(len(out) < n):
+		raise ValueError("Output buffer is shorter than the block")
+	if((stamps is not None) and (len(stamps) < n)):
+		raise ValueError("Timestamp buffer is shorter than the block")
+	return out
+
+# Check the channels and prepare the buffers for a scan of n samples per channel
+def scan_buffers(adcnums, n, out, stamps):
+	for adcnum in adcnums:
+		if((adcnum > 7) or (adcnum < 0)):
+			raise ValueError("Invalid ADC channel: " + str(adcnum))
+	if(out is None):
+		out = np.zeros([len(adcnums), n], dtype=np.uint16)
+	elif(out.shape[0] < len(adcnums) or out.shape[1] < n):
+		raise ValueError("Output buffer is smaller than the scan")
+	if((stamps is not None) and (stamps.shape[0] < len(adcnums) or stamps.shape[1] < n)):
+		raise ValueError("Timestamp buffer is smaller than the scan")
+	return out
+
+# Read the MCP3008 by toggling the GPIO pins directly
+# This is the original readadc() path, kept as a fallback
+class BitBangADC(object):
+	def __init__(self, clockpin=SPICLK, mosipin=SPIMOSI, misopin=SPIMISO, cspin=SPICS):
+		wp = wiringpi()
+		self.wp = wp
+		self.clockpin = clockpin
+		self.mosipin = mosipin
+		self.misopin = misopin
+		self.cspin = cspin
+
+		# Mode setting for ADC pins
+		wp.pinMode(clockpin, 1)
+		wp.pinMode(misopin, 0)
+		wp.pinMode(mosipin, 1)
+		wp.pinMode(cspin, 1)
+
+	def read(self, adcnum):
+		if((adcnum > 7) or (adcnum < 0)):
+			return -1
+
+		digitalWrite = self.wp.digitalWrite
+		digitalRead = self.wp.digitalRead
+		clockpin = self.clockpin
+		mosipin = self.mosipin
+		misopin = self.misopin
+		cspin = self.cspin
+
+		digitalWrite(cspin, 1)
+		digitalWrite(clockpin, 0) 	# start clock low
+		digitalWrite(cspin, 0)		# bring CS low
+
+		commandout = adcnum
+		commandout |= 0x18	# start bit + single-ended bit
+		commandout <<= 3	# we only need to send 5 bits here
+
+		for i in range(5):
+			if(commandout & 0x80):
+				digitalWrite(mosipin, 1)
+			else:
+				digitalWrite(mosipin, 0)
+
+			commandout <<= 1
+			digitalWrite(clockpin, 1)
+			digitalWrite(clockpin, 0)
+
+		adcout = 0
+		# read in one empty bit, one null bit and 10 adc bits
+		for i in range(12):
+			digitalWrite(clockpin, 1)
+			digitalWrite(clockpin, 0)
+			adcout <<= 1
+			if(digitalRead(misopin)):
+				adcout |= 0x1
+
+		digitalWrite(cspin, 1)
+
+		return adcout >> 1	# first bit is 'null' so drop it
+
+	# Fill out[:n] with consecutive samples, and stamps[:n] with their times
+	def read_block(self, adcnum, n, out=None, stamps=None):
+		out = block_buffers(adcnum, n, out, stamps)
+		read = self.read
+		if(stamps is None):
+			for i in range(n):
+				out[i] = read(adcnum)
+		else:
+			now = time.time
+			for i in range(n):
+				stamps[i] = now()
+				out[i] = read(adcnum)
+		return out
+
+	def close(self):
+		pass
+
+# Read the MCP3008 through the kernel SPI device (/dev/spidevB.D)
+# Each sample is a single full-duplex 3-byte transfer
+class SpiADC(object):
+	def __init__(self, bus=SPI_BUS, device=SPI_DEVICE, speed=SPI_SPEED):
+		import spidev
+		self.spi = spidev.SpiDev()
+		self.spi.open(bus, device)
+		self.spi.max_speed_hz = speed
+		self.spi.mode = 0
+
+	def read(self, adcnum):
+		if((adcnum > 7) or (adcnum < 0)):
+			return -1
+
+		# Start bit, then single-ended bit and channel in the top nibble
+		reply = self.spi.xfer2([0x01, (0x08 | adcnum) << 4, 0x00])
+		return ((reply[1] & 0x03) << 8) | reply[2]
+
+	# Fill out[:n] with consecutive samples, and stamps[:n] with their times
+	def read_block(self, adcnum, n, out=None, stamps=None):
+		out = block_buffers(adcnum, n, out, stamps)
+		xfer2 = self.spi.xfer2
+		command = [0x01, (0x08 | adcnum) << 4, 0x00]
+		if(stamps is None):
+			for i in range(n):
+				reply = xfer2(command)
+				out[i] = ((reply[1] & 0x03) << 8) | reply[2]
+		else:
+			now = time.time
+			for i in range(n):
+				stamps[i] = now()
+				reply = xfer2(command)
+				out[i] = ((reply[1] & 0x03) << 8) | reply[2]
+		return out
+
+	def close(self):
+		self.spi.close()
+
+# In-memory ADC that plays back a fixed trace for each channel
+# Lets the pipeline run on a machine without GPIO or SPI
+class FakeADC(object):
+	def __init__(self, traces=None, loop=True, rate=FAKE_RATE):
+		self.traces = {}
+		self.positions = {}
+		self.loop = loop
+		self.rate = rate
+		if(traces is not None):
+			for adcnum in traces:
+				self.load(adcnum, traces[adcnum])
+
+	# Replace the trace returned for a channel
+	def load(self, adcnum, trace):
+		self.traces[adcnum] = np.asarray(trace, dtype=np.uint16)
+		self.positions[adcnum] = 0
+
+	def read(self, adcnum):
+		if((adcnum > 7) or (adcnum < 0)):
+			return -1
+
+		trace = self.traces.get(adcnum)
+		if(trace is None or len(trace) == 0):
+			return 0
+
+		pos = self.positions[adcnum]
+		if(pos >= len(trace)):
+			if(not self.loop):
+				return 0
+			pos = 0
+		self.positions[adcnum] = pos + 1
+		return int(trace[pos])
+
+	# Fill out[:n] from the trace, wrapping around if looping
+	def read_block(self, adcnum, n, out=None, stamps=None):
+		out = block_buffers(adcnum, n, out, stamps)
+		if(stamps is not None):
+			stamps[:n] = time.time() + np.arange(n) / self.rate
+
+		trace = self.traces.get(adcnum)
+		if(trace is None or len(trace) == 0):
+			out[:n] = 0
+			return out
+
+		pos = self.positions[adcnum]
+		filled = 0
+		while(filled < n):
+			if(pos >= len(trace)):
+				if(not self.loop):
+					out[filled:n] = 0
+					break
+				pos = 0
+			step = min(n - filled, len(trace) - pos)
+			out[filled:filled+step] = trace[pos:pos+step]
+			filled += step
+			pos += step
+		self.positions[adcnum] = pos
+		return out
+
+	def close(self):
+		pass
+
+# Create an ADC driver by name
+# "spi" falls back to bit-banging if the kernel SPI device is unavailable
+def open_adc(backend="spi", **kwargs):
+	if(backend == "spi"):
+		try:
+			return SpiADC(**kwargs)
+		except (ImportError, IOError, OSError):
+			return BitBangADC()
+	elif(backend == "bitbang"):
+		return BitBangADC(**kwargs)
+	elif(backend == "fake"):
+		return FakeADC(**kwargs)
+	else:
+		raise ValueError("Unknown ADC backend: " + str(backend))
+
+# Read n samples from each channel in adcnums into the rows of out
+# "roundrobin" takes one sample from each channel in turn, so every channel
+# is sampled continuously at 1/len(adcnums) of the ADC rate. "burst" reads
+# each channel's n samples back to back at the full rate, leaving a gap in
+# each channel while the others are read.
+def read_scan(adc, adcnums, n, out=None, stamps=None, order="roundrobin"):
+	out = scan_buffers(adcnums, n, out, stamps)
+	if(order == "burst"):
+		for c, adcnum in enumerate(adcnums):
+			if(stamps is None):
+				adc.read_block(adcnum, n, out[c])
+			else:
+				adc.read_block(adcnum, n, out[c], stamps[c])
+	elif(order == "roundrobin"):
+		read = adc.read
+		channels = list(enumerate(adcnums))
+		if(stamps is None):
+			for i in range(n):
+				for c, adcnum in channels:
+					out[c, i] = read(adcnum)
+		else:
+			now = time.time
+			for i in range(n):
+				for c, adcnum in channels:
+					stamps[c, i] = now()
+					out[c, i] = read(adcnum)
+	else:
+		raise ValueError("Unknown scan order: " + str(order))
+	return out
+
+# Measure how many samples per second a driver can deliver
+def benchmark(adc, adcnum=0, samples=10000):
+	read = adc.read
+	start = time.time()
+	for i in range(samples):
+		read(adcnum)
+	elapsed = time.time() - start
+	if(elapsed <= 0):
+		return float("inf")
+	return samples / elapsed
+
+# Measure the block read rate and the spread of window capture times
+# Returns (samples/sec, mean window time, max - min window time)
+def benchmark_block(adc, adcnum=0, n=200, windows=50):
+	out = np.zeros([n], dtype=np.uint16)
+	times = np.zeros([windows])
+	for w in range(windows):
+		start = time.time()
+		adc.read_block(adcnum, n, out)
+		times[w] = time.time() - start
+	total = np.sum(times)
+	if(total <= 0):
+		return float("inf"), 0.0, 0.0
+	return n * windows / total, np.mean(times), np.ptp(times)
+
+# Measure the aggregate rate of scanning several channels
+# Returns (samples/sec over all channels, samples/sec per channel)
+def benchmark_scan(adc, adcnums, n=200, windows=50, order="roundrobin"):
+	out = np.zeros([len(adcnums), n], dtype=np.uint16)
+	start = time.time()
+	for w in range(windows):
+		read_scan(adc, adcnums, n, out, order=order)
+	elapsed = time.time() - start
+	if(elapsed <= 0):
+		return float("inf"), float("inf")
+	rate = len(adcnums) * n * windows / elapsed
+	return rate, rate / len(adcnums)
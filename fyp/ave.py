@@ -0,0 +1,70 @@
+import argparse
+import numpy as np
+from .adc import open_adc
+from .acquisition import Acquirer
+from .display import start_display, intensity_text, intensity_lines
+from .publisher import STATUS_VALID, STATUS_UNSTEADY, STATUS_INVALID
+from .telemetry import add_console_args, ConsoleLimiter
+from .decoder import stream_slots, add_led_args
+from .averaging import ChannelEstimator
+
+# Constants
+ADC_BACKEND = "bitbang"	# "spi" to use the kernel SPI device
+COUNT_MAX = 200
+THRESH = 50
+OUTLIER_THRESH = 20
+AVERAGING_PERIOD = 10
+
+# Show the outlier-rejected average of each LED intensity until interrupted
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Show the averaged intensity of each LED")
+	add_led_args(parser)
+	add_console_args(parser)
+	args = parser.parse_args(argv)
+	console = ConsoleLimiter(args.console_interval)
+	behind = ConsoleLimiter(args.console_interval)
+
+	# Variable initialisation
+	adcnum = 0
+	overruns = 0
+	values = np.zeros([COUNT_MAX], dtype=np.uint16)
+	x0 = np.zeros([args.leds], dtype=int)
+
+	# Sample the ADC continuously in the background
+	adc = open_adc(ADC_BACKEND)
+	acquirer = Acquirer(adc, adcnum, COUNT_MAX)
+
+	# Initialise display
+	display = start_display()
+	acquirer.start()
+
+	# Main loop
+	frames = stream_slots(acquirer.windows(values), args.leds, THRESH, COUNT_MAX) # One slot per LED, without the zero level slot
+	estimator = ChannelEstimator(args.leds, AVERAGING_PERIOD, OUTLIER_THRESH)
+	while True:
+		means = next(frames)
+
+		if(means is None): 	# Send some test
+			display.show("Invalid", "conditions")
+			if(console.due(STATUS_INVALID)): print "Invalid lighting conditions!"
+			estimator.reset()
+			continue
+
+		x0[:] = estimator.update(means)
+		if(not estimator.ready()):
+			continue
+
+		# Report windows dropped while the decoder was busy, at most once per console interval
+		dropped = acquirer.counters()["overruns"] - overruns
+		if((dropped > 0) and behind.due()):
+			print "Decoder fell behind, dropped", dropped, "windows"
+			overruns += dropped
+
+		if(np.amin(x0) > 0):
+			# Send some test
+			display.show(*intensity_lines(x0))
+			if(console.due(STATUS_VALID)): print intensity_text(x0)
+
+		else:
+			display.show("Unsteady!", "Pls stabilise!")
+			if(console.due(STATUS_UNSTEADY)): print "Unsteady! Please stabilise."
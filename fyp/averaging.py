@@ -0,0 +1,90 @@
+import bisect
+from collections import deque
+import numpy as np
+
+# Averaging constants
+OUTLIER_THRESH = 20	# Readings further than this from the median are outliers
+AVERAGING_PERIOD = 10	# Readings averaged into each estimate
+
+# Remove outliers from an array of data
+def average_average(data, thresh=OUTLIER_THRESH):
+	d = np.abs(data - np.median(data))
+	x = data[d < thresh]
+	if(np.any(x)): return int(round(np.mean(x)))
+	else: return 0
+
+# average_average() of every column of a (readings x channels) array at once
+def average_columns(data, thresh=OUTLIER_THRESH):
+	data = np.asarray(data)
+	inliers = np.abs(data - np.median(data, axis=0)) < thresh
+	count = np.maximum(inliers.sum(axis=0), 1)
+	mean = np.where(inliers, data, 0).sum(axis=0) / count.astype(float)
+	out = np.sign(mean) * np.floor(np.abs(mean) + 0.5) # Rounded half away from zero, as round() does
+	out[~np.any(inliers & (data != 0), axis=0)] = 0
+	return out.astype(int)
+
+# average_average() over a sliding window of the most recent readings
+# The window is kept both in arrival order and sorted, so each update is
+# one insert and one delete, and the inliers around the median are a
+# contiguous slice of the sorted window
+class RollingEstimator(object):
+	def __init__(self, size=AVERAGING_PERIOD, thresh=OUTLIER_THRESH):
+		self.size = size
+		self.thresh = thresh
+		self.window = deque()
+		self.ordered = []
+
+	# Add a reading, dropping the oldest once the window is full
+	def update(self, value):
+		if(len(self.window) == self.size):
+			old = self.window.popleft()
+			del self.ordered[bisect.bisect_left(self.ordered, old)]
+		self.window.append(value)
+		bisect.insort(self.ordered, value)
+		return self.estimate()
+
+	# True once the window holds a full averaging period
+	def ready(self):
+		return len(self.window) == self.size
+
+	def median(self):
+		ordered = self.ordered
+		n = len(ordered)
+		if(n % 2):
+			return ordered[n // 2]
+		return (ordered[n // 2 - 1] + ordered[n // 2]) / 2.0
+
+	# Mean of the readings within thresh of the median, or 0 as in average_average()
+	def estimate(self):
+		if(not self.ordered):
+			return 0
+		med = self.median()
+		lo = bisect.bisect_right(self.ordered, med - self.thresh)
+		hi = bisect.bisect_left(self.ordered, med + self.thresh)
+		inliers = self.ordered[lo:hi]
+		if(not any(inliers)):
+			return 0
+		return int(round(float(sum(inliers)) / len(inliers)))
+
+	def reset(self):
+		self.window.clear()
+		del self.ordered[:]
+
+# One RollingEstimator per channel, e.g. per LED intensity
+class ChannelEstimator(object):
+	def __init__(self, channels, size=AVERAGING_PERIOD, thresh=OUTLIER_THRESH):
+		self.estimators = [RollingEstimator(size, thresh) for i in range(channels)]
+		self.out = np.zeros([channels], dtype=int)
+
+	# Add one reading per channel and return the current estimates
+	def update(self, values):
+		for i, estimator in enumerate(self.estimators):
+			self.out[i] = estimator.update(int(values[i]))
+		return self.out
+
+	def ready(self):
+		return self.estimators[0].ready()
+
+	def reset(self):
+		for estimator in self.estimators:
+			estimator.reset()
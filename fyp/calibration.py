@@ -0,0 +1,254 @@
+import json
+import os
+import time
+from collections import deque
+import numpy as np
+from .averaging import average_columns
+
+# Calibration constants
+CAL_VERSION = 1			# Bump when the stored format changes
+CAL_FILE = "calibration.json"
+CAL_TIME = 10			# Seconds to move the receiver to each point
+X_MIN = 0
+X_MAX = 8
+X_MID = (X_MAX - X_MIN) / 2
+Y_MIN = 0
+Y_MAX = 8
+Y_MID = (Y_MAX - Y_MIN) / 2
+
+# Fast calibration constants
+STILL_FRAMES = 10	# Recent frames the receiver's steadiness is judged over
+STILL_SPREAD = 10	# Largest robust standard deviation of an intensity while still
+STILL_TIME = 1.0	# Seconds the receiver must be held still at each point
+MOVE_THRESH = 20	# An intensity must change by this from the previous point
+CAL_FRAMES = 20		# Fewest frames averaged into each point
+POINT_TIMEOUT = 30	# Seconds before a point is given up on and retried
+
+# Calibration points
+X_CAL = np.array([X_MIN, X_MAX, X_MAX, X_MIN, X_MIN, X_MID, X_MID], dtype=float)
+Y_CAL = np.array([Y_MIN, Y_MIN, Y_MAX, Y_MAX, Y_MID, Y_MID, Y_MIN], dtype=float)
+
+# Build the quadratic calibration matrix, one row per calibration point:
+# [I1^2, ..., IN^2, I1, ..., IN, 1], so 7x7 for three LEDs
+def calibration_matrix(I_cal):
+	I = np.asarray(I_cal)
+	return np.column_stack((I**2, I, np.ones(len(I), dtype=I.dtype)))
+
+# Coefficients of the polynomial for N LEDs, which needs as many calibration points
+def poly_terms(leds):
+	return 2 * leds + 1
+
+# Solve the X and Y calibration coefficients
+# With more calibration points than coefficients they are fitted by least squares
+def solve_calibration(I_cal, x_cal, y_cal):
+	cal_array_0 = calibration_matrix(I_cal)
+	if(cal_array_0.shape[0] == cal_array_0.shape[1]):
+		cal_out_0 = np.linalg.solve(cal_array_0, x_cal)	# Solving X calibration coefficients
+		cal_out_1 = np.linalg.solve(cal_array_0, y_cal)	# Solving Y calibration coefficients
+	else:
+		cal_out_0 = np.linalg.lstsq(cal_array_0, x_cal, rcond=None)[0]
+		cal_out_1 = np.linalg.lstsq(cal_array_0, y_cal, rcond=None)[0]
+	return cal_out_0, cal_out_1
+
+# Evaluate the calibration polynomial at the intensities x0
+def evaluate_position(cal_out_0, cal_out_1, x0):
+	terms = np.concatenate((np.square(x0), x0, (1,)))
+	return np.dot(cal_out_0, terms), np.dot(cal_out_1, terms)
+
+# Calibration file for one receiver when several are tracked at once
+# e.g. calibration.json -> calibration-ch2.json
+def channel_cal_file(path, adcnum):
+	root, ext = os.path.splitext(path)
+	return root + "-ch" + str(adcnum) + ext
+
+# Save a calibration, replacing any earlier file in one step
+def save_calibration(path, I_cal, cal_out_0, cal_out_1, x_cal, y_cal, thresh):
+	data = {
+		"version": CAL_VERSION,
+		"timestamp": time.time(),
+		"thresh": thresh,
+		"I_cal": np.asarray(I_cal).tolist(),
+		"x_cal": np.asarray(x_cal).tolist(),
+		"y_cal": np.asarray(y_cal).tolist(),
+		"cal_out_0": np.asarray(cal_out_0).tolist(),
+		"cal_out_1": np.asarray(cal_out_1).tolist(),
+	}
+	tmp = path + ".tmp"
+	with open(tmp, "w") as f:
+		json.dump(data, f, indent=1, separators=(",", ": "))
+	os.rename(tmp, path)
+
+# Load a calibration saved with the same format and threshold, and with the
+# same calibration points and number of LEDs if they are given
+# Returns None if there is no usable calibration
+def load_calibration(path, thresh, x_cal=None, y_cal=None, leds=None):
+	try:
+		with open(path) as f:
+			data = json.load(f)
+	except (IOError, ValueError):
+		return None
+
+	try:
+		if(data["version"] != CAL_VERSION or data["thresh"] != thresh):
+			return None
+		if((x_cal is not None) and not np.array_equal(data["x_cal"], x_cal)):
+			return None
+		if((y_cal is not None) and not np.array_equal(data["y_cal"], y_cal)):
+			return None
+		calibration = {
+			"timestamp": data["timestamp"],
+			"I_cal": np.array(data["I_cal"], dtype=int),
+			"cal_out_0": np.array(data["cal_out_0"], dtype=float),
+			"cal_out_1": np.array(data["cal_out_1"], dtype=float),
+		}
+	except (KeyError, TypeError, ValueError):
+		return None
+
+	I_cal = calibration["I_cal"]
+	if(I_cal.ndim != 2 or len(I_cal) != len(data["x_cal"])):
+		return None
+	if((leds is not None) and I_cal.shape[1] != leds):
+		return None
+	terms = poly_terms(I_cal.shape[1])
+	if(len(calibration["cal_out_0"]) != terms or len(calibration["cal_out_1"]) != terms):
+		return None
+	return calibration
+
+# Calibration routine: prompt for each point on the display, then store the
+# intensities of the frame measure(position) returns there
+# If measure() returns None the routine starts again from the first point
+# There is one column of I_cal per LED in the frames
+def run_calibration(display, measure, prefix=""):
+	I_cal = None
+
+	# Calibration stage, runs until a successful calibration is detected
+	passed_cal = 0
+	while not passed_cal:
+		passed_cal = 1
+		for i in range(len(X_CAL)):
+			display.write(0, prefix + "[" + str(X_CAL[i]) + ", " + str(Y_CAL[i]) + "]")
+			for t in range(CAL_TIME+1):
+				display.write(1, str((i+1)) + "/" + str(len(X_CAL)) + ", " + str((CAL_TIME-t)) + "sec")
+				time.sleep(1)
+			frame = measure(i)
+
+			# If the calibration failed (due to illogical readings)
+			if(frame is None):
+				display.show("Invalid", "calibration")
+				print "Invalid calibration, please reattempt"
+				time.sleep(5)
+				passed_cal = 0
+				break
+
+			# Store the intensities for this calibration point
+			print "Zero lvl: ", frame[0]
+			if(I_cal is None):
+				I_cal = np.zeros([len(X_CAL), len(frame) - 1], dtype=int)
+			I_cal[i, :] = frame[1:]
+			print I_cal
+	return I_cal
+
+# Average the frames of one calibration point, once the receiver is there
+# The receiver counts as still while each intensity's spread over the last
+# STILL_FRAMES frames is under STILL_SPREAD, and as moved once any of their
+# medians is MOVE_THRESH from the previous point. Every frame from then on
+# is kept, and once it has been still for STILL_TIME the kept frames are
+# averaged with outliers removed. Moving again or an invalid frame starts
+# the point over.
+# Returns the averaged (zero level, I1, ..., IN), or None after timeout seconds
+def settle_point(frames, previous=None, timeout=POINT_TIMEOUT):
+	deadline = time.time() + timeout
+	recent = deque(maxlen=STILL_FRAMES)
+	held = []
+	still_since = None
+	for frame in frames:
+		now = time.time()
+		if(now > deadline):
+			return None
+		if(frame is None):
+			recent.clear()
+			del held[:]
+			still_since = None
+			continue
+
+		recent.append(frame)
+		if(len(recent) < STILL_FRAMES):
+			continue
+		window = np.array(recent)
+		median = np.median(window, axis=0)
+		spread = 1.4826 * np.median(np.abs(window - median), axis=0)
+		moved = (previous is None) or (np.amax(np.abs(median[1:] - previous[1:])) >= MOVE_THRESH)
+		if((not moved) or np.any(spread[1:] > STILL_SPREAD)):
+			del held[:]
+			still_since = None
+			continue
+
+		if(still_since is None):
+			still_since = now
+			held.extend(recent)
+		else:
+			held.append(frame)
+		if((now - still_since >= STILL_TIME) and (len(held) >= CAL_FRAMES)):
+			return average_columns(held)
+
+# Fast calibration routine: frames(position) returns the stream of frames
+# received at each point, which is averaged once the receiver is held still
+# there (see settle_point), so there is no countdown. A point that times
+# out is retried on its own.
+# Other points than X_CAL, Y_CAL can be given, e.g. for a fingerprint survey
+def run_fast_calibration(display, frames, prefix="", x_cal=X_CAL, y_cal=Y_CAL):
+	I_cal = None
+	previous = None
+	for i in range(len(x_cal)):
+		point = None
+		while point is None:
+			display.write(0, prefix + "[" + str(x_cal[i]) + ", " + str(y_cal[i]) + "]")
+			display.write(1, str((i+1)) + "/" + str(len(x_cal)) + ", hold still")
+			start = time.time()
+			point = settle_point(frames(i), previous)
+			if(point is None):
+				display.write(1, str((i+1)) + "/" + str(len(x_cal)) + ", retrying")
+				print "Calibration point", i+1, "timed out, please reattempt"
+
+		# Store the intensities for this calibration point
+		print "Zero lvl: ", point[0], "after", format(time.time() - start, '.1f'), "s"
+		if(I_cal is None):
+			I_cal = np.zeros([len(x_cal), len(point) - 1], dtype=int)
+		I_cal[i, :] = point[1:]
+		previous = point
+		print I_cal
+	return I_cal
+
+# Measure the intensities at every calibration point, with the fast routine
+# if frames is given and the timed one otherwise
+def measure_calibration(display, measure, prefix="", frames=None):
+	if(frames is not None):
+		print "Beginning calibration! Hold the receiver still at each point"
+		return run_fast_calibration(display, frames, prefix)
+	print "Beginning calibration! First reading in 10 seconds"
+	display.show(prefix + "Calibration!", "Prepare the rec.")
+	time.sleep(5)
+	return run_calibration(display, measure, prefix)
+
+# Use the calibration stored in path unless recalibrate is set, otherwise
+# run the calibration routine, solve it and store it
+# With frames given, the fast routine is run instead of the timed one
+# Returns I_cal, cal_out_0 and cal_out_1
+def load_or_calibrate(path, thresh, recalibrate, display, measure, prefix="", frames=None, leds=3):
+	calibration = None
+	if(not recalibrate):
+		calibration = load_calibration(path, thresh, X_CAL, Y_CAL, leds)
+
+	if(calibration is not None):
+		print "Loaded calibration from", path, "made", time.ctime(calibration["timestamp"])
+		print calibration["I_cal"]
+		return calibration["I_cal"], calibration["cal_out_0"], calibration["cal_out_1"]
+
+	# Initial stage, only runs once
+	I_cal = measure_calibration(display, measure, prefix, frames)
+
+	# Solving X and Y calibration coefficients
+	print calibration_matrix(I_cal)
+	cal_out_0, cal_out_1 = solve_calibration(I_cal, X_CAL, Y_CAL)
+	save_calibration(path, I_cal, cal_out_0, cal_out_1, X_CAL, Y_CAL, thresh)
+	return I_cal, cal_out_0, cal_out_1
@@ -0,0 +1,439 @@
+from bisect import bisect_left
+from collections import deque
+import numpy as np
+from .stats import NULL_STATS
+
+# Decoder constants
+THRESH = 50	# Minimum sample-to-sample jump counted as a transition
+SECTIONS = 16	# Transitions needed in a window (two frames of four slots)
+LEDS = 3	# LEDs taking turns in each frame, unless a script is given --leds
+SLOTS = LEDS + 1	# Zero level slot followed by one slot per LED
+
+# Adaptive threshold constants
+NOISE_K = 3.0		# Noise standard deviations a transition must clear
+EDGE_FRACTION = 0.5	# Fraction of the smallest edge the threshold is set to
+EDGE_PERCENTILE = 10	# Percentile of the jumps above the noise taken as the smallest edge
+MIN_EDGES = 4		# Jumps above the noise needed to update the edge estimate
+MIN_THRESH = 4		# Never go below this, even with no measurable noise
+THRESH_ALPHA = 0.1	# Weight of each new block in the threshold
+ADAPT_BLOCK = 200	# Jumps per threshold update, however the stream is split into chunks
+PERIOD_HISTORY = 9	# Frame periods the period estimate is the median of
+MAX_FRAME = 1024	# Longest frame expected, in samples, from the transition before it
+KEEP_SPAN = 2 * MAX_FRAME	# Transitions and samples older than this cannot start a frame and are dropped
+
+# Matched filter constants
+MATCH_TRIM = 0		# Samples left out at each end of a slot, if the edges ring for longer than a sample
+LAYOUT_FRAMES = 9	# Frames the edge decoder decodes to learn the frame layout
+
+# Find the first nsections transitions in a window
+# Each section is the index of the first sample after a jump above thresh
+# Returns None if the window does not contain enough transitions
+def find_sections(values, nsections=SECTIONS, thresh=THRESH):
+	v = np.asarray(values).astype(np.int32)
+	edges = (np.abs(v[1:] - v[:-1]) > thresh).nonzero()[0]
+	if(len(edges) < nsections):
+		return None
+	return edges[:nsections] + 1
+
+# Find the section that starts a frame
+# The frame starts after the longest gap among the first half of the sections
+def find_start(sections):
+	half = len(sections) // 2
+	return int((sections[1:half+1] - sections[:half]).argmax()) + 1
+
+# Find the mean of each slot, where slot i runs from
+# sections[start+2i] up to (not including) sections[start+2i+1]
+# All slots and the gaps between them are summed in one reduceat pass
+def slot_means(values, sections, start, nslots):
+	bounds = sections[start:start+2*nslots]
+	sums = np.add.reduceat(values, bounds, dtype=np.int64)[0::2]
+	return sums // (bounds[1::2] - bounds[0::2])
+
+# Decode one window into the mean of each slot of the first whole frame
+# Returns None if the window does not contain enough transitions
+def decode_window(values, nsections=SECTIONS, nslots=SLOTS, thresh=THRESH):
+	sections = find_sections(values, nsections, thresh)
+	if(sections is None):
+		return None
+	return slot_means(values, sections, find_start(sections), nslots)
+
+# Decode one window into the zero level and the LED intensities above it
+# Returns None if the window does not contain enough transitions
+def decode_frame(values, nsections=SECTIONS, thresh=THRESH):
+	means = decode_window(values, nsections, SLOTS, thresh)
+	if(means is None):
+		return None
+	return means[0], means[1:] - means[0]
+
+# Derive the transition threshold from the signal instead of a fixed THRESH
+# The noise is estimated from the median sample-to-sample jump, since most
+# jumps are within a slot, and the smallest edge from the jumps well above
+# that noise. The threshold sits halfway up the smallest edge, but never
+# within NOISE_K standard deviations of the noise.
+# The jumps are taken in blocks of a fixed size, so the threshold changes
+# at the same points of the stream whatever the chunks fed are.
+class AdaptiveThreshold(object):
+	def __init__(self, thresh=THRESH, block=ADAPT_BLOCK):
+		self.thresh = float(thresh)
+		self.block = block
+		self.noise = None	# Standard deviation of the jump between samples
+		self.edge = None	# Smallest typical transition
+		self.pending = []	# Jumps of the block so far
+		self.count = 0		# Number of them
+
+	# Jumps still needed to complete the block
+	def room(self):
+		return self.block - self.count
+
+	# Add jumps, at most room() of them, updating once the block is complete
+	def add(self, jumps):
+		self.pending.append(jumps)
+		self.count += len(jumps)
+		if(self.count >= self.block):
+			self.update(np.concatenate(self.pending))
+			self.pending = []
+			self.count = 0
+		return self.thresh
+
+	# Update from the absolute jumps between consecutive samples of a block
+	def update(self, jumps):
+		if(len(jumps) < 2):
+			return self.thresh
+		first = self.noise is None
+		self.noise = 1.4826 * np.median(jumps)	# Median absolute deviation to standard deviation
+		floor = max(NOISE_K * self.noise, MIN_THRESH)
+		large = jumps[jumps > floor]
+		if(len(large) >= MIN_EDGES):
+			self.edge = np.percentile(large, EDGE_PERCENTILE)
+
+		if(self.edge is None):
+			target = floor
+		else:
+			target = max(floor, EDGE_FRACTION * self.edge)
+		if(first):
+			self.thresh = target
+		else:
+			self.thresh += THRESH_ALPHA * (target - self.thresh)
+		return self.thresh
+
+# Decode frames from a continuous stream of samples
+# Transitions and samples of a partial frame are kept between chunks, so
+# frames that straddle a chunk boundary are not lost. A frame starts at a
+# transition whose gap from the previous transition is longer than every
+# gap inside the frame.
+# With adaptive set, thresh is only the starting point for an AdaptiveThreshold.
+# Nothing older than KEEP_SPAN samples is kept, so a blocked receiver or a
+# dark room, which gives too few transitions for a frame, cannot make the
+# buffer grow.
+class StreamDecoder(object):
+	def __init__(self, nslots=SLOTS, thresh=THRESH, adaptive=False):
+		self.nslots = nslots
+		self.thresh = thresh
+		self.adaptive = None
+		if(adaptive):
+			self.adaptive = AdaptiveThreshold(thresh)
+		self.samples = np.zeros([0], dtype=np.int32)	# Samples from edges[0] onwards
+		self.base = 0		# Stream index of samples[0]
+		self.total = 0		# Samples fed so far
+		self.last = None	# Last sample fed, to find edges across chunks
+		self.edges = []		# Stream indices of transitions not yet used
+		self.frames = 0		# Frames decoded
+		self.since_frame = 0	# Samples fed since the last decoded frame
+		self.last_start = None	# Stream index of the last frame's first slot
+		self.periods = deque(maxlen=PERIOD_HISTORY)	# Samples between consecutive frames
+		self.layouts = deque(maxlen=PERIOD_HISTORY)	# Slot bounds of recent frames, from their first slot
+
+	# Add a chunk of samples and return the slot means of each frame completed
+	def feed(self, chunk):
+		chunk = np.asarray(chunk).astype(np.int32)
+		n = len(chunk)
+		if(n == 0):
+			return []
+
+		# Find the transitions, including one between the previous chunk and this one
+		if(self.last is None):
+			diffs = np.abs(chunk[1:] - chunk[:-1])
+			first = self.total + 1	# Stream index of the sample after diffs[0]
+		else:
+			diffs = np.abs(np.diff(chunk, prepend=self.last))
+			first = self.total
+		if(self.adaptive is None):
+			self.edges.extend(((diffs > self.thresh).nonzero()[0] + first).tolist())
+		else:
+			start = 0
+			while(start < len(diffs)): # Each piece up to the end of a threshold block
+				piece = diffs[start:start+self.adaptive.room()]
+				self.edges.extend(((piece > self.thresh).nonzero()[0] + first + start).tolist())
+				self.thresh = self.adaptive.add(piece)
+				start += len(piece)
+		self.last = chunk[-1]
+		self.samples = np.concatenate((self.samples, chunk))
+		self.total += n
+
+		# A frame needs the transition before it and two transitions per slot
+		frames = []
+		edges = self.edges
+		span = 2 * self.nslots
+		while(len(edges) > span):
+			gaps = np.diff(edges[:span+1])
+			if(gaps[0] > gaps[1:].max()):
+				bounds = np.array(edges[1:span+1]) - self.base
+				frames.append(slot_means(self.samples, bounds, 0, self.nslots))
+				self.layouts.append(bounds - bounds[0])
+				if(self.last_start is not None):
+					self.periods.append(edges[1] - self.last_start)
+				self.last_start = edges[1]
+				del edges[:span]
+			else:
+				del edges[0]
+
+		# Transitions too old to start a frame are dropped, and once nothing
+		# is left within KEEP_SPAN the search starts again from scratch
+		oldest = self.total - KEEP_SPAN
+		if(edges and edges[0] < oldest and self.periods):
+			oldest = self.total - max(KEEP_SPAN, 2 * self.frame_period())	# Frames measured longer than MAX_FRAME
+		if(edges and edges[0] < oldest):
+			del edges[:bisect_left(edges, oldest)]
+		if((self.last_start is not None) and (self.last_start < oldest)):
+			self.last_start = None
+
+		# Only keep the samples that a later frame could still use
+		if(edges):
+			keep = edges[0]
+		else:
+			keep = self.total
+		self.samples = self.samples[keep-self.base:]
+		self.base = keep
+
+		self.frames += len(frames)
+		if(frames):
+			self.since_frame = 0
+		else:
+			self.since_frame += n
+		return frames
+
+	# Forget the partial frame, e.g. before a chunk that does not follow on
+	# from the last one. The counters are kept.
+	def restart(self):
+		self.samples = self.samples[:0]
+		self.base = self.total
+		self.last = None
+		self.last_start = None
+		del self.edges[:]
+
+	# Median number of samples from one frame to the next, or None until known
+	# A missed frame doubles one period, which the median ignores
+	def frame_period(self):
+		if(not self.periods):
+			return None
+		return int(np.median(self.periods))
+
+	# Median slot bounds and frame period of recent frames, or None until known
+	# The bounds alternate between the first sample of a slot and the first
+	# sample after it, counted from the first slot
+	def frame_layout(self):
+		period = self.frame_period()
+		if(period is None):
+			return None
+		return np.median(np.array(self.layouts), axis=0).astype(int), period
+
+# Decode frames by correlating the stream against the known frame template
+# instead of looking for transitions. The template is +1 over the sync gap
+# and the gaps between slots, where every LED is on, and -1 over the slots,
+# less its mean. Its correlation with the samples peaks once per frame, at
+# the first slot, whatever the intensities, so the frame phase is found
+# from every sample of the frame rather than from a few jumps that noise
+# can hide or fake. Each slot is then integrated, less the MATCH_TRIM
+# samples at its ends.
+# A frame is only accepted if every slot is below the gap level by NOISE_K
+# standard deviations of the noise, so noise alone gives no frames.
+# bounds and period describe the frame as StreamDecoder.frame_layout() does.
+# The correlation peak is searched for over a whole period, starting half a
+# period after the last frame, so the real period may differ by up to half.
+# Raises ValueError if the slots do not fit in order inside one period, as
+# a layout learnt from noisy edges may not
+class MatchedDecoder(object):
+	def __init__(self, bounds, period):
+		bounds = np.asarray(bounds, dtype=int)
+		if((bounds.ndim != 1) or (len(bounds) < 2) or (len(bounds) % 2 != 0)):
+			raise ValueError("A frame layout needs a start and an end for each slot")
+		if((bounds[0] < 0) or np.any(np.diff(bounds) <= 0) or (bounds[-1] >= period)):
+			raise ValueError("Frame layout " + str(bounds.tolist()) + " does not fit in order inside a period of " + str(period) + " samples")
+		self.bounds = bounds
+		self.nslots = len(bounds) // 2
+		self.period = int(period)
+		self.template = np.ones([self.period])
+		self.trimmed = bounds.copy()
+		for i in range(self.nslots):
+			self.template[bounds[2*i]:bounds[2*i+1]] = -1
+			if(bounds[2*i+1] - bounds[2*i] > 2 * MATCH_TRIM):
+				self.trimmed[2*i] += MATCH_TRIM
+				self.trimmed[2*i+1] -= MATCH_TRIM
+		self.gaps = self.template > 0
+		self.template -= self.template.mean()
+		self.thresh = MIN_THRESH	# Smallest drop from the gap level accepted as a slot
+		self.samples = np.zeros([0], dtype=np.int32)	# Samples not yet searched
+		self.base = 0		# Stream index of samples[0]
+		self.total = 0		# Samples fed so far
+		self.frames = 0		# Frames decoded
+		self.rejected = 0	# Correlation peaks rejected as noise
+		self.since_frame = 0	# Samples fed since the last decoded frame
+		self.last_start = None	# Stream index of the last frame's first slot
+		self.periods = deque(maxlen=PERIOD_HISTORY)	# Samples between consecutive frames
+
+	# Add a chunk of samples and return the slot means of each frame completed
+	def feed(self, chunk):
+		chunk = np.asarray(chunk).astype(np.int32)
+		n = len(chunk)
+		if(n == 0):
+			return []
+		self.samples = np.concatenate((self.samples, chunk))
+		self.total += n
+
+		# Correlate once per chunk, then search one period at a time
+		frames = []
+		samples = self.samples
+		period = self.period
+		pos = 0
+		if(len(samples) >= 2 * period - 1):
+			corr = np.correlate(samples, self.template, "valid")
+			while(pos + 2 * period - 1 <= len(samples)):
+				k = pos + int(corr[pos:pos+period].argmax())
+				means = self.integrate(samples[k:k+period])
+				if(means is None):
+					self.rejected += 1
+					pos += period
+					continue
+				frames.append(means)
+				start = self.base + k
+				if(self.last_start is not None):
+					self.periods.append(start - self.last_start)
+				self.last_start = start
+				pos = k + period // 2
+
+		self.samples = samples[pos:]
+		self.base += pos
+
+		self.frames += len(frames)
+		if(frames):
+			self.since_frame = 0
+		else:
+			self.since_frame += n
+		return frames
+
+	# Slot means of one period of samples starting at the first slot, or None
+	# if any slot is not clearly below the gap level
+	def integrate(self, frame):
+		means = slot_means(frame, self.trimmed, 0, self.nslots)
+		noise = 1.4826 * np.median(np.abs(np.diff(frame))) / np.sqrt(2)	# Standard deviation of one sample
+		self.thresh = max(NOISE_K * noise, MIN_THRESH)
+		if(frame[self.gaps].mean() - means.max() < self.thresh):
+			return None
+		return means
+
+	# Forget the samples not yet searched, e.g. before a chunk that does not
+	# follow on from the last one. The counters are kept.
+	def restart(self):
+		self.samples = self.samples[:0]
+		self.base = self.total
+		self.last_start = None
+
+	# Median number of samples from one frame to the next, or None until known
+	def frame_period(self):
+		if(not self.periods):
+			return None
+		return int(np.median(self.periods))
+
+# Settings a decoder was created with, as a dict that can be stored as JSON
+# Call before feeding it, as an adaptive threshold moves from its start
+def decoder_settings(decoder):
+	if(isinstance(decoder, MatchedDecoder)):
+		return {"decoder": "matched", "slots": decoder.nslots, "bounds": decoder.bounds.tolist(), "period": decoder.period}
+	return {"decoder": "edge", "slots": decoder.nslots, "thresh": decoder.thresh, "adaptive": decoder.adaptive is not None}
+
+# A new decoder with the settings decoder_settings() returned
+def make_decoder(settings):
+	if(settings["decoder"] == "matched"):
+		return MatchedDecoder(settings["bounds"], settings["period"])
+	if(settings["decoder"] == "edge"):
+		return StreamDecoder(settings["slots"], settings["thresh"], settings["adaptive"])
+	raise ValueError("Unknown decoder: " + str(settings["decoder"]))
+
+# Learn the frame layout for a MatchedDecoder by decoding frames with the edge decoder
+# Returns (bounds, period) once decoder has decoded nframes frames, or None
+# if timeout samples pass without a frame or the chunks run out
+def learn_layout(chunks, decoder, nframes=LAYOUT_FRAMES, timeout=None):
+	for chunk in chunks:
+		if(chunk is None):
+			decoder.restart()
+			continue
+		decoder.feed(chunk)
+		if(decoder.frames >= nframes):
+			return decoder.frame_layout()
+		if((timeout is not None) and (decoder.since_frame >= timeout)):
+			return None
+	return None
+
+# Decode the slot means of every frame in a stream of chunks
+# A chunk of None marks samples missing from the stream (see
+# Acquirer.windows), and the partial frame before it is dropped
+# Yields None whenever timeout samples pass without a complete frame
+# Pass a decoder to use its settings, or to read its frame period
+# It can be a StreamDecoder or a MatchedDecoder
+def stream_slots(chunks, nslots=SLOTS, thresh=THRESH, timeout=None, stats=NULL_STATS, decoder=None):
+	if(decoder is None):
+		decoder = StreamDecoder(nslots, thresh)
+	for chunk in chunks:
+		if(chunk is None):
+			decoder.restart()
+			continue
+		start = stats.now()
+		frames = decoder.feed(chunk)
+		stats.record("decode", start)
+		for means in frames:
+			yield means
+		if((timeout is not None) and (decoder.since_frame >= timeout)):
+			decoder.since_frame = 0
+			yield None
+
+# Decode a stream of chunks into one (zero_level, I1, ..., IN) tuple per frame
+# N is one less than the decoder's slots
+# Yields None whenever timeout samples pass without a complete frame
+def stream_frames(chunks, thresh=THRESH, timeout=None, stats=NULL_STATS, decoder=None):
+	for means in stream_slots(chunks, SLOTS, thresh, timeout, stats, decoder):
+		if(means is None):
+			yield None
+		else:
+			yield (means[0],) + tuple(means[1:] - means[0])
+
+# Decode a stream of multi-channel windows, one row of samples per channel,
+# with a separate StreamDecoder for each channel
+# Set continuous to False if the rows of consecutive windows do not follow
+# on from each other (burst scanning), so no frame straddles two windows
+# A scan of None marks scans missing from the stream, as in stream_slots()
+# Yields (channel index, (zero_level, I1, ..., IN)) per frame, or
+# (channel index, None) whenever timeout samples of a channel pass without a frame
+# Pass one decoder per channel to use their settings, or to read their frame periods
+def scan_frames(scans, nchannels, thresh=THRESH, timeout=None, continuous=True, stats=NULL_STATS, decoders=None):
+	if(decoders is None):
+		decoders = [StreamDecoder(SLOTS, thresh) for c in range(nchannels)]
+	for scan in scans:
+		if(scan is None):
+			for decoder in decoders:
+				decoder.restart()
+			continue
+		for c, decoder in enumerate(decoders):
+			if(not continuous):
+				decoder.restart()
+			start = stats.now()
+			frames = decoder.feed(scan[c])
+			stats.record("decode", start)
+			for means in frames:
+				yield c, (means[0],) + tuple(means[1:] - means[0])
+			if((timeout is not None) and (decoder.since_frame >= timeout)):
+				decoder.since_frame = 0
+				yield c, None
+
+# Add the --leds option of the scripts
+def add_led_args(parser):
+	parser.add_argument("--leds", type=int, default=LEDS, metavar="N", help="LEDs taking turns in each frame (default: %(default)s)")
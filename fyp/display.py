@@ -0,0 +1,102 @@
+import threading
+from .lcd import LCD, LCD_CHR, LCD_CMD
+from .stats import NULL_STATS
+
+# LCD constants
+LCD_WIDTH = 16			# Maximum characters per line
+LCD_LINES = (0x80, 0xC0)	# LCD RAM address of each line
+
+# Drive a 2x16 HD44780 from a background thread
+# Callers only update a shadow of the requested text, which never blocks
+# on the LCD. The thread always draws the newest requested frame, so
+# rapid updates are coalesced, and only rewrites the cells that differ
+# from what is already on the screen.
+class Display(threading.Thread):
+	def __init__(self, lcd_byte, width=LCD_WIDTH, lines=LCD_LINES, stats=NULL_STATS):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.stats = stats
+		self.lcd_byte = lcd_byte
+		self.width = width
+		self.lines = lines
+		self.requested = [" " * width for line in lines]	# Newest text asked for
+		self.shadow = [" " * width for line in lines]		# Text on the screen
+		self.dirty = False
+		self.lock = threading.Lock()
+		self.changed = threading.Event()
+		self.frames = 0		# Frames drawn
+		self.coalesced = 0	# Frames replaced before they were drawn
+		self.writes = 0		# Bytes sent to the LCD
+		self.bus = None		# GPIO bus of the LCD, for its call counter
+
+	# Request new text for some of the lines, e.g. show("Invalid", "conditions")
+	# Lines given as None keep their current text
+	def show(self, *messages):
+		with self.lock:
+			if(self.dirty):
+				self.coalesced += 1
+			for line, message in enumerate(messages):
+				if(message is not None):
+					self.requested[line] = message.ljust(self.width, " ")[:self.width]
+			self.dirty = True
+		self.changed.set()
+
+	# Request new text for a single line
+	def write(self, line, message):
+		messages = [None] * len(self.lines)
+		messages[line] = message
+		self.show(*messages)
+
+	def run(self):
+		while True:
+			self.changed.wait()
+			self.changed.clear()
+			with self.lock:
+				frame = list(self.requested)
+				self.dirty = False
+			start = self.stats.now()
+			self.draw(frame)
+			self.stats.record("lcd", start)
+
+	# Write the cells of frame that differ from the shadow
+	# Changed cells separated by a single unchanged cell are written as one
+	# run, since rewriting that cell costs the same as moving the cursor
+	def draw(self, frame):
+		lcd_byte = self.lcd_byte
+		for line in range(len(self.lines)):
+			text = frame[line]
+			shadow = self.shadow[line]
+			changed = [col for col in range(self.width) if text[col] != shadow[col]]
+			run_start = 0
+			while(run_start < len(changed)):
+				run_end = run_start
+				while((run_end + 1 < len(changed)) and (changed[run_end+1] - changed[run_end] <= 2)):
+					run_end += 1
+				first = changed[run_start]
+				last = changed[run_end]
+				lcd_byte(self.lines[line] + first, LCD_CMD)	# Move the cursor
+				for col in range(first, last + 1):
+					lcd_byte(ord(text[col]), LCD_CHR)
+				self.writes += last - first + 2
+				run_start = run_end + 1
+			self.shadow[line] = text
+		self.frames += 1
+
+# Set up the LCD on its GPIO pins and start a Display thread driving it
+def start_display(stats=NULL_STATS):
+	lcd = LCD()
+	lcd.init()
+	display = Display(lcd.byte, LCD_WIDTH, LCD_LINES, stats)
+	display.bus = lcd.bus
+	display.start()
+	return display
+
+# Intensities as the scripts print them, e.g. "1:\t200 \t2:\t150 \t3:\t250"
+def intensity_text(x0):
+	return " \t".join(str(i + 1) + ":\t" + str(v) for i, v in enumerate(x0))
+
+# Intensities over the two LCD lines, the first half on the top line
+def intensity_lines(x0):
+	cells = [str(i + 1) + ":" + str(v) for i, v in enumerate(x0)]
+	half = (len(cells) + 1) // 2
+	return " ".join(cells[:half]), " ".join(cells[half:])
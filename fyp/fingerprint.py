@@ -0,0 +1,193 @@
+import itertools
+import json
+import os
+import time
+import numpy as np
+from .calibration import run_fast_calibration, X_MIN, X_MAX, Y_MIN, Y_MAX
+
+# Fingerprint constants
+FP_VERSION = 1			# Bump when the stored format changes
+FP_FILE = "fingerprints.json"
+NEIGHBOURS = 4			# Fingerprints interpolated between for each position
+INDEX_BACKENDS = ("kdtree", "grid")
+SURVEY_STEPS = 5		# Survey points along each side of the area
+CELL_FEATURES = 4		# Fingerprints per cell of the grid index, on average
+
+# Nearest neighbours through scipy's cKDTree
+# scipy is imported here, not at the top, so the grid index works without it
+class KDTreeIndex(object):
+	def __init__(self, features):
+		from scipy.spatial import cKDTree
+		self.tree = cKDTree(features)
+
+	# Distances and indices of the k nearest features to each row of points
+	def query(self, points, k):
+		d, i = self.tree.query(points, k)
+		return np.asarray(d).reshape(len(points), k), np.asarray(i).reshape(len(points), k)
+
+# Nearest neighbours through a precomputed grid of cells, about CELL_FEATURES
+# features per cell. Cells are searched in growing shells around the query's
+# cell until no unsearched cell can be nearer than the k'th neighbour found.
+# The features in and next to each cell are gathered once and kept, so most
+# queries are one vectorised distance calculation.
+class GridIndex(object):
+	def __init__(self, features):
+		self.features = np.asarray(features, dtype=float)
+		self.lo = self.features.min(axis=0)
+		span = self.features.max(axis=0) - self.lo
+		span[span == 0] = 1
+		self.cells = max(1, int(np.ceil((float(len(self.features)) / CELL_FEATURES) ** (1.0 / self.features.shape[1]))))
+		self.width = span / self.cells
+		self.buckets = {}
+		for i, cell in enumerate(self.cell_of(self.features)):
+			self.buckets.setdefault(tuple(cell), []).append(i)
+		self.shells = []	# Cell offsets at each Chebyshev distance, built on demand
+		self.near = {}		# Cell -> features in it and the cells next to it
+
+	def cell_of(self, points):
+		return np.clip(((points - self.lo) / self.width).astype(int), 0, self.cells - 1)
+
+	def shell(self, r):
+		while(len(self.shells) <= r):
+			n = len(self.shells)
+			dims = self.features.shape[1]
+			self.shells.append([o for o in itertools.product(range(-n, n + 1), repeat=dims) if max(abs(x) for x in o) == n])
+		return self.shells[r]
+
+	# Indices of the features in the cells r cells from cell
+	def gather(self, cell, r):
+		found = []
+		for offset in self.shell(r):
+			found.extend(self.buckets.get(tuple(cell + offset), ()))
+		return found
+
+	# Distances and indices of the k nearest features to each row of points
+	def query(self, points, k):
+		points = np.asarray(points, dtype=float)
+		k = min(k, len(self.features))
+		dist = np.zeros([len(points), k])
+		index = np.zeros([len(points), k], dtype=int)
+		step = self.width.min()
+		for p, (point, cell) in enumerate(zip(points, self.cell_of(points))):
+			key = tuple(cell)
+			found = self.near.get(key)
+			if(found is None):
+				found = self.near[key] = np.array(self.gather(cell, 0) + self.gather(cell, 1), dtype=int)
+			r = 1
+			while True:
+				if((len(found) >= k) or (r >= self.cells)):
+					d = np.sqrt(np.sum((self.features[found] - point) ** 2, axis=1))
+					nearest = np.argsort(d)[:k]
+					if((r >= self.cells) or (d[nearest[-1]] <= r * step)):
+						break
+				r += 1
+				found = np.concatenate((found, np.array(self.gather(cell, r), dtype=int)))
+			dist[p] = d[nearest]
+			index[p] = found[nearest]
+		return dist, index
+
+# Pick an index backend: the KD-tree if scipy is installed, otherwise the grid
+def make_index(features, backend=None):
+	if(backend is None):
+		try:
+			return KDTreeIndex(features)
+		except ImportError:
+			return GridIndex(features)
+	if(backend == "kdtree"):
+		return KDTreeIndex(features)
+	elif(backend == "grid"):
+		return GridIndex(features)
+	raise ValueError("Unknown index backend: " + str(backend))
+
+# Intensities -> position by lookup in a table of surveyed fingerprints
+# Each intensity is scaled by its spread over the table, so every LED counts
+# equally in the distance. A position is the inverse-distance weighted mean
+# of the k nearest fingerprints, or a fingerprint's own position when the
+# intensities match it exactly. Unlike the polynomial, any number of
+# points can be used, and positions stay inside the surveyed area.
+class FingerprintMap(object):
+	def __init__(self, intensities, x, y, k=NEIGHBOURS, backend=None):
+		self.intensities = np.asarray(intensities, dtype=float)
+		self.points = np.column_stack((x, y)).astype(float)
+		self.scale = self.intensities.std(axis=0)
+		self.scale[self.scale == 0] = 1
+		self.k = min(k, len(self.points))
+		self.index = make_index(self.intensities / self.scale, backend)
+
+	# Positions of a batch of intensities, one row of (I1, ..., IN) each
+	# Returns one row of (x, y) per row of intensities
+	def locate(self, intensities):
+		features = np.asarray(intensities, dtype=float).reshape(-1, self.intensities.shape[1]) / self.scale
+		dist, index = self.index.query(features, self.k)
+		weights = 1.0 / np.maximum(dist, 1e-9)
+		weights /= weights.sum(axis=1)[:, None]
+		return np.einsum("nk,nkd->nd", weights, self.points[index])
+
+	# Position of one set of intensities, as evaluate_position() returns it
+	def position(self, x0):
+		x, y = self.locate(x0)[0]
+		return x, y
+
+# Survey points covering the calibrated area in a square grid
+def survey_points(steps=SURVEY_STEPS):
+	x, y = np.meshgrid(np.linspace(X_MIN, X_MAX, steps), np.linspace(Y_MIN, Y_MAX, steps))
+	return x.ravel(), y.ravel()
+
+# Save fingerprints, replacing any earlier file in one step
+def save_fingerprints(path, intensities, x, y, thresh):
+	data = {
+		"version": FP_VERSION,
+		"timestamp": time.time(),
+		"thresh": thresh,
+		"intensities": np.asarray(intensities).tolist(),
+		"x": np.asarray(x).tolist(),
+		"y": np.asarray(y).tolist(),
+	}
+	tmp = path + ".tmp"
+	with open(tmp, "w") as f:
+		json.dump(data, f, indent=1, separators=(",", ": "))
+	os.rename(tmp, path)
+
+# Load fingerprints saved with the same format and threshold, and with the
+# same number of LEDs if it is given
+# Returns (timestamp, intensities, x, y), or None if there are no usable fingerprints
+def load_fingerprints(path, thresh, leds=None):
+	try:
+		with open(path) as f:
+			data = json.load(f)
+	except (IOError, ValueError):
+		return None
+
+	try:
+		if(data["version"] != FP_VERSION or data["thresh"] != thresh):
+			return None
+		intensities = np.array(data["intensities"], dtype=float)
+		x = np.array(data["x"], dtype=float)
+		y = np.array(data["y"], dtype=float)
+	except (KeyError, TypeError, ValueError):
+		return None
+
+	if(intensities.ndim != 2 or len(intensities) == 0 or len(x) != len(intensities) or len(y) != len(intensities)):
+		return None
+	if((leds is not None) and intensities.shape[1] != leds):
+		return None
+	return data["timestamp"], intensities, x, y
+
+# Use the fingerprints stored in path unless resurvey is set, otherwise
+# survey them with the fast calibration routine and store them
+# frames(position) returns the stream of frames received at each point
+# Returns a FingerprintMap
+def load_or_survey(path, thresh, resurvey, display, frames, prefix="", backend=None, leds=None):
+	stored = None
+	if(not resurvey):
+		stored = load_fingerprints(path, thresh, leds)
+
+	if(stored is not None):
+		timestamp, intensities, x, y = stored
+		print "Loaded", len(x), "fingerprints from", path, "made", time.ctime(timestamp)
+	else:
+		x, y = survey_points()
+		print "Beginning survey of", len(x), "points! Hold the receiver still at each point"
+		intensities = run_fast_calibration(display, frames, prefix, x, y)
+		save_fingerprints(path, intensities, x, y, thresh)
+	return FingerprintMap(intensities, x, y, backend=backend)
@@ -0,0 +1,12 @@
+# wiringPi is only imported and set up the first time a driver needs the
+# GPIO, so importing the package never requires the hardware
+wp = None
+
+# Return the wiringPi module, setting up the GPIO pins on the first call
+def wiringpi():
+	global wp
+	if(wp is None):
+		import wiringpi2
+		wiringpi2.wiringPiSetup() # Prepares the RPi GPIO pins
+		wp = wiringpi2
+	return wp
@@ -0,0 +1,215 @@
+import json
+import os
+import time
+import numpy as np
+from .calibration import measure_calibration, X_CAL, Y_CAL
+
+# Lambertian model constants
+LB_VERSION = 1			# Bump when the stored format changes
+LB_FILE = "lambertian.json"
+HEIGHT = 4.0			# Height of the LEDs above the receiver, in the units of X_CAL and Y_CAL
+HALF_ANGLE = 60.0		# Half-power semi-angle of the LEDs, in degrees
+GN_ITERATIONS = 20		# Most Gauss-Newton steps per solve
+GN_TOLERANCE = 1e-4		# Solving stops once no estimate moves further than this
+GN_DAMPING = 1e-6		# Added to the normal equations, so every step can be solved
+MAX_STEP = 1.0			# Longest move of an estimate in one step, in the units of X_CAL and Y_CAL
+
+# Lambertian order of an LED from its half-power semi-angle
+def lambertian_order(half_angle=HALF_ANGLE):
+	return -np.log(2) / np.log(np.cos(np.radians(half_angle)))
+
+# Received intensity of each LED at each position, for LEDs facing down at
+# height above a receiver facing up:
+# I = gain * (m+1)/(2 pi) * cos^m(phi) * cos(psi) / d^2, with cos(phi) = cos(psi) = height/d
+# positions is (n x 2) and leds is (N x 2); returns (n x N)
+def model_intensities(positions, leds, gains, height=HEIGHT, order=1.0):
+	positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+	leds = np.asarray(leds, dtype=float)
+	d2 = ((positions[:, None, :] - leds[None, :, :]) ** 2).sum(axis=2) + height ** 2
+	return np.asarray(gains) * (order + 1) / (2 * np.pi) * height ** (order + 1) / d2 ** ((order + 3) / 2.0)
+
+# Weighted centroid of the LEDs, as a starting point for solve_positions()
+# The brightest LEDs are nearest, so the intensities are squared to pull the
+# start towards them
+def centroid(intensities, leds):
+	weights = np.maximum(intensities, 1e-9) ** 2
+	return np.dot(weights, leds) / weights.sum(axis=1)[:, None]
+
+# Weights of the log residuals: with shot noise, the log of a reading I
+# has a variance of about 1/I, so each is weighted by I, and readings at
+# the noise floor barely count. Weighting by I^2, as for fixed noise, lets
+# the brightest LED drown out the rest and leaves false minima.
+def log_weights(intensities):
+	return np.maximum(intensities, 1.0)
+
+# Shorten each row of steps to at most MAX_STEP, so a poor starting point
+# cannot throw an estimate far off
+def limit_steps(steps):
+	length = np.sqrt((steps[:, :2] ** 2).sum(axis=1))
+	return steps * np.minimum(1.0, MAX_STEP / np.maximum(length, 1e-12))[:, None]
+
+# Positions of a batch of frames of N intensities each, by weighted
+# Gauss-Newton least squares on the log of the model, so that a gain error
+# moves every residual equally instead of weighting the brightest LED
+# The frames are solved together: each step builds and solves every
+# frame's 2x2 normal equations at once. Frames stop counting once
+# their step is under GN_TOLERANCE.
+# intensities is (n x N) with N >= 2, and log_gains holds each LED's log
+# of gain * (m+1)/(2 pi) * height^(m+1); returns (n x 2)
+def solve_positions(intensities, leds, log_gains, height=HEIGHT, order=1.0, start=None):
+	intensities = np.asarray(intensities, dtype=float).reshape(-1, len(leds))
+	leds = np.asarray(leds, dtype=float)
+	measured = np.log(np.maximum(intensities, 1.0)) - log_gains
+	weights = log_weights(intensities)
+	damping = GN_DAMPING * weights.sum(axis=1)
+	k = (order + 3) / 2.0
+	p = centroid(intensities, leds) if start is None else np.array(start, dtype=float).reshape(-1, 2)
+	x = p[:, 0]
+	y = p[:, 1]
+	active = np.arange(len(p))
+	for i in range(GN_ITERATIONS):
+		dx = x[active, None] - leds[:, 0]		# (n x N)
+		dy = y[active, None] - leds[:, 1]
+		d2 = dx * dx + dy * dy + height ** 2
+		residual = measured[active] + k * np.log(d2)
+		slope = -2 * k / d2				# Jacobian is slope * (dx, dy)
+		wj = weights[active] * slope
+		wjj = wj * slope
+		a = (wjj * dx * dx).sum(axis=1) + damping[active]	# Normal equations [[a, b], [b, c]] step = [gx, gy],
+		b = (wjj * dx * dy).sum(axis=1)				# solved directly as they are only 2x2
+		c = (wjj * dy * dy).sum(axis=1) + damping[active]
+		gx = (wj * dx * residual).sum(axis=1)
+		gy = (wj * dy * residual).sum(axis=1)
+		det = a * c - b * b
+		sx = (c * gx - b * gy) / det
+		sy = (a * gy - b * gx) / det
+		scale = np.minimum(1.0, MAX_STEP / np.maximum(np.sqrt(sx * sx + sy * sy), 1e-12))
+		x[active] += sx * scale
+		y[active] += sy * scale
+		active = active[np.maximum(np.abs(sx), np.abs(sy)) * scale >= GN_TOLERANCE]
+		if(len(active) == 0):
+			break
+	return p
+
+# Fit each LED's position and log gain to the intensities it gave at the
+# calibration points, by Gauss-Newton least squares as in solve_positions()
+# Every LED is fitted separately, so all their 3x3 normal equations are
+# solved at once. The fit starts from the calibration point each LED is
+# brightest at, unless start gives positions for them.
+# I_cal is (points x N); returns the LED positions (N x 2) and log gains (N)
+def fit_leds(I_cal, x_cal, y_cal, height=HEIGHT, order=1.0, start=None):
+	I_cal = np.asarray(I_cal, dtype=float)
+	points = np.column_stack((x_cal, y_cal)).astype(float)
+	measured = np.log(np.maximum(I_cal, 1.0)).T				# (N x points)
+	weights = log_weights(I_cal).T
+	k = (order + 3) / 2.0
+	leds = points[np.argmax(I_cal, axis=0)] if start is None else np.array(start, dtype=float)
+	d2 = ((points[None, :, :] - leds[:, None, :]) ** 2).sum(axis=2) + height ** 2
+	log_gains = ((measured + k * np.log(d2)) * weights).sum(axis=1) / weights.sum(axis=1)	# Best gains for the starting positions
+	for i in range(GN_ITERATIONS):
+		delta = points[None, :, :] - leds[:, None, :]		# (N x points x 2)
+		d2 = (delta ** 2).sum(axis=2) + height ** 2
+		residual = measured - (log_gains[:, None] - k * np.log(d2))
+		jacobian = np.concatenate((2 * k * delta / d2[:, :, None], np.ones(d2.shape + (1,))), axis=2)
+		weighted = jacobian * weights[:, :, None]
+		normal = np.einsum("npi,npj->nij", weighted, jacobian) + GN_DAMPING * np.eye(3) * weights.sum(axis=1)[:, None, None]
+		step = limit_steps(np.linalg.solve(normal, np.einsum("npi,np->ni", weighted, residual)[:, :, None])[:, :, 0])
+		leds += step[:, :2]
+		log_gains += step[:, 2]
+		if(np.abs(step[:, :2]).max() < GN_TOLERANCE):
+			break
+	return leds, log_gains
+
+# Intensities -> position through a Lambertian path-loss model of each LED
+# Any number of LEDs, two or more, is handled by the same code: the LED
+# positions and gains are fitted to the calibration points, and positions
+# are solved by least squares over all the intensities of a frame.
+class LambertianModel(object):
+	def __init__(self, leds, log_gains, height=HEIGHT, order=1.0):
+		self.leds = np.asarray(leds, dtype=float)
+		self.log_gains = np.asarray(log_gains, dtype=float)
+		self.height = height
+		self.order = order
+		self.last = None	# Position of the last frame, the start of the next solve
+
+	# Positions of a batch of intensities, one row of (I1, ..., IN) each
+	# Returns one row of (x, y) per row of intensities
+	def locate(self, intensities, start=None):
+		return solve_positions(intensities, self.leds, self.log_gains, self.height, self.order, start)
+
+	# Position of one set of intensities, as evaluate_position() returns it
+	# Each solve starts from the last position, which is usually a step or two away
+	def position(self, x0):
+		p = self.locate(x0, self.last)[0]
+		self.last = p
+		return p[0], p[1]
+
+	# Intensities the model expects at each position, (n x N)
+	def intensities(self, positions):
+		positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+		d2 = ((positions[:, None, :] - self.leds[None, :, :]) ** 2).sum(axis=2) + self.height ** 2
+		return np.exp(self.log_gains - (self.order + 3) / 2.0 * np.log(d2))
+
+# Save a fitted model with the intensities it was fitted to, replacing any
+# earlier file in one step
+def save_model(path, model, I_cal, x_cal, y_cal, thresh):
+	data = {
+		"version": LB_VERSION,
+		"timestamp": time.time(),
+		"thresh": thresh,
+		"height": model.height,
+		"order": model.order,
+		"leds": model.leds.tolist(),
+		"log_gains": model.log_gains.tolist(),
+		"I_cal": np.asarray(I_cal).tolist(),
+		"x_cal": np.asarray(x_cal).tolist(),
+		"y_cal": np.asarray(y_cal).tolist(),
+	}
+	tmp = path + ".tmp"
+	with open(tmp, "w") as f:
+		json.dump(data, f, indent=1, separators=(",", ": "))
+	os.rename(tmp, path)
+
+# Load a model fitted with the same format, threshold, geometry and number of LEDs
+# Returns (timestamp, model), or None if there is no usable model
+def load_model(path, thresh, leds, height=HEIGHT, order=1.0):
+	try:
+		with open(path) as f:
+			data = json.load(f)
+	except (IOError, ValueError):
+		return None
+
+	try:
+		if(data["version"] != LB_VERSION or data["thresh"] != thresh):
+			return None
+		if(data["height"] != height or data["order"] != order):
+			return None
+		positions = np.array(data["leds"], dtype=float)
+		log_gains = np.array(data["log_gains"], dtype=float)
+	except (KeyError, TypeError, ValueError):
+		return None
+
+	if(positions.shape != (leds, 2) or log_gains.shape != (leds,)):
+		return None
+	return data["timestamp"], LambertianModel(positions, log_gains, height, order)
+
+# Use the model stored in path unless recalibrate is set, otherwise measure
+# the calibration points as load_or_calibrate() does, fit the model to them
+# and store it
+# Returns a LambertianModel
+def load_or_fit(path, leds, thresh, recalibrate, display, measure, prefix="", frames=None, height=HEIGHT, half_angle=HALF_ANGLE):
+	order = lambertian_order(half_angle)
+	stored = None
+	if(not recalibrate):
+		stored = load_model(path, thresh, leds, height, order)
+
+	if(stored is not None):
+		timestamp, model = stored
+		print "Loaded the model of", leds, "LEDs from", path, "made", time.ctime(timestamp)
+	else:
+		I_cal = measure_calibration(display, measure, prefix, frames)
+		positions, log_gains = fit_leds(I_cal, X_CAL, Y_CAL, height, order)
+		model = LambertianModel(positions, log_gains, height, order)
+		save_model(path, model, I_cal, X_CAL, Y_CAL, thresh)
+	print "LEDs at", model.leds.tolist()
+	return model
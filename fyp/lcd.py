@@ -0,0 +1,234 @@
+import ctypes
+import mmap
+import os
+import time
+from .gpio import wiringpi
+from .stats import monotonic
+
+# Define the LCD pins
+LCD_RS = 7
+LCD_E  = 2
+LCD_D4 = 13
+LCD_D5 = 14
+LCD_D6 = 12
+LCD_D7 = 3
+
+# LCD constants
+LCD_CHR = 1
+LCD_CMD = 0
+
+# Timing constants, the HD44780 datasheet minimums
+E_PULSE = 0.00000045	# Enable high time (PWEH)
+E_CYCLE = 0.000001	# Time from one rise of E to the next (tcycE)
+EXEC_TIME = 0.000037	# Execution time of a data write and of most instructions
+CLEAR_TIME = 0.00152	# Execution time of clear display and return home
+INIT_TIME = 0.0041	# Wait after the first wake-up nibble
+WAKE_TIME = 0.0001	# Wait after the second wake-up nibble
+# The wake-up nibbles, each a whole instruction while the LCD may still be
+# in 8-bit mode, and the wait after each: function set three times, then 4-bit mode
+WAKE_NIBBLES = ((0x3, INIT_TIME), (0x3, WAKE_TIME), (0x3, EXEC_TIME), (0x2, EXEC_TIME))
+SPIN_LIMIT = 0.0002	# Longer waits sleep, shorter ones spin, as sleep() overshoots by more than this
+
+# GPIO bus constants
+LCD_BUS = None		# "gpiomem", "wiringpi" or "fake"; None uses /dev/gpiomem if it can be opened
+LCD_BUSES = ("gpiomem", "wiringpi", "fake")
+GPIO_MEM = "/dev/gpiomem"	# The GPIO registers, mappable without root
+GPFSEL0 = 0x00		# Function select registers, 3 bits per pin
+GPSET0 = 0x1C		# Writing a 1 sets that pin
+GPCLR0 = 0x28		# Writing a 1 clears that pin
+# BCM GPIO number of each wiringPi pin, 0-16
+WPI_TO_BCM = (17, 18, 27, 22, 23, 24, 25, 4, 2, 3, 8, 7, 10, 9, 11, 14, 15)
+
+# Wait until the monotonic time deadline
+def wait_until(deadline):
+	remaining = deadline - monotonic()
+	if(remaining > SPIN_LIMIT):
+		time.sleep(remaining - SPIN_LIMIT)
+	while(monotonic() < deadline):
+		pass
+
+# Drives GPIO pins through the GPIO registers mapped from /dev/gpiomem
+# Every pin in a set mask goes high in one register write, and every pin in
+# a clear mask goes low in another, however many pins there are. Each write
+# is a single 32-bit store through ctypes, as the registers must not be
+# written a byte at a time.
+# Raises IOError or OSError if /dev/gpiomem cannot be opened
+class GpioMemBus(object):
+	def __init__(self):
+		fd = os.open(GPIO_MEM, os.O_RDWR | os.O_SYNC)
+		try:
+			self.map = mmap.mmap(fd, mmap.PAGESIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+		finally:
+			os.close(fd)
+		self.set_reg = ctypes.c_uint32.from_buffer(self.map, GPSET0)
+		self.clr_reg = ctypes.c_uint32.from_buffer(self.map, GPCLR0)
+		self.calls = 0		# Register writes
+
+	# Make each BCM pin an output
+	def setup(self, pins):
+		for pin in pins:
+			fsel = ctypes.c_uint32.from_buffer(self.map, GPFSEL0 + 4 * (pin // 10))
+			shift = 3 * (pin % 10)
+			fsel.value = (fsel.value & ~(7 << shift)) | (1 << shift)
+			del fsel
+
+	# Set the pins in set_mask and clear the pins in clr_mask
+	def write(self, set_mask, clr_mask):
+		if(clr_mask):
+			self.clr_reg.value = clr_mask
+			self.calls += 1
+		if(set_mask):
+			self.set_reg.value = set_mask
+			self.calls += 1
+
+# Drives GPIO pins through wiringPi, one digitalWrite() per pin
+# Used where /dev/gpiomem is not available. The level of every pin is
+# kept, so only the pins that change are written, and the pins of each
+# pair of changes are worked out once and kept.
+class WiringPiBus(object):
+	def __init__(self):
+		self.wp = wiringpi()
+		self.wpi = dict((bcm, pin) for pin, bcm in enumerate(WPI_TO_BCM))
+		self.writes = {}	# (set_mask, clr_mask) -> [(wiringPi pin, level)]
+		self.level = 0		# Level of the pins set up, as last written
+		self.calls = 0		# digitalWrite() calls
+
+	# Make each BCM pin an output, starting low
+	def setup(self, pins):
+		for pin in pins:
+			self.wp.pinMode(self.wpi[pin], 1)
+			self.wp.digitalWrite(self.wpi[pin], 0)
+			self.level &= ~(1 << pin)
+
+	def write(self, set_mask, clr_mask):
+		set_mask &= ~self.level
+		clr_mask &= self.level
+		self.level = (self.level | set_mask) & ~clr_mask
+		writes = self.writes.get((set_mask, clr_mask))
+		if(writes is None):
+			writes = [(self.wpi[bcm], 0) for bcm in self.wpi if clr_mask & (1 << bcm)]
+			writes += [(self.wpi[bcm], 1) for bcm in self.wpi if set_mask & (1 << bcm)]
+			self.writes[(set_mask, clr_mask)] = writes
+		digitalWrite = self.wp.digitalWrite
+		for pin, level in writes:
+			digitalWrite(pin, level)
+		self.calls += len(writes)
+
+# Keeps the pin levels in memory instead of driving any pins, for tests and benchmarks
+# With record set, the level of every pin after each write is kept in levels
+class FakeGpioBus(object):
+	def __init__(self, record=False):
+		self.level = 0
+		self.record = record
+		self.levels = []
+		self.calls = 0
+
+	def setup(self, pins):
+		pass
+
+	def write(self, set_mask, clr_mask):
+		if(clr_mask):
+			self.level &= ~clr_mask
+			self.calls += 1
+		if(set_mask):
+			self.level |= set_mask
+			self.calls += 1
+		if(self.record):
+			self.levels.append(self.level)
+
+# Open a GPIO bus for the LCD: backend is one of LCD_BUSES, or None to use
+# /dev/gpiomem if it can be opened and wiringPi otherwise
+def open_lcd_bus(backend=LCD_BUS):
+	if(backend is None):
+		try:
+			return GpioMemBus()
+		except (IOError, OSError):
+			return WiringPiBus()
+	if(backend == "gpiomem"):
+		return GpioMemBus()
+	elif(backend == "wiringpi"):
+		return WiringPiBus()
+	elif(backend == "fake"):
+		return FakeGpioBus()
+	raise ValueError("Unknown LCD bus: " + str(backend))
+
+# HD44780 LCD driven in 4-bit mode
+# The set and clear masks of both nibbles of every byte, with RS, are
+# worked out once, so sending a nibble is one write of the data lines and
+# RS, and one write each to raise and drop E. Instead of sleeping a fixed
+# time around every edge, E is held high for the minimum pulse width and
+# each byte only waits for whatever is left of the previous one's
+# execution time.
+# Pins are given in wiringPi numbering, as they are wired
+# The GPIO is set up when the first LCD is created, not on import
+class LCD(object):
+	def __init__(self, rs=LCD_RS, e=LCD_E, d4=LCD_D4, d5=LCD_D5, d6=LCD_D6, d7=LCD_D7, bus=None):
+		if(bus is None):
+			bus = open_lcd_bus()
+		self.bus = bus
+		self.rs = 1 << WPI_TO_BCM[rs]
+		self.e = 1 << WPI_TO_BCM[e]
+		self.data = [1 << WPI_TO_BCM[d] for d in (d4, d5, d6, d7)]
+		self.ready_at = 0.0	# When the LCD has finished the last byte
+		self.cycle_at = 0.0	# When E may next rise
+
+		# Mode setting for LCD pins
+		bus.setup([WPI_TO_BCM[pin] for pin in (e, rs, d4, d5, d6, d7)])
+
+		# (high set, high clear, low set, low clear) for each byte, per mode
+		self.patterns = [[self.byte_pattern(bits, mode) for bits in range(256)] for mode in (LCD_CMD, LCD_CHR)]
+
+	# Set and clear masks that put a nibble on D4-D7 and mode on RS
+	def nibble_masks(self, nibble, mode):
+		set_mask = self.rs if mode else 0
+		for i, line in enumerate(self.data):
+			if(nibble & (1 << i)):
+				set_mask |= line
+		return set_mask, (self.rs | sum(self.data)) & ~set_mask
+
+	def byte_pattern(self, bits, mode):
+		return self.nibble_masks(bits >> 4, mode) + self.nibble_masks(bits & 0x0F, mode)
+
+	# Latch the nibble already on the data lines by pulsing E
+	def strobe(self):
+		wait_until(self.cycle_at)
+		rise = monotonic()
+		self.bus.write(self.e, 0)
+		self.cycle_at = rise + E_CYCLE
+		wait_until(rise + E_PULSE)
+		self.bus.write(0, self.e)
+
+	# Send one nibble on its own, then wait before the next instruction
+	def nibble(self, nibble, mode, wait=EXEC_TIME):
+		set_mask, clr_mask = self.nibble_masks(nibble, mode)
+		wait_until(self.ready_at)
+		self.bus.write(set_mask, clr_mask)
+		self.strobe()
+		self.ready_at = monotonic() + wait
+
+	# Initialise display
+	# Until it is in 4-bit mode every nibble is a separate instruction, so
+	# the wake-up nibbles are sent one at a time with their own waits
+	def init(self):
+		for nibble, wait in WAKE_NIBBLES:
+			self.nibble(nibble, LCD_CMD, wait)
+		self.byte(0x28,LCD_CMD)
+		self.byte(0x0C,LCD_CMD)
+		self.byte(0x06,LCD_CMD)
+		self.byte(0x01,LCD_CMD)
+
+	# Send byte to data pins
+	# bits = data
+	# mode = True  for character
+	#        False for command
+	def byte(self, bits, mode):
+		high_set, high_clear, low_set, low_clear = self.patterns[1 if mode else 0][bits]
+		wait_until(self.ready_at)
+		self.bus.write(high_set, high_clear)
+		self.strobe()
+		self.bus.write(low_set, low_clear)
+		self.strobe()
+		if((not mode) and (bits & 0xFC) == 0):	# Clear display or return home
+			self.ready_at = monotonic() + CLEAR_TIME
+		else:
+			self.ready_at = monotonic() + EXEC_TIME
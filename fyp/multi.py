@@ -0,0 +1,231 @@
+import argparse
+import time
+import numpy as np
+from .adc import open_adc, SCAN_ORDERS
+from .acquisition import ScanAcquirer
+from .display import start_display, intensity_text
+from .decoder import scan_frames, add_led_args, StreamDecoder
+from .averaging import ChannelEstimator
+from .calibration import evaluate_position, load_or_calibrate, channel_cal_file, poly_terms, CAL_FILE, X_CAL
+from .lambertian import load_or_fit, LB_FILE, HEIGHT, HALF_ANGLE
+from .publisher import add_publisher_args, start_publisher, STATUS_VALID, STATUS_UNSTEADY, STATUS_INVALID
+from .stats import start_stats, STATS_PERIOD
+from .samplebus import SampleBus, BUS_FILE
+from .telemetry import add_telemetry_args, add_console_args, start_telemetry, ConsoleLimiter
+from .realtime import RealTime, JitterMeter, jitter_windows
+
+# Constants
+ADC_BACKEND = "bitbang"	# "spi" to use the kernel SPI device
+COUNT_MAX = 200		# Most samples per channel per window, and the window used with --fixed
+THRESH = 50		# Transition threshold with --fixed, otherwise the starting point
+OUTLIER_THRESH = 20
+AVERAGING_PERIOD = 10
+REPORT_PERIOD = 10	# Seconds between rate reports
+
+def parse_args(argv=None):
+	parser = argparse.ArgumentParser(description="Track several receivers at once, one per ADC channel")
+	parser.add_argument("--channels", type=int, nargs="+", default=[0, 1], metavar="ADCNUM", help="ADC channels with a receiver (default: 0 1)")
+	parser.add_argument("--order", choices=SCAN_ORDERS, default="roundrobin", help="order the channels are sampled in (default: %(default)s)")
+	parser.add_argument("--fixed", action="store_true", help="use the fixed THRESH and COUNT_MAX instead of adapting them to the signal")
+	parser.add_argument("--recalibrate", action="store_true", help="run the calibration even if a stored one is valid")
+	parser.add_argument("--fast-cal", action="store_true", help="calibrate each point as soon as the receiver is held still there, averaging many frames, instead of after a countdown")
+	parser.add_argument("--cal-file", default=CAL_FILE, help="base name of the per-channel calibrations (default: %(default)s)")
+	add_led_args(parser)
+	parser.add_argument("--model", choices=("poly", "lambertian"), default="poly", help="turn intensities into positions with the 7-point polynomial, or by least squares on a path-loss model of each LED fitted to the calibration points (default: %(default)s)")
+	parser.add_argument("--lb-file", default=LB_FILE, help="base name of the per-channel path-loss models (default: %(default)s)")
+	parser.add_argument("--height", type=float, default=HEIGHT, help="height of the LEDs above the receivers, in calibration units, for the path-loss model (default: %(default)s)")
+	parser.add_argument("--half-angle", type=float, default=HALF_ANGLE, metavar="DEGREES", help="half-power semi-angle of the LEDs for the path-loss model (default: %(default)s)")
+	parser.add_argument("--realtime", type=int, nargs="?", const=-1, metavar="CPU", help="pin the sampler to its own CPU (default: the last), run it under SCHED_FIFO if permitted, and defer garbage collection; the sample jitter is shown with --stats")
+	parser.add_argument("--bus", nargs="?", const=BUS_FILE, metavar="PATH", help="also publish every sample window to a shared memory bus for other processes, e.g. FYP_tap.py (default: %(const)s)")
+	add_publisher_args(parser)
+	add_telemetry_args(parser)
+	add_console_args(parser)
+	parser.add_argument("--stats", type=float, nargs="?", const=STATS_PERIOD, metavar="PERIOD", help="time each stage and print stats every PERIOD seconds and on SIGUSR1 (default: %(const)s)")
+	args = parser.parse_args(argv)
+	if((args.model == "poly") and (poly_terms(args.leds) > len(X_CAL))):
+		parser.error("the polynomial for " + str(args.leds) + " LEDs needs more than " + str(len(X_CAL)) + " calibration points; use --model lambertian")
+	return args
+
+# Track every receiver's position until interrupted
+def main(argv=None):
+	args = parse_args(argv)
+
+	# Keep every other thread, including the stats reporter, off the sampler's CPU
+	realtime = None
+	if(args.realtime is not None):
+		realtime = RealTime(None if args.realtime < 0 else args.realtime)
+		realtime.reserve()
+	stats = start_stats(args.stats)
+
+	# Variable initialisation
+	adcnums = args.channels
+	nchannels = len(adcnums)
+	overruns = 0
+
+	# Array initialisation
+	scan = np.zeros([nchannels, COUNT_MAX], dtype=np.uint16)
+	stamps = np.zeros([nchannels, COUNT_MAX])
+	x0 = np.zeros([nchannels, args.leds], dtype=int)
+	slots = args.leds + 1 # Zero level slot followed by one slot per LED
+	cal_out_0 = np.zeros([nchannels, poly_terms(args.leds)])
+	cal_out_1 = np.zeros([nchannels, poly_terms(args.leds)])
+	models = [None] * nchannels
+
+	# Scan every receiver's channel continuously in the background
+	adc = open_adc(ADC_BACKEND)
+	bus = None
+	if(args.bus is not None):
+		bus = SampleBus(args.bus, COUNT_MAX, nchannels)
+	acquirer = ScanAcquirer(adc, adcnums, COUNT_MAX, order=args.order, timestamps=(realtime is not None), stats=stats, realtime=realtime, bus=bus)
+	continuous = (args.order == "roundrobin") # Burst windows leave gaps in each channel
+
+	# Initialise display
+	display = start_display(stats)
+	acquirer.start()
+
+	# Publish positions to other processes, without blocking the main loop
+	publisher = start_publisher(args)
+
+	# Log every measurement without waiting for the disk, and keep each receiver's console lines to a readable rate
+	telemetry = start_telemetry(args, stats, args.leds)
+	consoles = [ConsoleLimiter(args.console_interval) for c in range(nchannels)]
+	behind = ConsoleLimiter(args.console_interval)
+
+	# Each receiver has its own calibration, stored in its own file, and is
+	# moved through the calibration points in turn
+	for c, adcnum in enumerate(adcnums):
+		# Frames this receiver gets at a calibration point
+		def point_frames(position):
+			acquirer.flush() # Only use light received at this calibration point
+			if(realtime is not None): realtime.collect() # The window being captured is dropped anyway
+			decoders = [StreamDecoder(slots, THRESH, adaptive=not args.fixed) for i in range(nchannels)]
+			for channel, frame in scan_frames(acquirer.windows(scan), nchannels, THRESH, COUNT_MAX, continuous, decoders=decoders):
+				if(channel == c):
+					yield frame
+
+		# Measure this receiver's intensities at a calibration point
+		def measure(position):
+			return next(point_frames(position))
+
+		print "Channel", adcnum
+		if(args.model == "lambertian"):
+			models[c] = load_or_fit(channel_cal_file(args.lb_file, adcnum), args.leds, THRESH, args.recalibrate, display, measure,
+				str(adcnum) + ": ", point_frames if args.fast_cal else None, args.height, args.half_angle)
+			continue
+		I_cal, cal_out_0[c], cal_out_1[c] = load_or_calibrate(channel_cal_file(args.cal_file, adcnum), THRESH,
+			args.recalibrate, display, measure, str(adcnum) + ": ", point_frames if args.fast_cal else None, args.leds)
+		print cal_out_0[c]
+		print cal_out_1[c]
+
+	# Decode every channel's frames from the scans, with its own averaging
+	decoders = [StreamDecoder(slots, THRESH, adaptive=not args.fixed) for c in range(nchannels)]
+	windows = acquirer.windows(scan, stamps)
+	if(realtime is not None):
+		print realtime.describe()
+		jitter = JitterMeter()
+		windows = jitter_windows(windows, jitter, stamps)
+		stats.gauge("jitter", jitter.describe)
+		stats.watch("collections", lambda: realtime.collections)
+	frames = scan_frames(windows, nchannels, THRESH, COUNT_MAX, continuous, stats, decoders)
+	fitted = 0 # Frames decoded when the window was last fitted
+	estimators = [ChannelEstimator(args.leds, AVERAGING_PERIOD, OUTLIER_THRESH) for c in range(nchannels)]
+	frame_counts = np.zeros([nchannels], dtype=int)
+	stats.watch("samples", acquirer.samples) # Effective sample rate over all channels
+	stats.watch("overruns", lambda: acquirer.counters()["overruns"])
+	stats.watch("lcd_bytes", lambda: display.writes)
+	stats.watch("lcd_gpio", lambda: display.bus.calls)
+	stats.gauge("window", lambda: acquirer.ring.window)
+	stats.watch("console_skipped", lambda: sum(console.suppressed for console in consoles) + behind.suppressed)
+	if(telemetry is not None):
+		stats.watch("logged", lambda: telemetry.logged)
+		stats.watch("log_dropped", lambda: telemetry.dropped)
+
+	# Show the first two receivers, one per line
+	def show(c, message):
+		if(c < len(display.lines)):
+			display.write(c, str(adcnums[c]) + ": " + message)
+
+	# Main loop
+	overruns = acquirer.counters()["overruns"] # Ignore windows dropped during calibration
+	report_time = time.time()
+	report_samples = acquirer.samples()
+	try:
+		while True:
+			if(realtime is not None): realtime.collect_due(acquirer.ring.pending() == 0) # Between frames, while no window is waiting
+			c, frame = next(frames) # Wait for the next complete frame on any channel
+
+			# Report the aggregate sample rate and each receiver's frame rate
+			now = time.time()
+			if(now - report_time >= REPORT_PERIOD):
+				elapsed = now - report_time
+				samples = acquirer.samples()
+				print "Scanning", nchannels, "channels:", int((samples - report_samples) / elapsed), "samples/sec, frames/sec",
+				print " ".join(str(adcnums[i]) + ": " + format(frame_counts[i] / elapsed, '.1f') for i in range(nchannels))
+				report_time = now
+				report_samples = samples
+				frame_counts[:] = 0
+
+			# Print invalid if no frame was found on this channel for a whole window, and restart its averaging
+			if(frame is None):
+				show(c, "Invalid")
+				start = stats.now()
+				if(consoles[c].due(STATUS_INVALID)): print "Channel", adcnums[c], "invalid lighting conditions!"
+				if(telemetry is not None): telemetry.log(float("nan"), float("nan"), x0[c], STATUS_INVALID, adcnums[c])
+				stats.record("log", start)
+				estimators[c].reset()
+				if(publisher is not None): publisher.publish(float("nan"), float("nan"), x0[c], STATUS_INVALID, adcnums[c])
+				stats.count("invalid")
+				continue
+			frame_counts[c] += 1
+			stats.count("frames")
+
+			# Capture just over the longest channel's frame per window once the periods are known
+			# Burst windows are decoded separately, so they keep their full length
+			decoded = sum(decoder.frames for decoder in decoders)
+			if((not args.fixed) and continuous and (decoded - fitted >= AVERAGING_PERIOD)):
+				fitted = decoded
+				periods = [decoder.frame_period() for decoder in decoders]
+				window = acquirer.ring.window
+				if((None not in periods) and (acquirer.fit_window(max(periods)) != window)):
+					print "Frame periods", periods, "samples, capture window", acquirer.ring.window
+
+			# Remove the outliers of the intensities over the last AVERAGING_PERIOD frames
+			start = stats.now()
+			x0[c] = estimators[c].update(frame[1:])
+			stats.record("average", start)
+			if(not estimators[c].ready()):
+				continue
+
+			# Report windows dropped while the decoder was busy, at most once per console interval
+			dropped = acquirer.counters()["overruns"] - overruns
+			if((dropped > 0) and behind.due()):
+				print "Decoder fell behind, dropped", dropped, "windows"
+				overruns += dropped
+
+			# If there is a valid amount of data to work with, calculate the position of this receiver
+			if(np.amin(x0[c]) > 0):
+				start = stats.now()
+				if(models[c] is not None):
+					x, y = models[c].position(x0[c])
+				else:
+					x, y = evaluate_position(cal_out_0[c], cal_out_1[c], x0[c])
+				stats.record("position", start)
+				stats.count("valid")
+				show(c, format(x, '.3f') + ", " + format(y, '.3f'))
+				start = stats.now()
+				if(consoles[c].due(STATUS_VALID)): print "Channel", adcnums[c], "[", x, ", ", y, "]", intensity_text(x0[c])
+				if(telemetry is not None): telemetry.log(x, y, x0[c], STATUS_VALID, adcnums[c])
+				stats.record("log", start)
+				if(publisher is not None): publisher.publish(x, y, x0[c], channel=adcnums[c])
+
+			# If the receiver detects fluctuating responses, display an error until it is corrected
+			else:
+				show(c, "Unsteady!")
+				start = stats.now()
+				if(consoles[c].due(STATUS_UNSTEADY)): print "Channel", adcnums[c], "unsteady! Please stabilise."
+				if(telemetry is not None): telemetry.log(float("nan"), float("nan"), x0[c], STATUS_UNSTEADY, adcnums[c])
+				stats.record("log", start)
+				stats.count("unsteady")
+				if(publisher is not None): publisher.publish(float("nan"), float("nan"), x0[c], STATUS_UNSTEADY, adcnums[c])
+	finally:
+		if(telemetry is not None): telemetry.close() # Write the records of the last partial batch
@@ -0,0 +1,305 @@
+import errno
+import fcntl
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+# Publishing constants
+PUB_MAGIC = b"FYPP"
+PUB_VERSION = 2
+# magic, version, channel, sequence, timestamp, x, y, status, number of LEDs
+# Each record is this header followed by one POS_INTENSITY per LED
+POS_HEADER = struct.Struct("<4sHHIdddBB2x")
+POS_INTENSITY = struct.Struct("<i")
+MAX_LEDS = 255		# Most intensities a record can carry
+MAX_RECORD = POS_HEADER.size + MAX_LEDS * POS_INTENSITY.size
+MCAST_ADDRESS = "239.0.0.70:5070"	# Default multicast group and port
+TCP_ADDRESS = "127.0.0.1:5070"		# Default TCP address for subscribers
+QUEUE_SIZE = 64		# Records waiting for the publishing thread
+CLIENT_BUFFER = 64	# Records buffered for a slow stream subscriber
+
+# Position status
+STATUS_VALID = 0	# x and y are valid
+STATUS_UNSTEADY = 1	# Frames were decoded but the intensities were not usable
+STATUS_INVALID = 2	# No frame was found for a whole window
+STATUS_NAMES = ("valid", "unsteady", "invalid")
+
+# Split "host:port" into (host, port)
+def parse_address(address):
+	host, sep, port = address.rpartition(":")
+	if(not sep or not port.isdigit()):
+		raise ValueError("Expected host:port, got " + str(address))
+	return host, int(port)
+
+# Pack one position and every intensity into a record
+def pack_position(sequence, stamp, x, y, x0, status=STATUS_VALID, channel=0):
+	if(len(x0) > MAX_LEDS):
+		raise ValueError("A position record holds at most " + str(MAX_LEDS) + " intensities")
+	return POS_HEADER.pack(PUB_MAGIC, PUB_VERSION, channel, sequence & 0xFFFFFFFF, stamp,
+		x, y, status, len(x0)) + struct.pack("<" + str(len(x0)) + "i", *[int(v) for v in x0])
+
+# Size of the record starting with this header, or raise ValueError if it is not one
+def record_size(header):
+	magic, version, channel, sequence, stamp, x, y, status, leds = POS_HEADER.unpack(header[:POS_HEADER.size])
+	if(magic != PUB_MAGIC or version != PUB_VERSION):
+		raise ValueError("Not a version " + str(PUB_VERSION) + " position record")
+	return POS_HEADER.size + leds * POS_INTENSITY.size
+
+# Unpack a record into a dict, or raise ValueError if it is not one
+def unpack_position(data):
+	if(len(data) < POS_HEADER.size):
+		raise ValueError("Position records are at least " + str(POS_HEADER.size) + " bytes, got " + str(len(data)))
+	size = record_size(data)
+	if(len(data) != size):
+		raise ValueError("Expected a " + str(size) + " byte position record, got " + str(len(data)))
+	magic, version, channel, sequence, stamp, x, y, status, leds = POS_HEADER.unpack(data[:POS_HEADER.size])
+	x0 = struct.unpack("<" + str(leds) + "i", data[POS_HEADER.size:])
+	return {"channel": channel, "sequence": sequence, "stamp": stamp, "x": x, "y": y,
+		"x0": x0, "status": status}
+
+# Publish positions to UDP multicast and/or TCP and Unix socket subscribers
+# publish() only queues the packed record and wakes the thread, so it never
+# blocks the measurement loop. If the thread falls behind, the oldest queued
+# records are dropped, and a subscriber that stops reading loses records
+# rather than holding up the others.
+class Publisher(threading.Thread):
+	def __init__(self, multicast=None, tcp=None, unix=None, ttl=1):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.queue = deque(maxlen=QUEUE_SIZE)
+		self.lock = threading.Lock()
+		self.sequence = 0
+		self.published = 0	# Records queued
+		self.dropped = 0	# Records dropped before reaching a subscriber
+		self.listeners = []
+		self.clients = {}	# Stream subscriber socket -> bytes waiting to be sent
+		self.unix = unix
+		self.running = threading.Event()
+		self.running.set()
+
+		# Pipe written by publish() to wake the select loop
+		self.wake_r, self.wake_w = os.pipe()
+		for fd in (self.wake_r, self.wake_w):
+			set_nonblocking(fd)
+
+		self.mcast = None
+		if(multicast is not None):
+			self.mcast_address = parse_address(multicast)
+			self.mcast = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+			self.mcast.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+			self.mcast.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+			self.mcast.setblocking(0)
+
+		if(tcp is not None):
+			listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+			listener.bind(parse_address(tcp))
+			self.listen(listener)
+
+		if(unix is not None):
+			if(os.path.exists(unix)):
+				os.unlink(unix)	# Left behind by an earlier run
+			listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			listener.bind(unix)
+			self.listen(listener)
+
+	def listen(self, listener):
+		listener.listen(5)
+		listener.setblocking(0)
+		self.listeners.append(listener)
+
+	# Queue a position for every subscriber
+	def publish(self, x, y, x0, status=STATUS_VALID, channel=0, stamp=None):
+		if(stamp is None):
+			stamp = time.time()
+		with self.lock:
+			record = pack_position(self.sequence, stamp, x, y, x0, status, channel)
+			if(len(self.queue) == self.queue.maxlen):
+				self.dropped += 1
+			self.queue.append(record)
+			self.sequence += 1
+			self.published += 1
+		try:
+			os.write(self.wake_w, b"x")
+		except OSError as e:
+			if(e.errno != errno.EAGAIN):	# A full pipe has already woken the thread
+				raise
+
+	def run(self):
+		while self.running.is_set():
+			rlist = [self.wake_r] + self.listeners + list(self.clients)
+			wlist = [client for client in self.clients if self.clients[client]]
+			try:
+				readable, writable = select.select(rlist, wlist, [], 1.0)[:2]
+			except select.error as e:
+				if(e.args[0] == errno.EINTR):
+					continue
+				raise
+
+			for sock in readable:
+				if(sock == self.wake_r):
+					drain(self.wake_r)
+				elif(sock in self.listeners):
+					self.accept(sock)
+				elif(sock in self.clients):
+					self.receive(sock)
+
+			with self.lock:
+				records = list(self.queue)
+				self.queue.clear()
+			for record in records:
+				self.send(record)
+
+			for client in writable:
+				if(client in self.clients):
+					self.flush(client)
+
+	def accept(self, listener):
+		try:
+			client, address = listener.accept()
+		except socket.error:
+			return
+		client.setblocking(0)
+		self.clients[client] = b""
+
+	# Subscribers send nothing, so a readable subscriber has hung up
+	def receive(self, client):
+		try:
+			data = client.recv(4096)
+		except socket.error:
+			data = b""
+		if(not data):
+			self.disconnect(client)
+
+	def disconnect(self, client):
+		del self.clients[client]
+		client.close()
+
+	# Send a record to the multicast group and queue it for each stream subscriber
+	def send(self, record):
+		if(self.mcast is not None):
+			try:
+				self.mcast.sendto(record, self.mcast_address)
+			except socket.error:
+				self.dropped += 1
+		for client in self.clients:
+			if(len(self.clients[client]) >= CLIENT_BUFFER * len(record)):
+				self.dropped += 1
+			else:
+				self.clients[client] += record
+
+	# Send as much of a subscriber's buffer as its socket will take
+	def flush(self, client):
+		try:
+			sent = client.send(self.clients[client])
+		except socket.error as e:
+			if(e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK)):
+				self.disconnect(client)
+			return
+		self.clients[client] = self.clients[client][sent:]
+
+	# Number of connected stream subscribers
+	def subscribers(self):
+		return len(self.clients)
+
+	# Stop the thread and close every socket
+	def close(self):
+		self.running.clear()
+		os.write(self.wake_w, b"x")
+		self.join(2.0)
+		for client in list(self.clients):
+			self.disconnect(client)
+		for listener in self.listeners:
+			listener.close()
+		if(self.mcast is not None):
+			self.mcast.close()
+		if(self.unix is not None and os.path.exists(self.unix)):
+			os.unlink(self.unix)
+		os.close(self.wake_r)
+		os.close(self.wake_w)
+
+# Add the --multicast, --tcp and --unix options of the tracking scripts
+def add_publisher_args(parser):
+	parser.add_argument("--multicast", nargs="?", const=MCAST_ADDRESS, metavar="GROUP:PORT", help="publish positions to a multicast group (default: " + MCAST_ADDRESS + ")")
+	parser.add_argument("--tcp", nargs="?", const=TCP_ADDRESS, metavar="HOST:PORT", help="publish positions to TCP subscribers (default: " + TCP_ADDRESS + ")")
+	parser.add_argument("--unix", metavar="PATH", help="publish positions to subscribers on a Unix socket")
+
+# Start a Publisher for the options given, or return None if there were none
+def start_publisher(args):
+	if(not (args.multicast or args.tcp or args.unix)):
+		return None
+	publisher = Publisher(args.multicast, args.tcp, args.unix)
+	publisher.start()
+	return publisher
+
+# Make a file descriptor non-blocking
+def set_nonblocking(fd):
+	flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+	fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+# Read everything waiting in a non-blocking pipe
+def drain(fd):
+	try:
+		while os.read(fd, 4096):
+			pass
+	except OSError as e:
+		if(e.errno != errno.EAGAIN):
+			raise
+
+# Receive positions from a Publisher, e.g. for a local client on loopback
+# Give exactly one of multicast ("group:port"), tcp ("host:port") or unix (path)
+class Subscriber(object):
+	def __init__(self, multicast=None, tcp=None, unix=None):
+		self.buffer = b""
+		if(multicast is not None):
+			group, port = parse_address(multicast)
+			self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+			self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+			self.sock.bind(("", port))
+			membership = struct.pack("4sl", socket.inet_aton(group), socket.INADDR_ANY)
+			self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+			self.stream = False
+		elif(tcp is not None):
+			self.sock = socket.create_connection(parse_address(tcp))
+			self.stream = True
+		elif(unix is not None):
+			self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			self.sock.connect(unix)
+			self.stream = True
+		else:
+			raise ValueError("No address to subscribe to")
+
+	# Wait for the next position and return it as a dict
+	# Returns None on timeout, or if a stream publisher has closed
+	def recv(self, timeout=None):
+		self.sock.settimeout(timeout)
+		try:
+			if(not self.stream):
+				return unpack_position(self.sock.recv(MAX_RECORD))
+			if(not self.fill(POS_HEADER.size)):
+				return None
+			size = record_size(self.buffer)
+			if(not self.fill(size)):
+				return None
+		except socket.timeout:
+			return None
+		record = self.buffer[:size]
+		self.buffer = self.buffer[size:]
+		return unpack_position(record)
+
+	# Read from a stream until at least size bytes are buffered
+	# Returns False if the publisher has closed
+	def fill(self, size):
+		while(len(self.buffer) < size):
+			data = self.sock.recv(4096)
+			if(not data):
+				return False
+			self.buffer += data
+		return True
+
+	def close(self):
+		self.sock.close()
@@ -0,0 +1,42 @@
+import argparse
+import numpy as np
+from .adc import open_adc
+from .acquisition import Acquirer
+from .display import start_display, intensity_text, intensity_lines
+from .telemetry import add_console_args, ConsoleLimiter
+from .decoder import stream_slots, add_led_args
+
+# Constants
+ADC_BACKEND = "bitbang"	# "spi" to use the kernel SPI device
+COUNT_MAX = 200
+THRESH = 50
+
+# Show the raw slot means of every frame until interrupted
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Show the raw intensity of each LED in every frame")
+	add_led_args(parser)
+	add_console_args(parser)
+	args = parser.parse_args(argv)
+	console = ConsoleLimiter(args.console_interval)
+
+	# Declarations
+	adcnum = 0
+	values = np.zeros([COUNT_MAX], dtype=np.uint16)
+
+	# Sample the ADC continuously in the background
+	adc = open_adc(ADC_BACKEND)
+	acquirer = Acquirer(adc, adcnum, COUNT_MAX)
+	acquirer.start()
+
+	# Initialise display
+	display = start_display()
+
+	for ave in stream_slots(acquirer.windows(values), args.leds, THRESH, COUNT_MAX): # One slot per LED, without the zero level slot
+		if(ave is not None):
+			# Send some test
+			display.show(*intensity_lines(ave))
+			if(console.due()): print intensity_text(ave)
+
+		else: 	# Send some test
+			display.show("Invalid", "conditions")
+			#print "Invalid lighting conditions!"
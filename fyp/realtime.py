@@ -0,0 +1,203 @@
+import ctypes
+import ctypes.util
+import gc
+import multiprocessing
+import os
+import numpy as np
+from .stats import monotonic
+
+# Real-time constants
+SCHED_FIFO = 1		# From <sched.h> on Linux
+RT_PRIORITY = 50	# SCHED_FIFO priority of the sampling thread, 1-99
+CPU_SETSIZE = 1024	# Bits in a cpu_set_t
+JITTER_HISTORY = 100000	# Sample intervals the jitter percentiles are taken over
+JITTER_PERCENTILES = (50, 90, 99, 99.9)
+GC_INTERVAL = 1.0	# Seconds between deferred collections, run while the decoder is idle
+GC_MAX_INTERVAL = 10.0	# Seconds before a deferred collection runs even if the decoder never is
+
+libc = None
+
+# The C library, loaded on first use
+# Python 2 has no os.sched_setaffinity() or os.sched_setscheduler(), so call them through ctypes
+def load_libc():
+	global libc
+	if(libc is None):
+		libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+	return libc
+
+# Error message for the last failed libc call
+def libc_error():
+	return os.strerror(ctypes.get_errno())
+
+# Restrict the calling thread to the given CPUs
+# On Linux a pid of 0 means the calling thread, not the whole process
+# Raises OSError if the CPUs are not allowed
+def set_affinity(cpus):
+	mask = (ctypes.c_ubyte * (CPU_SETSIZE // 8))()
+	for cpu in cpus:
+		mask[cpu // 8] |= 1 << (cpu % 8)
+	if(load_libc().sched_setaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)) != 0):
+		raise OSError("sched_setaffinity: " + libc_error())
+
+# CPUs the calling thread may run on
+def get_affinity():
+	mask = (ctypes.c_ubyte * (CPU_SETSIZE // 8))()
+	if(load_libc().sched_getaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)) != 0):
+		raise OSError("sched_getaffinity: " + libc_error())
+	return [cpu for cpu in range(CPU_SETSIZE) if mask[cpu // 8] & (1 << (cpu % 8))]
+
+# Set the scheduling policy of the calling thread
+# Raises OSError if not permitted, e.g. SCHED_FIFO without CAP_SYS_NICE or an RLIMIT_RTPRIO
+def set_scheduler(policy, priority=0):
+	class sched_param(ctypes.Structure):
+		_fields_ = [("sched_priority", ctypes.c_int)]
+
+	param = sched_param(priority)
+	if(load_libc().sched_setscheduler(0, policy, ctypes.byref(param)) != 0):
+		raise OSError("sched_setscheduler: " + libc_error())
+
+# Opt-in real-time settings for the sampling thread
+# reserve() is called from the main thread before any other thread starts,
+# and moves it, and so every thread it starts later, off the sampling CPU.
+# enter() is called by the sampling thread itself, and pins it to that CPU
+# and asks for SCHED_FIFO. The cyclic garbage collector is turned off so it
+# cannot stop the sampler mid-window; call collect() where a pause costs
+# nothing, e.g. just after flushing the acquirer, and collect_due() from
+# the main loop so a long run without such pauses still collects.
+# Each step that is not permitted is skipped with a message, so the mode
+# degrades to whatever this machine allows.
+# With a single CPU nothing is pinned and SCHED_FIFO is not asked for, as
+# the sampler never sleeps and would starve the decoder.
+class RealTime(object):
+	def __init__(self, cpu=None, priority=RT_PRIORITY, fifo=True, disable_gc=True):
+		self.cpus = multiprocessing.cpu_count()
+		if(cpu is None):
+			cpu = self.cpus - 1	# The kernel tends to put interrupts on CPU 0
+		self.cpu = cpu
+		self.priority = priority
+		self.fifo = fifo
+		self.disable_gc = disable_gc
+		self.pinned = False	# The sampler is on its own CPU
+		self.realtime = False	# The sampler runs under SCHED_FIFO
+		self.collections = 0	# Deferred collections run
+		self.collected_at = monotonic()	# When the last deferred collection ran
+		self.saved = None	# CPUs the reserving thread could use before
+
+	# Keep the calling thread, and the threads it starts, off the sampling CPU
+	def reserve(self):
+		if(self.disable_gc):
+			gc.collect()
+			gc.disable()
+		if(self.cpus < 2):
+			print "Real-time: only one CPU, so the sampler shares it"
+			return
+		try:
+			self.saved = get_affinity()
+			others = [cpu for cpu in self.saved if cpu != self.cpu]
+			if(others):
+				set_affinity(others)
+		except OSError as e:
+			print "Real-time: could not reserve CPU", self.cpu, "(" + str(e) + ")"
+
+	# Pin the calling thread to the sampling CPU and ask for SCHED_FIFO
+	def enter(self):
+		if(self.cpus < 2):
+			return
+		try:
+			set_affinity([self.cpu])
+			self.pinned = True
+		except OSError as e:
+			print "Real-time: could not pin the sampler to CPU", self.cpu, "(" + str(e) + ")"
+		if(self.fifo):
+			try:
+				set_scheduler(SCHED_FIFO, self.priority)
+				self.realtime = True
+			except OSError as e:
+				print "Real-time: running without SCHED_FIFO (" + str(e) + ")"
+
+	# Undo reserve() in the thread that called it, e.g. at the end of a benchmark
+	def release(self):
+		if(self.disable_gc):
+			gc.enable()
+		if(self.saved is not None):
+			set_affinity(self.saved)
+			self.saved = None
+
+	# Run the collection the garbage collector was stopped from doing
+	def collect(self):
+		if(self.disable_gc):
+			gc.collect()
+			self.collections += 1
+			self.collected_at = monotonic()
+
+	# Collect if GC_INTERVAL has passed and the caller is idle (e.g. no
+	# window is waiting to be decoded), or if GC_MAX_INTERVAL has passed
+	def collect_due(self, idle=True):
+		if(not self.disable_gc):
+			return
+		elapsed = monotonic() - self.collected_at
+		if((elapsed >= GC_MAX_INTERVAL) or (idle and elapsed >= GC_INTERVAL)):
+			self.collect()
+
+	# One line summary of what was granted
+	def describe(self):
+		granted = []
+		if(self.pinned):
+			granted.append("pinned to CPU " + str(self.cpu))
+		if(self.realtime):
+			granted.append("SCHED_FIFO priority " + str(self.priority))
+		if(self.disable_gc):
+			granted.append("GC deferred")
+		return "Real-time sampler: " + (", ".join(granted) or "no changes")
+
+# Spread of the intervals between sample timestamps
+# Intervals are kept for the last history samples. Jitter is each
+# interval's distance from the median interval, so a steady sampler has
+# small percentiles whatever its rate. Only intervals inside a window are
+# used, as the gap between windows is the hand-off, not sampling.
+class JitterMeter(object):
+	def __init__(self, history=JITTER_HISTORY):
+		self.intervals = np.zeros([history])
+		self.count = 0		# Intervals seen
+
+	# Add the timestamps of one window, or of one row per channel
+	def add(self, stamps):
+		d = np.diff(stamps).ravel()
+		size = len(self.intervals)
+		if(len(d) > size):
+			d = d[-size:]
+		i = self.count % size
+		first = min(len(d), size - i)
+		self.intervals[i:i+first] = d[:first]
+		self.intervals[:len(d)-first] = d[first:]
+		self.count += len(d)
+
+	# Median interval and the jitter percentiles, in seconds
+	# Returns None until an interval has been seen
+	def percentiles(self, percentiles=JITTER_PERCENTILES):
+		if(self.count == 0):
+			return None
+		d = self.intervals[:min(self.count, len(self.intervals))]
+		median = np.median(d)
+		jitter = np.abs(d - median)
+		return median, [np.percentile(jitter, p) for p in percentiles], jitter.max()
+
+	# Jitter as text, in microseconds
+	def describe(self, percentiles=JITTER_PERCENTILES):
+		result = self.percentiles(percentiles)
+		if(result is None):
+			return "no samples"
+		median, values, worst = result
+		text = "interval " + format(median * 1e6, '.1f') + "us, jitter"
+		for p, value in zip(percentiles, values):
+			text += " p" + str(p) + "=" + format(value * 1e6, '.1f')
+		return text + " max=" + format(worst * 1e6, '.1f') + "us"
+
+# Pass windows through, adding the timestamps of each to a JitterMeter
+def jitter_windows(windows, meter, stamps):
+	for window in windows:
+		if(window is None):	# Windows were dropped
+			yield window
+			continue
+		meter.add(stamps[..., :window.shape[-1]])
+		yield window
@@ -0,0 +1,168 @@
+import json
+import os
+import struct
+import time
+import numpy as np
+
+# Recording constants
+REC_MAGIC = b"FYPREC\0\0"
+REC_VERSION = 2
+# magic, version, ADC channel, window size, length of the settings, creation time
+# The header is followed by the decoder settings as JSON, then the records
+REC_HEADER = struct.Struct("<8sIIIId")
+# One record per sample, stored in arrival order
+REC_RECORD = np.dtype([("stamp", "<f8"), ("value", "<u2"), ("flags", "u1")])
+REC_WINDOW = 1		# Flag of the first sample of each window
+REC_GAP = 2		# Flag of the first sample after windows were dropped, or after the recording was resumed
+
+# Append raw samples and their timestamps to a recording file
+# The file is only ever appended to, so a recording cut short by a crash
+# or power loss is still readable up to its last whole record
+# settings describe the decoder the windows are fed to and the position
+# model (see xy.recording_settings), so a replay can build the same ones.
+# The start of every window is flagged, so a replay sees the same chunks.
+class Recorder(object):
+	def __init__(self, path, adcnum, window, settings=None):
+		self.path = path
+		self.window = window
+		self.buffer = np.zeros([window], dtype=REC_RECORD)
+		self.samples = 0
+		self.gap = True		# The next window does not follow on from the last one recorded
+		if(settings is None):
+			settings = {}
+
+		new = (not os.path.exists(path)) or (os.path.getsize(path) == 0)
+		if(not new):
+			header = read_header(path)
+			if(header["adcnum"] != adcnum or header["window"] != window):
+				raise ValueError("Recording " + path + " was made with a different channel or window")
+			if(header["settings"] != json.loads(json.dumps(settings))):
+				raise ValueError("Recording " + path + " was made with different decoder settings")
+		self.f = open(path, "ab")
+		if(new):
+			text = json.dumps(settings, sort_keys=True)
+			self.f.write(REC_HEADER.pack(REC_MAGIC, REC_VERSION, adcnum, window, len(text), time.time()))
+			self.f.write(text)
+
+	# Append one window of samples
+	# Set gap if windows were dropped just before this one
+	def append(self, values, stamps, gap=False):
+		n = len(values)
+		if(n == 0):
+			return
+		if(n > len(self.buffer)):
+			self.buffer = np.zeros([n], dtype=REC_RECORD)
+		records = self.buffer[:n]
+		records["value"] = values
+		records["stamp"] = stamps[:n]
+		records["flags"] = 0
+		records["flags"][0] = REC_WINDOW | (REC_GAP if (gap or self.gap) else 0)
+		self.gap = False
+		self.f.write(records.tobytes())
+		self.samples += n
+
+	def close(self):
+		self.f.close()
+
+# Read and check the header of a recording
+# Returns a dict with the decoder settings, and the offset of the first record
+def read_header(path):
+	with open(path, "rb") as f:
+		raw = f.read(REC_HEADER.size)
+		if(len(raw) < REC_HEADER.size):
+			raise ValueError(path + " is too short to be a recording")
+		magic, version, adcnum, window, length, created = REC_HEADER.unpack(raw)
+		if(magic != REC_MAGIC):
+			raise ValueError(path + " is not a recording")
+		if(version != REC_VERSION):
+			raise ValueError("Unsupported recording version " + str(version))
+		text = f.read(length)
+	if(len(text) < length):
+		raise ValueError(path + " is too short to be a recording")
+	return {"adcnum": adcnum, "window": window, "created": created, "settings": json.loads(text), "offset": REC_HEADER.size + length}
+
+# Map a recording into memory without reading it
+# Returns the header and a read-only record array with "stamp", "value" and "flags" fields
+def open_recording(path):
+	header = read_header(path)
+	count = (os.path.getsize(path) - header["offset"]) // REC_RECORD.itemsize
+	if(count == 0):
+		return header, np.zeros([0], dtype=REC_RECORD)
+	records = np.memmap(path, dtype=REC_RECORD, mode="r", offset=header["offset"], shape=(count,))
+	return header, records
+
+# Pass windows through unchanged, appending each one to a recorder first
+# The markers of dropped windows (see Acquirer.windows) are passed on, and
+# flag the next window recorded
+def record_windows(windows, recorder, stamps):
+	gap = False
+	for values in windows:
+		if(values is None):
+			gap = True
+		else:
+			recorder.append(values, stamps, gap)
+			gap = False
+		yield values
+
+# Feed a recording back as windows of samples, as fast as they are consumed
+# By default the windows are the ones recorded, with None before each one
+# flagged REC_GAP, so a streaming decoder sees exactly the chunks it saw
+# live. Given a window size, the samples are cut into windows of that size.
+def replay_windows(path, window=None):
+	header, records = open_recording(path)
+	values = records["value"]
+	if(window is not None):
+		for start in range(0, len(values), window):
+			yield values[start:start+window]
+		return
+	flags = records["flags"]
+	starts = np.flatnonzero(flags & REC_WINDOW).tolist() + [len(values)]
+	for start, end in zip(starts[:-1], starts[1:]):
+		if(flags[start] & REC_GAP):
+			yield None
+		yield values[start:end]
+
+# ADC driver that reads samples from a recording instead of the hardware
+# Lets anything written against the ADC interface run on recorded light
+class ReplayADC(object):
+	def __init__(self, path, loop=False):
+		self.header, self.records = open_recording(path)
+		self.values = self.records["value"]
+		self.loop = loop
+		self.position = 0
+
+	def read(self, adcnum):
+		if(self.position >= len(self.values)):
+			if(not self.loop or len(self.values) == 0):
+				return 0
+			self.position = 0
+		value = int(self.values[self.position])
+		self.position += 1
+		return value
+
+	def read_block(self, adcnum, n, out=None, stamps=None):
+		if(out is None):
+			out = np.zeros([n], dtype=np.uint16)
+		filled = 0
+		while(filled < n):
+			if(self.position >= len(self.values)):
+				if(not self.loop or len(self.values) == 0):
+					out[filled:n] = 0
+					if(stamps is not None):
+						stamps[filled:n] = 0
+					break
+				self.position = 0
+			step = min(n - filled, len(self.values) - self.position)
+			out[filled:filled+step] = self.values[self.position:self.position+step]
+			if(stamps is not None):
+				stamps[filled:filled+step] = self.records["stamp"][self.position:self.position+step]
+			filled += step
+			self.position += step
+		return out
+
+	# True once every recorded sample has been read
+	def finished(self):
+		return (not self.loop) and self.position >= len(self.values)
+
+	def close(self):
+		del self.records
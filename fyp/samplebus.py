@@ -0,0 +1,172 @@
+import mmap
+import os
+import time
+import numpy as np
+
+# Sample bus constants
+BUS_FILE = "/dev/shm/fyp-samples"	# tmpfs, so the file is only ever in memory
+BUS_SLOTS = 64		# Windows kept for consumers that fall behind
+BUS_MAGIC = "FYPB"
+BUS_VERSION = 1
+POLL_INTERVAL = 0.001	# Seconds between checks for a new window
+
+# Start of the file: what the writer is publishing, and how far it has got
+HEADER_DTYPE = np.dtype([("magic", "S4"), ("version", "<u4"), ("slots", "<u4"), ("channels", "<u4"),
+	("capacity", "<u4"), ("pad", "<u4"), ("head", "<i8")])
+
+# Offsets of the header, the slot sequence numbers and lengths, the samples
+# and the timestamps, and the size of the whole file
+def bus_layout(slots, channels, capacity):
+	seqs = HEADER_DTYPE.itemsize
+	lengths = seqs + 8 * slots
+	values = lengths + 8 * slots
+	stamps = values + 2 * slots * channels * capacity
+	stamps += -stamps % 8
+	return seqs, lengths, values, stamps, stamps + 8 * slots * channels * capacity
+
+# Numpy views of every part of a mapped bus file
+def bus_views(buf, slots, channels, capacity):
+	seqs, lengths, values, stamps, size = bus_layout(slots, channels, capacity)
+	header = np.frombuffer(buf, HEADER_DTYPE, 1, 0)[0:1]
+	return (header,
+		np.frombuffer(buf, "<i8", slots, seqs),
+		np.frombuffer(buf, "<i8", slots, lengths),
+		np.frombuffer(buf, "<u2", slots * channels * capacity, values).reshape(slots, channels, capacity),
+		np.frombuffer(buf, "<f8", slots * channels * capacity, stamps).reshape(slots, channels, capacity))
+
+# Publishes sample windows into a shared memory file for other processes
+# Python 2 has no multiprocessing.shared_memory, so the bus is a file in
+# /dev/shm mapped with mmap, which is the same thing underneath. Each
+# window goes into the next of slots slots with its sequence number. The
+# slot's sequence number is set to -1 while it is written, so a reader can
+# tell a window that was overwritten while it used it (a seqlock).
+# The writer never waits for readers: a reader that falls behind by more
+# than the ring loses the oldest windows, and finds out from the sequence
+# numbers.
+class SampleBus(object):
+	def __init__(self, path=BUS_FILE, capacity=200, channels=1, slots=BUS_SLOTS):
+		self.path = path
+		self.slots = slots
+		self.channels = channels
+		self.capacity = capacity
+		size = bus_layout(slots, channels, capacity)[-1]
+		fd = os.open(path, os.O_RDWR | os.O_CREAT, 0644)
+		try:
+			os.ftruncate(fd, size)
+			self.map = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+		finally:
+			os.close(fd)
+		self.header, self.seqs, self.lengths, self.values, self.stamps = bus_views(self.map, slots, channels, capacity)
+
+		# Readers still attached from an earlier run see the head go back and start over
+		self.head = 0
+		self.seqs[:] = -1
+		self.header["head"] = 0
+		self.header["version"] = BUS_VERSION
+		self.header["slots"] = slots
+		self.header["channels"] = channels
+		self.header["capacity"] = capacity
+		self.header["magic"] = BUS_MAGIC
+
+	# Publish a window: values is (n,) for one channel or (channels, n)
+	def write(self, values, stamps=None):
+		n = values.shape[-1]
+		seq = self.head
+		slot = seq % self.slots
+		self.seqs[slot] = -1
+		self.values[slot][:, :n] = values
+		if(stamps is not None):
+			self.stamps[slot][:, :n] = stamps
+		self.lengths[slot] = n
+		self.seqs[slot] = seq
+		self.head = seq + 1
+		self.header["head"] = self.head
+
+	def close(self):
+		self.map.close()
+
+# Maps a SampleBus file read-only and hands out windows as numpy views of it
+# Nothing is copied or pickled: a window stays valid until the writer
+# laps it, which valid(seq) checks after the window has been used.
+class BusReader(object):
+	def __init__(self, path=BUS_FILE):
+		f = open(path, "rb")
+		try:
+			self.map = mmap.mmap(f.fileno(), 0, mmap.MAP_SHARED, mmap.PROT_READ)
+		finally:
+			f.close()
+		header = np.frombuffer(self.map, HEADER_DTYPE, 1, 0)[0]
+		if(header["magic"] != BUS_MAGIC or header["version"] != BUS_VERSION):
+			raise IOError("Not a sample bus: " + path)
+		self.slots = int(header["slots"])
+		self.channels = int(header["channels"])
+		self.capacity = int(header["capacity"])
+		self.header, self.seqs, self.lengths, self.values, self.stamps = bus_views(self.map, self.slots, self.channels, self.capacity)
+		self.next = int(self.header["head"][0])	# Start from the next window published
+		self.missed = 0		# Windows overwritten before they were read
+		self.torn = 0		# Windows overwritten while they were being used
+
+	# Windows published so far
+	def head(self):
+		return int(self.header["head"][0])
+
+	# Views of window seq's samples and timestamps, (channels, n) each,
+	# or None if it has already been overwritten
+	def get(self, seq):
+		slot = seq % self.slots
+		if(self.seqs[slot] != seq):
+			return None
+		n = self.lengths[slot]
+		values = self.values[slot][:, :n]
+		stamps = self.stamps[slot][:, :n]
+		if(self.seqs[slot] != seq):
+			return None
+		return values, stamps
+
+	# True if window seq has not been overwritten since get(seq)
+	def valid(self, seq):
+		return self.seqs[seq % self.slots] == seq
+
+	# Windows waiting to be read
+	def lag(self):
+		return self.head() - self.next
+
+	# Yield (seq, values, stamps) for every window from now on, skipping
+	# the ones the writer has already overwritten
+	# Yields None if timeout seconds pass with no new window
+	def windows(self, timeout=None):
+		last = None
+		waited = 0.0
+		while True:
+			if((last is not None) and (not self.valid(last))):
+				self.torn += 1
+			last = None
+
+			head = self.head()
+			if(head < self.next):
+				self.next = head	# The writer restarted
+			if(head == self.next):
+				time.sleep(POLL_INTERVAL)
+				waited += POLL_INTERVAL
+				if((timeout is not None) and (waited >= timeout)):
+					waited = 0.0
+					yield None
+				continue
+			waited = 0.0
+
+			# Skip to the oldest window the writer cannot be writing to
+			oldest = head - (self.slots - 1)
+			if(self.next < oldest):
+				self.missed += oldest - self.next
+				self.next = oldest
+			seq = self.next
+			self.next += 1
+			window = self.get(seq)
+			if(window is None):
+				self.missed += 1
+				continue
+			last = seq
+			yield (seq,) + window
+
+	def close(self):
+		self.map.close()
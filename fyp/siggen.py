@@ -0,0 +1,60 @@
+import numpy as np
+
+# Generator constants
+INTENSITIES = (200, 150, 250)	# Received intensity of each LED above ambient
+AMBIENT = 100		# Receiver level with every LED off
+SYNC_LEN = 30		# Samples of the sync gap before each frame
+SLOT_LEN = 10		# Samples of each slot
+GAP_LEN = 5		# Samples of the gap between slots
+RING_PERIOD = 4.0	# Samples per cycle of the ringing after an edge
+RING_DECAY = 2.0	# Samples for the ringing to decay by 1/e
+ADC_MAX = 1023
+
+# Levels of one time-multiplexed frame, before noise
+# The sync gap and the gaps between slots have every LED on. The zero slot
+# has every LED off, and each LED slot has only that LED on.
+def frame_levels(intensities=INTENSITIES, ambient=AMBIENT, slot_len=SLOT_LEN, gap_len=GAP_LEN, sync_len=SYNC_LEN, zero_slot=True):
+	gap = ambient + sum(intensities)
+	slots = list(ambient + np.asarray(intensities))
+	if(zero_slot):
+		slots = [ambient] + slots
+	levels = [gap] * sync_len
+	for i, slot in enumerate(slots):
+		levels += [slot] * slot_len
+		if(i < len(slots) - 1):
+			levels += [gap] * gap_len
+	return np.array(levels, dtype=float)
+
+# Generate n samples of a repeating frame as the ADC would read them
+# noise: standard deviation of white noise added to every sample
+# drift: amplitude of a slow sinusoidal change in ambient light, with period drift_period samples
+# ringing: size of the damped oscillation after each edge, as a fraction of the edge
+# phase: samples of the first frame to skip, so windows start mid-frame
+def generate(n, intensities=INTENSITIES, ambient=AMBIENT, slot_len=SLOT_LEN, gap_len=GAP_LEN, sync_len=SYNC_LEN,
+		zero_slot=True, noise=0.0, drift=0.0, drift_period=5000.0, ringing=0.0, phase=0, rng=None):
+	if(rng is None):
+		rng = np.random
+	frame = frame_levels(intensities, ambient, slot_len, gap_len, sync_len, zero_slot)
+	repeats = (n + phase) // len(frame) + 1
+	signal = np.tile(frame, repeats)[phase:phase+n]
+
+	if(ringing):
+		steps = np.diff(signal)
+		k = np.arange(int(8 * RING_DECAY))
+		kernel = ringing * np.exp(-k / RING_DECAY) * np.sin(2 * np.pi * k / RING_PERIOD)
+		signal[1:] += np.convolve(steps, kernel)[:n-1]
+	if(drift):
+		signal += drift * np.sin(2 * np.pi * (np.arange(n) + phase) / drift_period)
+	if(noise):
+		signal += rng.normal(0, noise, n)
+
+	return np.clip(np.round(signal), 0, ADC_MAX).astype(np.uint16)
+
+# Length in samples of one frame
+def frame_length(nslots=4, slot_len=SLOT_LEN, gap_len=GAP_LEN, sync_len=SYNC_LEN):
+	return sync_len + nslots * slot_len + (nslots - 1) * gap_len
+
+# Slot bounds of one frame from its first slot, as StreamDecoder.frame_layout() gives them
+def frame_bounds(nslots=4, slot_len=SLOT_LEN, gap_len=GAP_LEN):
+	starts = np.arange(nslots) * (slot_len + gap_len)
+	return np.column_stack((starts, starts + slot_len)).ravel()
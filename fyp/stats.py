@@ -0,0 +1,225 @@
+import math
+import signal
+import sys
+import threading
+import time
+
+# Stats constants
+HIST_STEPS = 4		# Histogram buckets per doubling of latency
+HIST_BUCKETS = 96	# Covers 1us to about 16s
+PERCENTILES = (50, 90, 99)
+STATS_PERIOD = 10	# Seconds between periodic dumps
+CLOCK_MONOTONIC = 1	# From <time.h> on Linux
+
+# Monotonic clock in seconds, unaffected by changes to the system time
+# Python 2 has no time.monotonic(), so call clock_gettime() through ctypes
+def make_monotonic():
+	if(hasattr(time, "monotonic")):
+		return time.monotonic
+	try:
+		import ctypes
+		import ctypes.util
+
+		class timespec(ctypes.Structure):
+			_fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+		libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+		clock_gettime = libc.clock_gettime
+		clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+	except (ImportError, OSError, AttributeError):
+		return time.time
+
+	def monotonic():
+		t = timespec()
+		clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t))
+		return t.tv_sec + t.tv_nsec * 1e-9
+	return monotonic
+
+monotonic = make_monotonic()
+
+# Latency of one pipeline stage
+# Latencies are kept in a histogram with HIST_STEPS buckets per doubling,
+# so percentiles are accurate to about 20% without storing every sample
+class Timer(object):
+	def __init__(self):
+		self.count = 0
+		self.total = 0.0
+		self.min = float("inf")
+		self.max = 0.0
+		self.hist = [0] * HIST_BUCKETS
+
+	def add(self, seconds):
+		self.count += 1
+		self.total += seconds
+		if(seconds < self.min):
+			self.min = seconds
+		if(seconds > self.max):
+			self.max = seconds
+		us = seconds * 1e6
+		if(us > 1):
+			bucket = min(int(math.log(us, 2) * HIST_STEPS), HIST_BUCKETS - 1)
+		else:
+			bucket = 0
+		self.hist[bucket] += 1
+
+	# Upper edge in seconds of the bucket holding the p'th percentile
+	def percentile(self, p):
+		if(self.count == 0):
+			return 0.0
+		target = self.count * p / 100.0
+		seen = 0
+		for bucket, n in enumerate(self.hist):
+			seen += n
+			if(seen >= target):
+				return min(2 ** (float(bucket + 1) / HIST_STEPS) * 1e-6, self.max)
+		return self.max
+
+	def snapshot(self):
+		if(self.count == 0):
+			return {"count": 0}
+		snap = {"count": self.count, "mean": self.total / self.count, "min": self.min, "max": self.max}
+		for p in PERCENTILES:
+			snap["p" + str(p)] = self.percentile(p)
+		return snap
+
+# Timers, counters and gauges for the measurement pipeline
+# Time a stage with:
+#	start = stats.now()
+#	...
+#	stats.record("decode", start)
+# Each timer and counter should only be updated from one thread.
+class Stats(object):
+	enabled = True
+
+	def __init__(self):
+		self.started = monotonic()
+		self.timers = {}
+		self.counters = {}
+		self.watches = {}	# name -> function returning a running total
+		self.gauges = {}	# name -> function returning a current value
+		self.last = {}		# Totals at the previous snapshot, for rates
+		self.last_time = self.started
+		self.now = monotonic
+
+	# Add the time since start to a stage's timer
+	def record(self, name, start):
+		elapsed = monotonic() - start
+		timer = self.timers.get(name)
+		if(timer is None):
+			timer = self.timers[name] = Timer()
+		timer.add(elapsed)
+
+	def count(self, name, n=1):
+		self.counters[name] = self.counters.get(name, 0) + n
+
+	# Report a running total kept elsewhere, e.g. samples captured, with its rate
+	def watch(self, name, total):
+		self.watches[name] = total
+
+	# Report a value computed when the snapshot is taken
+	def gauge(self, name, value):
+		self.gauges[name] = value
+
+	# Current totals, latencies, and the rate of each total since the last snapshot
+	def snapshot(self):
+		now = monotonic()
+		elapsed = now - self.last_time
+		totals = dict(self.counters.items())
+		for name, total in self.watches.items():
+			totals[name] = total()
+
+		rates = {}
+		for name in totals:
+			if(elapsed > 0):
+				rates[name] = (totals[name] - self.last.get(name, 0)) / elapsed
+		self.last = totals
+		self.last_time = now
+
+		return {
+			"uptime": now - self.started,
+			"interval": elapsed,
+			"counters": totals,
+			"rates": rates,
+			"gauges": dict((name, value()) for name, value in self.gauges.items()),
+			"timers": dict((name, timer.snapshot()) for name, timer in self.timers.items()),
+		}
+
+# Stands in for Stats when instrumentation is off
+# Every method does nothing, so instrumented code costs one empty call per stage
+class NullStats(object):
+	enabled = False
+
+	def now(self):
+		return 0
+
+	def record(self, name, start):
+		pass
+
+	def count(self, name, n=1):
+		pass
+
+	def watch(self, name, total):
+		pass
+
+	def gauge(self, name, value):
+		pass
+
+	def snapshot(self):
+		return {}
+
+NULL_STATS = NullStats()
+
+# Format a snapshot as text, with latencies in microseconds
+def format_snapshot(snap):
+	if(not snap):
+		return "Stats are disabled"
+	lines = ["Stats after " + format(snap["uptime"], '.1f') + "s, rates over the last " + format(snap["interval"], '.1f') + "s"]
+	for name in sorted(snap["timers"]):
+		t = snap["timers"][name]
+		if(t["count"] == 0):
+			continue
+		line = "  " + name.ljust(10) + " n=" + str(t["count"]) + " mean=" + format(t["mean"] * 1e6, '.1f') + "us"
+		for p in PERCENTILES:
+			line += " p" + str(p) + "=" + format(t["p" + str(p)] * 1e6, '.0f')
+		line += " max=" + format(t["max"] * 1e6, '.0f') + "us"
+		lines.append(line)
+	for name in sorted(snap["counters"]):
+		lines.append("  " + name.ljust(10) + " " + str(snap["counters"][name]) + " (" + format(snap["rates"].get(name, 0), '.1f') + "/s)")
+	for name in sorted(snap["gauges"]):
+		lines.append("  " + name.ljust(10) + " " + str(snap["gauges"][name]))
+	return "\n".join(lines)
+
+# Print a snapshot every period seconds from a background thread
+class StatsReporter(threading.Thread):
+	def __init__(self, stats, period=STATS_PERIOD, out=sys.stdout):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.stats = stats
+		self.period = period
+		self.out = out
+		self.lock = threading.Lock()
+
+	def run(self):
+		while True:
+			time.sleep(self.period)
+			self.dump()
+
+	def dump(self):
+		with self.lock:
+			self.out.write(format_snapshot(self.stats.snapshot()) + "\n")
+			self.out.flush()
+
+# Print a snapshot whenever the process receives signum, e.g. kill -USR1 <pid>
+def dump_on_signal(reporter, signum=signal.SIGUSR1):
+	signal.signal(signum, lambda signum, frame: reporter.dump())
+
+# Stats for a script run with --stats [PERIOD], or NULL_STATS if period is None
+# Snapshots are printed every period seconds and on SIGUSR1
+def start_stats(period):
+	if(period is None):
+		return NULL_STATS
+	stats = Stats()
+	reporter = StatsReporter(stats, period)
+	reporter.start()
+	dump_on_signal(reporter)
+	return stats
@@ -0,0 +1,156 @@
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+from .decoder import stream_frames, StreamDecoder
+from .averaging import ChannelEstimator, average_columns
+from .calibration import evaluate_position, solve_calibration, X_CAL, Y_CAL
+from .recording import open_recording
+
+# Sweep constants
+SWEEP_PARAMS = ("thresh", "outlier", "period", "window")	# Pipeline settings each run is given
+
+# Load a sweep manifest, a JSON file listing recordings made with
+# FYP_xy.py --record at known positions:
+# {"calibration": ["p1.rec", ..., "p7.rec"], "traces": [{"recording": "a.rec", "x": 2, "y": 3}, ...]}
+# The calibration recordings are made at X_CAL, Y_CAL in order, so each run
+# solves its own polynomial with its own settings. Paths are relative to
+# the manifest.
+# Returns the calibration paths and a list of (path, x, y)
+def load_manifest(path):
+	with open(path) as f:
+		data = json.load(f)
+	root = os.path.dirname(os.path.abspath(path))
+	calibration = [os.path.join(root, p) for p in data["calibration"]]
+	if(len(calibration) != len(X_CAL)):
+		raise ValueError(path + " needs one calibration recording per calibration point, " + str(len(X_CAL)) + " in all")
+	traces = [(os.path.join(root, t["recording"]), float(t["x"]), float(t["y"])) for t in data["traces"]]
+	if(not traces):
+		raise ValueError(path + " lists no traces")
+	return calibration, traces
+
+# Every combination of the values given for each of SWEEP_PARAMS
+def param_grid(thresh, outlier, period, window):
+	return [dict(zip(SWEEP_PARAMS, values)) for values in itertools.product(thresh, outlier, period, window)]
+
+# Replay a recording in windows of the given size, counting the samples handed out
+def counted_windows(values, window, consumed):
+	for start in range(0, len(values), window):
+		chunk = values[start:start+window]
+		consumed[0] += len(chunk)
+		yield chunk
+
+# Frames of a recording decoded with a fixed threshold, as FYP_xy.py --fixed does
+# Yields (frame or None, samples read so far)
+def trace_frames(path, params, leds):
+	header, records = open_recording(path)
+	consumed = [0]
+	decoder = StreamDecoder(leds + 1, params["thresh"])
+	for frame in stream_frames(counted_windows(records["value"], params["window"], consumed), params["thresh"], params["window"], decoder=decoder):
+		yield frame, consumed[0]
+
+# Intensities at each calibration point: the outlier-rejected average of
+# every frame of its recording, as the fast calibration takes them
+# Returns None if a point gave no frames
+def calibrate_traces(paths, params, leds):
+	I_cal = np.zeros([len(paths), leds], dtype=int)
+	for i, path in enumerate(paths):
+		frames = [frame[1:] for frame, consumed in trace_frames(path, params, leds) if frame is not None]
+		if(not frames):
+			return None
+		I_cal[i] = average_columns(np.array(frames), params["outlier"])
+	return I_cal
+
+# Run one recording through the decoder, averaging and polynomial as the
+# main loop of FYP_xy.py does
+# Returns the counts, the position errors of every fix, the processing
+# time and the recorded seconds to the first fix
+def run_trace(path, x, y, params, leds, cal_out_0, cal_out_1):
+	header, records = open_recording(path)
+	stamps = records["stamp"]
+	estimator = ChannelEstimator(leds, params["period"], params["outlier"])
+	x0 = np.zeros([leds], dtype=int)
+	counts = {"frames": 0, "fixes": 0, "unsteady": 0, "invalid": 0}
+	errors = []
+	first = None
+	start = time.time()
+	for frame, consumed in trace_frames(path, params, leds):
+		if(frame is None):
+			counts["invalid"] += 1
+			estimator.reset()
+			continue
+		counts["frames"] += 1
+		x0[:] = estimator.update(frame[1:])
+		if(not estimator.ready()):
+			continue
+		if(np.amin(x0) > 0):
+			fx, fy = evaluate_position(cal_out_0, cal_out_1, x0)
+			errors.append(np.hypot(fx - x, fy - y))
+			counts["fixes"] += 1
+			if(first is None):
+				first = stamps[consumed - 1] - stamps[0]
+		else:
+			counts["unsteady"] += 1
+	recorded = stamps[-1] - stamps[0] if len(stamps) > 1 else 0.0
+	return counts, errors, time.time() - start, first, recorded
+
+# Evaluate one set of parameters over every recording of a manifest
+# Runs in a worker process, so everything it needs is passed in
+# Returns a dict of the parameters and the results
+def evaluate(task):
+	params, calibration, traces, leds = task
+	result = dict(params)
+	result.update({"fixes": 0, "attempts": 0, "fix_rate": 0.0, "fix_time": float("nan"), "first_fix": float("nan"),
+		"median_error": float("nan"), "p95_error": float("nan"), "calibrated": False})
+
+	I_cal = calibrate_traces(calibration, params, leds)
+	if(I_cal is None):
+		return result
+	try:
+		cal_out_0, cal_out_1 = solve_calibration(I_cal, X_CAL, Y_CAL)
+	except np.linalg.LinAlgError:
+		return result
+	result["calibrated"] = True
+
+	errors = []
+	elapsed = 0.0
+	recorded = 0.0
+	firsts = []
+	for path, x, y in traces:
+		counts, trace_errors, trace_time, first, trace_recorded = run_trace(path, x, y, params, leds, cal_out_0, cal_out_1)
+		errors.extend(trace_errors)
+		elapsed += trace_time
+		recorded += trace_recorded
+		result["fixes"] += counts["fixes"]
+		result["attempts"] += counts["fixes"] + counts["unsteady"] + counts["invalid"]
+		if(first is not None):
+			firsts.append(first)
+	if(recorded > 0):
+		result["fix_rate"] = result["fixes"] / recorded
+	if(result["fixes"] > 0):
+		result["fix_time"] = elapsed / result["fixes"]
+		result["median_error"] = np.median(errors)
+		result["p95_error"] = np.percentile(errors, 95)
+	if(firsts):
+		result["first_fix"] = np.median(firsts)
+	return result
+
+# Evaluate every set of parameters on jobs worker processes (default: one per CPU)
+# Each worker maps the recordings itself, so only file names and results
+# pass between the processes. Yields results as they finish.
+def run_sweep(grid, calibration, traces, leds=3, jobs=None):
+	tasks = [(params, calibration, traces, leds) for params in grid]
+	if(jobs == 1):
+		for task in tasks:
+			yield evaluate(task)
+		return
+	pool = multiprocessing.Pool(jobs)
+	try:
+		for result in pool.imap_unordered(evaluate, tasks):
+			yield result
+		pool.close()
+	finally:
+		pool.terminate()
+		pool.join()
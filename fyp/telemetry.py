@@ -0,0 +1,233 @@
+import os
+import struct
+import threading
+import time
+import Queue
+import numpy as np
+from .publisher import STATUS_NAMES, STATUS_VALID
+from .stats import monotonic, NULL_STATS
+
+# Telemetry constants
+TLM_MAGIC = b"FYPTLM\0\0"
+TLM_VERSION = 2
+# magic, version, creation time, LEDs per record
+TLM_HEADER = struct.Struct("<8sIdI")
+TLM_FORMATS = ("csv", "bin")
+BATCH_SIZE = 256		# Records held in memory before they are handed to the writer
+BATCH_QUEUE = 8			# Batches waiting for the writer before new ones are dropped
+FLUSH_INTERVAL = 1.0		# Most seconds a record waits in a partial batch
+ROTATE_SIZE = 16 << 20		# Bytes in a telemetry file before it is rotated
+ROTATE_KEEP = 4			# Rotated files kept, as path.1 (newest) to path.ROTATE_KEEP
+CONSOLE_INTERVAL = 0.1		# Seconds between console lines, unless the status changes
+
+# One record per measurement, with an intensity per LED
+def tlm_record(leds=3):
+	return np.dtype([("stamp", "<f8"), ("x", "<f8"), ("y", "<f8"), ("x0", "<i4", (leds,)), ("status", "u1"), ("channel", "u1")])
+
+# First line of a CSV telemetry file
+def csv_header(leds=3):
+	return "stamp,x,y," + "".join("I" + str(i + 1) + "," for i in range(leds)) + "status,channel\n"
+
+# Format a batch of records as CSV lines
+def format_csv(records):
+	leds = records.dtype["x0"].shape[0]
+	line = "%.6f,%.6f,%.6f," + "%d," * leds + "%s,%d\n"
+	lines = []
+	for r in records:
+		lines.append(line % ((r["stamp"], r["x"], r["y"]) + tuple(r["x0"]) + (STATUS_NAMES[r["status"]], r["channel"])))
+	return "".join(lines)
+
+# Writes batches of records to a file from a background thread, starting a
+# new file once the current one reaches rotate bytes
+class TelemetryWriter(threading.Thread):
+	def __init__(self, path, fmt, leds=3, rotate=ROTATE_SIZE, keep=ROTATE_KEEP, stats=NULL_STATS):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.path = path
+		self.fmt = fmt
+		self.leds = leds
+		self.rotate = rotate
+		self.keep = keep
+		self.stats = stats
+		self.queue = Queue.Queue(BATCH_QUEUE)
+		self.spare = Queue.Queue()	# Written batches, for the logging thread to reuse
+		self.f = None
+		self.written = 0	# Records written
+		self.rotations = 0
+
+	# Open path, writing the header if the file is new
+	def open(self):
+		new = (not os.path.exists(self.path)) or (os.path.getsize(self.path) == 0)
+		self.f = open(self.path, "ab")
+		if(new):
+			if(self.fmt == "csv"):
+				self.f.write(csv_header(self.leds))
+			else:
+				self.f.write(TLM_HEADER.pack(TLM_MAGIC, TLM_VERSION, time.time(), self.leds))
+
+	# True if the file at path starts with the header this writer would write,
+	# so records can be appended to it
+	def compatible(self):
+		with open(self.path, "rb") as f:
+			if(self.fmt == "csv"):
+				return f.readline() == csv_header(self.leds)
+			raw = f.read(TLM_HEADER.size)
+		if(len(raw) < TLM_HEADER.size):
+			return False
+		magic, version, created, leds = TLM_HEADER.unpack(raw)
+		return (magic == TLM_MAGIC) and (version == TLM_VERSION) and (leds == self.leds)
+
+	# Move path to path.1, path.1 to path.2 and so on, dropping the oldest
+	def shift_files(self):
+		for i in range(self.keep - 1, 0, -1):
+			older = self.path + "." + str(i)
+			if(os.path.exists(older)):
+				os.rename(older, self.path + "." + str(i + 1))
+		os.rename(self.path, self.path + ".1")
+		self.rotations += 1
+
+	def rotate_files(self):
+		self.f.close()
+		self.shift_files()
+		self.open()
+
+	def run(self):
+		# A file from a run with another format or number of LEDs is rotated out of the way
+		if(os.path.exists(self.path) and (os.path.getsize(self.path) > 0) and not self.compatible()):
+			self.shift_files()
+		self.open()
+		while True:
+			batch, n = self.queue.get()
+			if(batch is None):	# close() or flush() is waiting
+				self.f.flush()
+				n.set()
+				continue
+			start = self.stats.now()
+			records = batch[:n]
+			if(self.fmt == "csv"):
+				self.f.write(format_csv(records))
+			else:
+				self.f.write(records.tobytes())
+			self.f.flush()		# A batch handed over early is on disk without waiting for the next
+			self.written += n
+			if(self.f.tell() >= self.rotate):
+				self.rotate_files()
+			self.stats.record("log_write", start)
+			self.spare.put(batch)
+
+# Buffered telemetry: log() fills a preallocated batch in memory and the
+# batches are written by a TelemetryWriter, so the measurement loop never
+# waits for the disk. If the writer falls BATCH_QUEUE batches behind, new
+# batches are dropped and counted rather than blocking the loop.
+# A batch is handed over when it is full, or with the first record logged
+# FLUSH_INTERVAL after it was started, so a slow frame rate does not hold
+# records back.
+# Call close() on exit to write the last partial batch.
+# fmt is "csv" for text or "bin" for tlm_record(leds) records after a TLM_HEADER
+class Telemetry(object):
+	def __init__(self, path, fmt="csv", leds=3, batch=BATCH_SIZE, rotate=ROTATE_SIZE, keep=ROTATE_KEEP, interval=FLUSH_INTERVAL, stats=NULL_STATS):
+		if(fmt not in TLM_FORMATS):
+			raise ValueError("Unknown telemetry format: " + str(fmt))
+		self.record = tlm_record(leds)
+		self.batch_size = batch
+		self.interval = interval
+		self.due = None		# When the current batch is handed over even if it is not full
+		self.batch = np.zeros([batch], dtype=self.record)
+		self.n = 0		# Records in the current batch
+		self.logged = 0		# Records logged
+		self.dropped = 0	# Records dropped because the writer fell behind
+		self.writer = TelemetryWriter(path, fmt, leds, rotate, keep, stats)
+		self.writer.start()
+
+	# Add one measurement
+	def log(self, x, y, x0, status=STATUS_VALID, channel=0, stamp=None):
+		if(stamp is None):
+			stamp = time.time()
+		self.batch[self.n] = (stamp, x, y, tuple(x0), status, channel)
+		now = monotonic()
+		if(self.n == 0):
+			self.due = now + self.interval
+		self.n += 1
+		self.logged += 1
+		if((self.n == self.batch_size) or (now >= self.due)):
+			self.hand_off()
+
+	# Give the current batch to the writer and start another
+	def hand_off(self):
+		try:
+			self.writer.queue.put_nowait((self.batch, self.n))
+		except Queue.Full:
+			self.dropped += self.n
+			self.n = 0
+			return
+		try:
+			self.batch = self.writer.spare.get_nowait()
+		except Queue.Empty:
+			self.batch = np.zeros([self.batch_size], dtype=self.record)
+		self.n = 0
+
+	# Write everything logged so far, waiting until it is done
+	def flush(self):
+		if(self.n > 0):
+			self.hand_off()
+		done = threading.Event()
+		self.writer.queue.put((None, done))
+		done.wait()
+
+	def close(self):
+		self.flush()
+		self.writer.f.close()
+
+# Map a binary telemetry file into memory without reading it
+# Returns the creation time and a read-only array of tlm_record() records
+def open_telemetry(path):
+	with open(path, "rb") as f:
+		raw = f.read(TLM_HEADER.size)
+	if(len(raw) < TLM_HEADER.size):
+		raise ValueError(path + " is too short to be a telemetry file")
+	magic, version, created, leds = TLM_HEADER.unpack(raw)
+	if(magic != TLM_MAGIC):
+		raise ValueError(path + " is not a telemetry file")
+	if(version != TLM_VERSION):
+		raise ValueError("Unsupported telemetry version " + str(version))
+	record = tlm_record(leds)
+	count = (os.path.getsize(path) - TLM_HEADER.size) // record.itemsize
+	if(count == 0):
+		return created, np.zeros([0], dtype=record)
+	return created, np.memmap(path, dtype=record, mode="r", offset=TLM_HEADER.size, shape=(count,))
+
+# Decides which lines reach the console: at most one per interval seconds,
+# but always the first line after the status changes, so a problem is
+# never hidden behind the rate limit
+# An interval of 0 lets every line through
+class ConsoleLimiter(object):
+	def __init__(self, interval=CONSOLE_INTERVAL):
+		self.interval = interval
+		self.last = None	# Time of the last line let through
+		self.status = None	# Status of the last line let through
+		self.suppressed = 0	# Lines held back
+
+	# True if a line with this status should be printed now
+	def due(self, status=None):
+		now = monotonic()
+		if((self.last is None) or (status != self.status) or (now - self.last >= self.interval)):
+			self.last = now
+			self.status = status
+			return True
+		self.suppressed += 1
+		return False
+
+# Add the telemetry options to a script's argument parser
+def add_telemetry_args(parser):
+	parser.add_argument("--log", metavar="FILE", help="log every measurement to FILE, rotating it every " + str(ROTATE_SIZE >> 20) + "MB")
+	parser.add_argument("--log-format", choices=TLM_FORMATS, default="csv", help="telemetry file format (default: %(default)s)")
+
+# Add the console rate limit option to a script's argument parser
+def add_console_args(parser):
+	parser.add_argument("--console-interval", type=float, default=CONSOLE_INTERVAL, metavar="SECONDS", help="print at most one measurement per SECONDS, and every status change; 0 prints all (default: %(default)s)")
+
+# Telemetry for a script run with --log, or None
+def start_telemetry(args, stats=NULL_STATS, leds=3):
+	if(args.log is None):
+		return None
+	return Telemetry(args.log, args.log_format, leds, stats=stats)
@@ -0,0 +1,126 @@
+# Tracking constants
+PROCESS_NOISE = 4.0	# Acceleration noise of the receiver, position units^2/s^3
+MEASUREMENT_NOISE = 0.04	# Starting variance of one frame's position, position units^2
+MIN_MEASUREMENT_NOISE = 1e-4	# Floor of the measured variance, position units^2
+NOISE_RATE = 0.02	# Weight of each innovation in the measured variance
+GATE = 13.8		# Innovation chi-square gate, 2 degrees of freedom (99.9%)
+MAX_MISSES = 5		# Gated measurements in a row before the track restarts
+START_VELOCITY_VAR = 1.0	# Velocity variance of a new track, (position units/s)^2
+
+# Constant-velocity Kalman filter for one axis
+# The state is position and velocity, and the covariance is kept as its
+# three distinct terms, so every step is a few scalar operations
+# The measurement variance r is only a starting point: the position noise
+# depends on the model, the calibration and the light, so it is measured
+# from the innovations as they come (see measure)
+class AxisFilter(object):
+	def __init__(self, q=PROCESS_NOISE, r=MEASUREMENT_NOISE):
+		self.q = q
+		self.r = r
+		self.start(0.0)
+
+	# Start a new track at position z, at rest
+	def start(self, z):
+		self.p = z
+		self.v = 0.0
+		self.p00 = self.r
+		self.p01 = 0.0
+		self.p11 = START_VELOCITY_VAR
+
+	# Move the state dt seconds forward, adding white acceleration noise
+	def predict(self, dt):
+		if(dt <= 0):
+			return
+		q = self.q
+		self.p += self.v * dt
+		self.p00 += dt * (2 * self.p01 + dt * self.p11) + q * dt * dt * dt / 3
+		self.p01 += dt * self.p11 + q * dt * dt / 2
+		self.p11 += q * dt
+
+	# Innovation and its variance for a measurement z
+	def innovation(self, z):
+		return z - self.p, self.p00 + self.r
+
+	# Update r from the innovation y of variance s, whether or not it is used
+	# The innovation variance is p00 + r, so y * y - p00 estimates r. One
+	# outlier can only raise it to a fraction of the gate, but noise that
+	# gates every measurement still raises r until the measurements pass.
+	def measure(self, y, s, gate):
+		sample = max(min(y * y, gate * s) - self.p00, MIN_MEASUREMENT_NOISE)
+		self.r += NOISE_RATE * (sample - self.r)
+
+	# Correct the state with the innovation y of variance s
+	def correct(self, y, s):
+		k0 = self.p00 / s
+		k1 = self.p01 / s
+		self.p += k0 * y
+		self.v += k1 * y
+		self.p11 -= k1 * self.p01
+		self.p01 -= k0 * self.p01
+		self.p00 -= k0 * self.p00
+
+# Smooth [x, y] positions with a constant-velocity Kalman filter per axis
+# Every measurement is first compared with the prediction. If the
+# normalised innovation of both axes together is beyond the gate, the
+# measurement is dropped as an outlier and the prediction is kept, unless
+# MAX_MISSES measurements in a row are dropped, when the receiver is
+# taken to have really moved and the track restarts there.
+# Times are in seconds from any fixed origin.
+class PositionTracker(object):
+	def __init__(self, q=PROCESS_NOISE, r=MEASUREMENT_NOISE, gate=GATE, max_misses=MAX_MISSES):
+		self.x = AxisFilter(q, r)
+		self.y = AxisFilter(q, r)
+		self.gate = gate
+		self.max_misses = max_misses
+		self.t = None		# Time of the state
+		self.misses = 0		# Measurements gated in a row
+		self.updates = 0	# Measurements used
+		self.gated = 0		# Measurements dropped as outliers
+		self.restarts = 0	# Tracks restarted after MAX_MISSES
+
+	# Add the position measured at time t
+	# Returns False if it was gated out as an outlier
+	def update(self, x, y, t):
+		if(self.t is None):
+			self.restart(x, y, t)
+			return True
+		self.x.predict(t - self.t)
+		self.y.predict(t - self.t)
+		self.t = max(t, self.t)
+
+		ex, sx = self.x.innovation(x)
+		ey, sy = self.y.innovation(y)
+		self.x.measure(ex, sx, self.gate)
+		self.y.measure(ey, sy, self.gate)
+		if(ex * ex / sx + ey * ey / sy > self.gate):
+			self.gated += 1
+			self.misses += 1
+			if(self.misses >= self.max_misses):
+				self.restarts += 1
+				self.restart(x, y, t)
+			return False
+
+		self.x.correct(ex, sx)
+		self.y.correct(ey, sy)
+		self.misses = 0
+		self.updates += 1
+		return True
+
+	def restart(self, x, y, t):
+		self.x.start(x)
+		self.y.start(y)
+		self.t = t
+		self.misses = 0
+		self.updates += 1
+
+	# Filtered position at the last update
+	def position(self):
+		return self.x.p, self.y.p
+
+	# Filtered velocity, in position units per second
+	def velocity(self):
+		return self.x.v, self.y.v
+
+	def reset(self):
+		self.t = None
+		self.misses = 0
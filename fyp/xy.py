@@ -0,0 +1,250 @@
+import argparse
+import numpy as np
+from .adc import open_adc
+from .acquisition import Acquirer
+from .display import start_display, intensity_text
+from .decoder import stream_frames, learn_layout, add_led_args, decoder_settings, StreamDecoder, MatchedDecoder
+from .averaging import ChannelEstimator
+from .calibration import evaluate_position, load_or_calibrate, poly_terms, CAL_FILE, X_CAL
+from .recording import Recorder, record_windows
+from .publisher import add_publisher_args, start_publisher, STATUS_VALID, STATUS_UNSTEADY, STATUS_INVALID
+from .stats import start_stats, monotonic, STATS_PERIOD
+from .tracking import PositionTracker
+from .fingerprint import load_or_survey, FP_FILE, INDEX_BACKENDS
+from .lambertian import load_or_fit, LB_FILE, HEIGHT, HALF_ANGLE
+from .samplebus import SampleBus, BUS_FILE
+from .telemetry import add_telemetry_args, add_console_args, start_telemetry, ConsoleLimiter
+from .realtime import RealTime, JitterMeter, jitter_windows
+
+# Constants
+ADC_BACKEND = "bitbang"	# "spi" to use the kernel SPI device
+COUNT_MAX = 200	# Longest capture window, and the window used with --fixed
+THRESH = 50	# Transition threshold with --fixed, otherwise the starting point
+OUTLIER_THRESH = 20
+AVERAGING_PERIOD = 10
+
+def parse_args(argv=None):
+	parser = argparse.ArgumentParser(description="Track the receiver position from the LED intensities")
+	parser.add_argument("--recalibrate", action="store_true", help="run the calibration even if a stored one is valid")
+	parser.add_argument("--fast-cal", action="store_true", help="calibrate each point as soon as the receiver is held still there, averaging many frames, instead of after a countdown")
+	parser.add_argument("--cal-file", default=CAL_FILE, help="where the calibration is stored (default: %(default)s)")
+	add_led_args(parser)
+	parser.add_argument("--model", choices=("poly", "fingerprint", "lambertian"), default="poly", help="turn intensities into positions with the 7-point polynomial, by lookup in a surveyed grid of fingerprints, or by least squares on a path-loss model of each LED fitted to the calibration points (default: %(default)s)")
+	parser.add_argument("--fp-file", default=FP_FILE, help="where the fingerprints are stored (default: %(default)s)")
+	parser.add_argument("--index", choices=INDEX_BACKENDS, help="fingerprint index (default: kdtree if scipy is installed, otherwise grid)")
+	parser.add_argument("--lb-file", default=LB_FILE, help="where the fitted path-loss model is stored (default: %(default)s)")
+	parser.add_argument("--height", type=float, default=HEIGHT, help="height of the LEDs above the receiver, in calibration units, for the path-loss model (default: %(default)s)")
+	parser.add_argument("--half-angle", type=float, default=HALF_ANGLE, metavar="DEGREES", help="half-power semi-angle of the LEDs for the path-loss model (default: %(default)s)")
+	parser.add_argument("--fixed", action="store_true", help="use the fixed THRESH and COUNT_MAX instead of adapting them to the signal")
+	parser.add_argument("--decoder", choices=("edge", "matched"), default="edge", help="find frames from their transitions, or by correlating with the frame layout learnt from them (default: %(default)s)")
+	parser.add_argument("--track", action="store_true", help="smooth the position of every frame with a tracking filter instead of averaging the intensities")
+	parser.add_argument("--realtime", type=int, nargs="?", const=-1, metavar="CPU", help="pin the sampler to its own CPU (default: the last), run it under SCHED_FIFO if permitted, and defer garbage collection; the sample jitter is shown with --stats")
+	parser.add_argument("--bus", nargs="?", const=BUS_FILE, metavar="PATH", help="also publish every sample window to a shared memory bus for other processes, e.g. FYP_tap.py (default: %(const)s)")
+	parser.add_argument("--record", metavar="FILE", help="append the raw samples and timestamps to a recording")
+	add_publisher_args(parser)
+	add_telemetry_args(parser)
+	add_console_args(parser)
+	parser.add_argument("--stats", type=float, nargs="?", const=STATS_PERIOD, metavar="PERIOD", help="time each stage and print stats every PERIOD seconds and on SIGUSR1 (default: %(const)s)")
+	args = parser.parse_args(argv)
+	if((args.model == "poly") and (poly_terms(args.leds) > len(X_CAL))):
+		parser.error("the polynomial for " + str(args.leds) + " LEDs needs more than " + str(len(X_CAL)) + " calibration points; use --model lambertian or fingerprint")
+	return args
+
+# What a recording needs to rebuild this run's decoder and position model
+def recording_settings(args, decoder):
+	files = {"poly": args.cal_file, "fingerprint": args.fp_file, "lambertian": args.lb_file}
+	return {"decoder": decoder_settings(decoder), "model": args.model, "model_file": files[args.model],
+		"index": args.index, "height": args.height, "half_angle": args.half_angle, "track": args.track}
+
+# Track the receiver position until interrupted
+def main(argv=None):
+	args = parse_args(argv)
+
+	# Keep every other thread, including the stats reporter, off the sampler's CPU
+	realtime = None
+	if(args.realtime is not None):
+		realtime = RealTime(None if args.realtime < 0 else args.realtime)
+		realtime.reserve()
+	stats = start_stats(args.stats)
+
+	# Variable initialisation
+	adcnum = 0
+	overruns = 0
+
+	# Array initialisation
+	values = np.zeros([COUNT_MAX], dtype=np.uint16)
+	stamps = np.zeros([COUNT_MAX])
+	x0 = np.zeros([args.leds], dtype=int)
+	slots = args.leds + 1 # Zero level slot followed by one slot per LED
+
+	# Sample the ADC continuously in the background
+	adc = open_adc(ADC_BACKEND)
+	timestamps = (args.record is not None) or (realtime is not None)
+	bus = None
+	if(args.bus is not None):
+		bus = SampleBus(args.bus, COUNT_MAX)
+	acquirer = Acquirer(adc, adcnum, COUNT_MAX, timestamps=timestamps, stats=stats, realtime=realtime, bus=bus)
+
+	# Initialise display
+	display = start_display(stats)
+	acquirer.start()
+
+	# Publish positions to other processes, without blocking the main loop
+	publisher = start_publisher(args)
+
+	# Log every measurement without waiting for the disk, and keep the console to a readable rate
+	telemetry = start_telemetry(args, stats, args.leds)
+	console = ConsoleLimiter(args.console_interval)
+	behind = ConsoleLimiter(args.console_interval)
+
+	# The matched filter needs the frame layout, which the edge decoder finds first
+	layout = None
+	if(args.decoder == "matched"):
+		while(layout is None):
+			layout = learn_layout(acquirer.windows(values), StreamDecoder(slots, THRESH, adaptive=not args.fixed), timeout=COUNT_MAX)
+			if(layout is None): # No frame for a whole window, as the main loop reports it
+				display.show("Invalid", "conditions")
+				if(console.due(STATUS_INVALID)): print "Invalid lighting conditions!"
+		print "Frame layout", layout[0], "period", layout[1], "samples"
+		try:
+			MatchedDecoder(*layout)
+		except ValueError as e:
+			print e, "- using the edge decoder"
+			layout = None
+
+	def new_decoder():
+		if(layout is not None):
+			return MatchedDecoder(*layout)
+		return StreamDecoder(slots, THRESH, adaptive=not args.fixed)
+
+	# Frames received at a calibration point
+	def point_frames(position):
+		acquirer.flush() # Only use light received at this calibration point
+		if(realtime is not None): realtime.collect() # The window being captured is dropped anyway
+		return stream_frames(acquirer.windows(values), THRESH, COUNT_MAX, decoder=new_decoder())
+
+	# Measure the intensities at a calibration point
+	def measure(position):
+		return next(point_frames(position))
+
+	# Use the stored calibration or fingerprints unless new ones were asked for
+	if(args.model == "fingerprint"):
+		fingerprints = load_or_survey(args.fp_file, THRESH, args.recalibrate, display, point_frames, backend=args.index, leds=args.leds)
+		locate = fingerprints.position
+	elif(args.model == "lambertian"):
+		model = load_or_fit(args.lb_file, args.leds, THRESH, args.recalibrate, display, measure,
+			frames=(point_frames if args.fast_cal else None), height=args.height, half_angle=args.half_angle)
+		locate = model.position
+	else:
+		I_cal, cal_out_0, cal_out_1 = load_or_calibrate(args.cal_file, THRESH, args.recalibrate, display, measure,
+			frames=(point_frames if args.fast_cal else None), leds=args.leds)
+		print cal_out_0
+		print cal_out_1
+		locate = lambda x0: evaluate_position(cal_out_0, cal_out_1, x0)
+
+	# Decode frames from the continuous sample stream, carrying partial frames between windows
+	windows = acquirer.windows(values, stamps)
+	if(realtime is not None):
+		print realtime.describe()
+		jitter = JitterMeter()
+		windows = jitter_windows(windows, jitter, stamps)
+		stats.gauge("jitter", jitter.describe)
+		stats.watch("collections", lambda: realtime.collections)
+	decoder = new_decoder()
+	recorder = None
+	if(args.record is not None): # Record exactly the windows the decoder sees, and how it was set up, for FYP_replay.py
+		recorder = Recorder(args.record, adcnum, COUNT_MAX, recording_settings(args, decoder))
+		windows = record_windows(windows, recorder, stamps)
+	frames = stream_frames(windows, THRESH, COUNT_MAX, stats, decoder)
+	estimator = ChannelEstimator(args.leds, AVERAGING_PERIOD, OUTLIER_THRESH)
+	tracker = PositionTracker()
+	fitted = 0 # Frames decoded when the window was last fitted
+	stats.watch("samples", lambda: acquirer.counters()["samples"]) # Effective sample rate
+	stats.gauge("thresh", lambda: decoder.thresh)
+	stats.gauge("window", lambda: acquirer.ring.window)
+	stats.watch("overruns", lambda: acquirer.counters()["overruns"])
+	stats.watch("lcd_bytes", lambda: display.writes)
+	stats.watch("lcd_gpio", lambda: display.bus.calls)
+	stats.watch("gated", lambda: tracker.gated)
+	stats.watch("console_skipped", lambda: console.suppressed + behind.suppressed)
+	if(telemetry is not None):
+		stats.watch("logged", lambda: telemetry.logged)
+		stats.watch("log_dropped", lambda: telemetry.dropped)
+
+	# Main loop
+	overruns = acquirer.counters()["overruns"] # Ignore windows dropped during calibration
+	try:
+		while True:
+			if(realtime is not None): realtime.collect_due(acquirer.ring.pending() == 0) # Between frames, while no window is waiting
+			frame = next(frames) # Wait for the next complete frame
+
+			# Print invalid if no frame was found for a whole window, and restart the averaging and tracking
+			if(frame is None):
+				display.show("Invalid", "conditions")
+				start = stats.now()
+				if(console.due(STATUS_INVALID)): print "Invalid lighting conditions!"
+				if(telemetry is not None): telemetry.log(float("nan"), float("nan"), x0, STATUS_INVALID)
+				stats.record("log", start)
+				estimator.reset()
+				tracker.reset()
+				if(realtime is not None): realtime.collect() # Nothing is being decoded
+				if(publisher is not None): publisher.publish(float("nan"), float("nan"), x0, STATUS_INVALID)
+				stats.count("invalid")
+				continue
+			stats.count("frames")
+
+			# Capture just over one frame per window once the frame period is known
+			if((not args.fixed) and (decoder.frames - fitted >= AVERAGING_PERIOD)):
+				fitted = decoder.frames
+				period = decoder.frame_period()
+				window = acquirer.ring.window
+				if((period is not None) and (acquirer.fit_window(period) != window)):
+					print "Frame period", period, "samples, capture window", acquirer.ring.window, "threshold", int(decoder.thresh)
+
+			# With --track every frame gives a position, which the tracking filter smooths
+			if(args.track):
+				x0[:] = frame[1:]
+
+			# Otherwise remove the outliers of the intensities over the last AVERAGING_PERIOD frames
+			else:
+				start = stats.now()
+				x0[:] = estimator.update(frame[1:])
+				stats.record("average", start)
+				if(not estimator.ready()):
+					continue
+
+			# Report windows dropped while the decoder was busy, at most once per console interval
+			dropped = acquirer.counters()["overruns"] - overruns
+			if((dropped > 0) and behind.due()):
+				print "Decoder fell behind, dropped", dropped, "windows"
+				overruns += dropped
+
+			# If there is a valid amount of data to work with, calculate the position of the device and print to display
+			if(np.amin(x0) > 0):
+				start = stats.now()
+				x, y = locate(x0)
+				if(args.track):
+					tracker.update(x, y, monotonic()) # An outlier is dropped, leaving the prediction
+					x, y = tracker.position()
+				stats.record("position", start)
+				stats.count("valid")
+				# Display some text on the LCD screen
+				display.show("[x, y]", "[" + format(x, '.3f') + ", " + format(y, '.3f') + "]") # Format the coordinates to 3 decimal places and output to the screen
+				start = stats.now()
+				if(console.due(STATUS_VALID)): print "[", x, ", ", y, "]", intensity_text(x0)
+				if(telemetry is not None): telemetry.log(x, y, x0)
+				stats.record("log", start)
+				if(publisher is not None): publisher.publish(x, y, x0)
+
+			# If the device detects fluctuating responses, display an error until it is corrected
+			else:
+				display.show("Unsteady!", "Pls stabilise!")
+				start = stats.now()
+				if(console.due(STATUS_UNSTEADY)): print "Unsteady! Please stabilise."
+				if(telemetry is not None): telemetry.log(float("nan"), float("nan"), x0, STATUS_UNSTEADY)
+				stats.record("log", start)
+				stats.count("unsteady")
+				if(publisher is not None): publisher.publish(float("nan"), float("nan"), x0, STATUS_UNSTEADY)
+	finally:
+		if(telemetry is not None): telemetry.close() # Write the records of the last partial batch
+		if(recorder is not None): recorder.close() # And the samples still buffered
@@ -0,0 +1,113 @@
+import json
+import numpy as np
+import pytest
+from fyp.decoder import StreamDecoder, THRESH
+from fyp.averaging import average_average, RollingEstimator
+from fyp.acquisition import WindowRing
+from fyp.calibration import save_calibration, load_calibration, poly_terms, X_CAL, Y_CAL
+from fyp.siggen import generate, frame_length
+
+# Test constants
+FRAMES = 200			# Frames of synthetic signal fed to the decoders
+CHUNK_SIZES = (1, 7, 64, 200, 1000)	# Includes chunks shorter and longer than a frame
+
+# Every frame decoded from samples fed in chunks of size
+def decode(decoder, samples, size):
+	frames = []
+	for i in range(0, len(samples), size):
+		frames.extend(decoder.feed(samples[i:i+size]))
+	return np.array(frames)
+
+# The stream decoder carries partial frames across chunks, so how the
+# samples are split must not change what it decodes
+@pytest.mark.parametrize("adaptive", (False, True))
+def test_stream_decoder_chunk_size(adaptive):
+	np.random.seed(0)
+	samples = generate(FRAMES * frame_length(), noise=5.0)
+	whole = decode(StreamDecoder(4, THRESH, adaptive), samples, len(samples))
+	assert len(whole) > FRAMES * 0.9
+	for size in CHUNK_SIZES:
+		assert np.array_equal(decode(StreamDecoder(4, THRESH, adaptive), samples, size), whole)
+
+# The rolling estimate is average_average() of the last size readings,
+# including readings far enough apart to be outliers
+def test_rolling_estimator():
+	np.random.seed(0)
+	readings = np.random.randint(0, 120, size=500)
+	readings[::13] = 0
+	estimator = RollingEstimator(10, 20)
+	for i, value in enumerate(readings):
+		assert estimator.update(value) == average_average(readings[max(i - 9, 0):i+1], 20)
+	assert estimator.ready()
+
+# Windows a consumer that falls behind never reads are counted, and the
+# next window it reads is marked as following a gap
+def test_window_ring_overrun():
+	ring = WindowRing(8, size=4)
+	out = np.zeros([8], dtype=np.uint16)
+	for i in range(3):
+		ring.values[ring.write_slot()] = i
+		ring.publish()
+	assert ring.get(out) == 8
+	assert out[0] == 0 and not ring.gap
+	for i in range(3, 8):
+		ring.values[ring.write_slot()] = i
+		ring.publish()
+	assert ring.overruns == 4
+	assert ring.pending() == 3
+	ring.get(out)
+	assert out[0] == 5 and ring.gap
+	ring.get(out)
+	assert out[0] == 6 and not ring.gap
+
+# A flush drops the windows waiting and the one being written, which is a gap
+def test_window_ring_flush():
+	ring = WindowRing(8, size=4)
+	out = np.zeros([8], dtype=np.uint16)
+	ring.publish()
+	ring.get(out)
+	ring.publish()
+	ring.flush()
+	ring.publish()	# Was being written during the flush
+	assert ring.pending() == 0
+	ring.values[ring.write_slot()] = 9
+	ring.publish(5)
+	assert ring.get(out) == 5
+	assert out[0] == 9 and ring.gap
+	assert ring.overruns == 0
+
+# Save a calibration of leds LEDs with the polynomial it needs
+def save(path, leds):
+	I_cal = np.arange(len(X_CAL) * leds).reshape(len(X_CAL), leds) + 100
+	save_calibration(str(path), I_cal, np.ones(poly_terms(leds)), np.ones(poly_terms(leds)), X_CAL, Y_CAL, THRESH)
+
+# Rewrite one field of a saved calibration
+def rewrite(path, key, value):
+	with open(str(path)) as f:
+		data = json.load(f)
+	data[key] = value
+	with open(str(path), "w") as f:
+		json.dump(data, f)
+
+def test_load_calibration(tmpdir):
+	path = tmpdir.join("calibration.json")
+	save(path, 3)
+	calibration = load_calibration(str(path), THRESH, X_CAL, Y_CAL, leds=3)
+	assert calibration["I_cal"].shape == (len(X_CAL), 3)
+	assert load_calibration(str(path), THRESH + 1) is None
+	assert load_calibration(str(path), THRESH, leds=2) is None
+	assert load_calibration(str(tmpdir.join("missing.json")), THRESH) is None
+
+@pytest.mark.parametrize("key, value", (
+	("I_cal", [[1, 2, 3]] * (len(X_CAL) - 1)),	# A calibration point short
+	("I_cal", list(range(len(X_CAL)))),		# Not one row per point
+	("I_cal", [[1, 2], [3]] * len(X_CAL)),	# Ragged
+	("cal_out_0", [1.0] * (poly_terms(3) - 1)),	# Polynomial of the wrong size
+	("cal_out_1", [1.0] * poly_terms(4)),
+	("version", -1),
+))
+def test_load_calibration_rejects(tmpdir, key, value):
+	path = tmpdir.join("calibration.json")
+	save(path, 3)
+	rewrite(path, key, value)
+	assert load_calibration(str(path), THRESH, leds=3) is None